@@ -0,0 +1,143 @@
+# bench/corpus.py
+"""
+Real-looking announcements and the JSON the model would return for them.
+
+Dates are given as days from today so every run sees upcoming events.
+"""
+from datetime import date, timedelta
+
+TZ_OFFSET = "-07:00"
+
+CORPUS = [
+    {
+        "text": (
+            "🌈 QUEER DANCE PARTY 🌈\n"
+            "Friday night at The Duke! DJ Sapphic Static spinning disco & house till late.\n"
+            "When: 9pm - 2am\nWhere: The Duke Saloon, 502 Discovery St\n"
+            "19+, consent culture enforced, sliding scale $10-25 at the door. yyj #queervictoria"
+        ),
+        "days": 3, "start": "21:00", "end": "02:00",
+        "title": "Queer Dance Party",
+        "location": "The Duke Saloon, 502 Discovery St, Victoria, British Columbia, Canada",
+        "capacity": None,
+        "description": "A late-night queer disco and house dance party with DJ Sapphic Static.",
+        "notes": "19+. Consent culture enforced. Sliding scale $10-25 at the door.",
+    },
+    {
+        "text": (
+            "Intro to Rope Workshop\n"
+            "Learn the basics of rope bondage: single column tie, safety, communication.\n"
+            "Sunday 1:00 PM – 4:00 PM at Studio Kink, 1234 Government St.\n"
+            "Max 16 participants, bring a partner or rotate. Tickets $40 via link in bio @studiokink"
+        ),
+        "days": 5, "start": "13:00", "end": "16:00",
+        "title": "Intro to Rope Workshop",
+        "location": "Studio Kink, 1234 Government St, Victoria, British Columbia, Canada",
+        "capacity": 16,
+        "description": "A beginner rope bondage workshop covering single column ties, safety and communication.",
+        "notes": "Bring a partner or rotate. Tickets $40. Kink/fetish positive.",
+    },
+    {
+        "text": (
+            "Monthly Munch ☕\n"
+            "Casual meet & greet for kinky folks, vanilla clothes, public space.\n"
+            "Tuesday 6:30-8:30pm, Habit Coffee upstairs (Pandora Ave)\n"
+            "New faces always welcome!"
+        ),
+        "days": 8, "start": "18:30", "end": "20:30",
+        "title": "Monthly Munch",
+        "location": "Habit Coffee, Pandora Ave, Victoria, British Columbia, Canada",
+        "capacity": None,
+        "description": "A casual social meet and greet for kinky folks in a public café.",
+        "notes": "Vanilla clothes, public space. Newcomers welcome.",
+    },
+    {
+        "text": (
+            "LEATHER & LACE BALL\n"
+            "Our biggest night of the year returns. Dress code strictly enforced: leather, latex, lace or fetish formal.\n"
+            "Doors 8pm, performances at 9, dancing until 1am.\n"
+            "Victoria Event Centre, 1415 Broad St. Only 150 tickets!"
+        ),
+        "days": 12, "start": "20:00", "end": "01:00",
+        "title": "Leather & Lace Ball",
+        "location": "Victoria Event Centre, 1415 Broad St, Victoria, British Columbia, Canada",
+        "capacity": 150,
+        "description": "An annual fetish formal ball with stage performances and dancing.",
+        "notes": "Dress code: leather, latex, lace or fetish formal. Performances at 9pm.",
+    },
+    {
+        "text": (
+            "Sensory Play Social - blindfolds, feathers, ice, textures.\n"
+            "Hosted by Tactile Collective. Saturday 7 to 10 pm.\n"
+            "Location sent to RSVPs. 25 spots."
+        ),
+        "days": 15, "start": "19:00", "end": "22:00",
+        "title": "Sensory Play Social",
+        "location": "Tactile Collective, Victoria, British Columbia, Canada",
+        "capacity": 25,
+        "description": "A hands-on sensory play social exploring blindfolds, feathers, ice and textures.",
+        "notes": "Location sent to RSVPs.",
+    },
+    {
+        "text": (
+            "Trans Joy Picnic 🏳️‍⚧️ bring a blanket and snacks to share!\n"
+            "Beacon Hill Park near the petting zoo, noon.\nAll ages, sober space."
+        ),
+        "days": 20, "start": "12:00", "end": None,
+        "title": "Trans Joy Picnic",
+        "location": "Beacon Hill Park, Victoria, British Columbia, Canada",
+        "capacity": None,
+        "description": "A community potluck picnic celebrating trans joy.",
+        "notes": "All ages, sober space. Bring a blanket and snacks to share.",
+    },
+    {
+        "text": (
+            "Shibari Jam — open practice for intermediate riggers. "
+            "Thursday 7pm-10pm. Hard points available. The Loft, 7 Fan Tan Alley. "
+            "$15 drop in, no spectators please."
+        ),
+        "days": 24, "start": "19:00", "end": "22:00",
+        "title": "Shibari Jam",
+        "location": "The Loft, 7 Fan Tan Alley, Victoria, British Columbia, Canada",
+        "capacity": None,
+        "description": "An open rope practice session for intermediate riggers with hard points.",
+        "notes": "$15 drop in. No spectators.",
+    },
+    {
+        "text": (
+            "Drag Brunch Extravaganza!! Bottomless mimosas, 4 queens, 2 seatings.\n"
+            "11am–1pm and 1:30–3:30pm at Castle Pub, 26 Bastion Sq. Tickets sell out fast!"
+        ),
+        "days": 27, "start": "11:00", "end": "13:00",
+        "title": "Drag Brunch Extravaganza",
+        "location": "Castle Pub, 26 Bastion Sq, Victoria, British Columbia, Canada",
+        "capacity": None,
+        "description": "A drag brunch with four queens performing and bottomless mimosas.",
+        "notes": "Two seatings: 11am-1pm and 1:30-3:30pm. Tickets sell out fast.",
+    },
+]
+
+def _iso(day: date, hhmm: str | None) -> str | None:
+    if hhmm is None:
+        return None
+    return f"{day.isoformat()}T{hhmm}:00{TZ_OFFSET}"
+
+def answer(entry: dict, today: date | None = None) -> dict:
+    """The model's JSON answer for a corpus entry."""
+    day = (today or date.today()) + timedelta(days=entry["days"])
+    return {
+        "title": entry["title"],
+        "start_iso": _iso(day, entry["start"]),
+        "end_iso": _iso(day, entry["end"]),
+        "location": entry["location"],
+        "capacity": entry["capacity"],
+        "description": entry["description"],
+        "notes": entry["notes"],
+    }
+
+def find(prompt: str) -> dict:
+    """Corpus entry whose announcement appears in the prompt (falls back to the first)."""
+    for entry in CORPUS:
+        if entry["text"][:60] in prompt:
+            return entry
+    return CORPUS[0]
@@ -0,0 +1,240 @@
+# bench/fake_db.py
+"""
+In-process substitute for the Postgres data layer.
+
+install() swaps the query functions of services.db, db_list_events_sorted,
+db_search_events, db_subscribers and db_partitions for in-memory versions
+everywhere they were imported, each taking `latency` seconds to mimic a round
+trip. Change
+notifications still reach the caches through db._events_changed.
+"""
+import re, sys, asyncio, itertools
+from datetime import datetime, timezone
+from dateutil import parser as dp
+
+from services import db, db_list_events_sorted, db_search_events, db_subscribers, db_partitions
+
+def _ts(iso: str | None) -> datetime | None:
+    return dp.isoparse(iso).astimezone(timezone.utc) if iso else None
+
+def _trigrams(text: str) -> set[str]:
+    # Same shape as pg_trgm: lowercased words padded with two spaces in front, one behind
+    grams = set()
+    for word in re.findall(r"\w+", text.lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+def _similarity(a: str, b: str) -> float:
+    ta, tb = _trigrams(a), _trigrams(b)
+    return len(ta & tb) / len(ta | tb) if ta and tb else 0.0
+
+class InMemoryDB:
+    def __init__(self, latency: float = 0.001):
+        self.latency = latency
+        self.events: dict[int, dict] = {}
+        self.cache: dict[str, dict] = {}
+        self.subscribers: dict[int, str] = {}          # chat_id -> tz
+        self.runs: dict[tuple, dict] = {}              # (date, tz) -> digest run
+        self.deliveries: dict[tuple[int, int], str] = {}  # (run_id, chat_id) -> status
+        self._ids = itertools.count(1)
+        self._run_ids = itertools.count(1)
+
+    async def _rtt(self) -> None:
+        await asyncio.sleep(self.latency)
+
+    def _upsert(self, n: dict) -> int:
+        start = _ts(n["start_ts_utc"])
+        now = datetime.now(timezone.utc)
+        row = {
+            "title": n["title"], "start_ts": start, "end_ts": _ts(n["end_ts_utc"]),
+            "location": n.get("location"), "capacity": n.get("capacity"),
+            "description": n.get("description"), "notes": n.get("notes"), "raw": n.get("raw"),
+            "updated_at": now,
+        }
+        if n.get("source_text") is not None:
+            row["source_text"] = n["source_text"]
+        for existing in self.events.values():
+            if existing["title"].lower() == n["title"].lower() and existing["start_ts"] == start:
+                existing.update(row)
+                return existing["id"]
+        event_id = next(self._ids)
+        self.events[event_id] = {"id": event_id, "created_at": now, "source_text": None, **row}
+        return event_id
+
+    async def upsert_event(self, n: dict) -> int:
+        await self._rtt()
+        event_id = self._upsert(n)
+        db._events_changed({event_id})
+        return event_id
+
+    async def upsert_events(self, events: list[dict]) -> list[dict]:
+        await self._rtt()
+        ids = {self._upsert(n) for n in events}
+        db._events_changed(ids)
+        return [{k: self.events[i][k] for k in ("id", "title", "start_ts", "end_ts")} for i in ids]
+
+    async def update_event(self, event_id: int, n: dict) -> int | None:
+        await self._rtt()
+        existing = self.events.get(event_id)
+        if existing is None:
+            return None
+        existing.update(title=n["title"], start_ts=_ts(n["start_ts_utc"]), end_ts=_ts(n["end_ts_utc"]),
+                        location=n.get("location"), capacity=n.get("capacity"), description=n.get("description"),
+                        notes=n.get("notes"), raw=n.get("raw"), updated_at=datetime.now(timezone.utc))
+        if n.get("source_text") is not None:
+            existing["source_text"] = n["source_text"]
+        db._events_changed({event_id})
+        return event_id
+
+    async def find_similar_event(self, text: str, threshold: float) -> dict | None:
+        await self._rtt()
+        scored = [(_similarity(e["source_text"], text), e["id"], e) for e in self.events.values() if e["source_text"]]
+        scored = [x for x in scored if x[0] >= threshold]
+        if not scored:
+            return None
+        score, _, e = max(scored, key=lambda x: x[:2])
+        return {**e, "score": score}
+
+    async def search_events(self, terms: str, *, limit: int = 5, offset: int = 0) -> dict:
+        # Crude stand-in for the tsvector/trigram query: every word present, or a venue close enough
+        await self._rtt()
+        words = re.findall(r"\w+", terms.lower())
+        scored = []
+        for e in self.events.values():
+            haystack = " ".join(filter(None, (e["title"], e["location"], e["description"], e["notes"]))).lower()
+            hits = sum(w in haystack for w in words)
+            venue = _similarity(terms, e["location"] or "")
+            if (words and hits == len(words)) or venue >= 0.6:
+                scored.append((hits + venue, e["start_ts"], e["id"], e))
+        scored.sort(key=lambda x: x[:3], reverse=True)
+        rows = [dict(e) for *_, e in scored[offset:offset + limit + 1]]
+        return {"rows": rows[:limit], "more": len(rows) > limit}
+
+    async def feed_events(self, start, end, terms: str | None = None, limit: int = 2000) -> list[dict]:
+        await self._rtt()
+        rows = sorted((e for e in self.events.values() if start <= e["start_ts"] < end),
+                      key=lambda e: (e["start_ts"], e["id"]))
+        return [dict(e) for e in rows[:limit]]
+
+    async def list_next_events(self, limit: int = 5) -> list[dict]:
+        await self._rtt()
+        now = datetime.now(timezone.utc)
+        upcoming = sorted((e for e in self.events.values() if e["start_ts"] >= now), key=lambda e: e["start_ts"])
+        return [dict(e) for e in upcoming[:limit]]
+
+    async def get_event(self, event_id: int) -> dict | None:
+        await self._rtt()
+        e = self.events.get(event_id)
+        return dict(e) if e else None
+
+    async def delete_all_events(self) -> int:
+        await self._rtt()
+        self.events.clear()
+        db._events_changed(None)
+        return 0
+
+    async def get_cached_extraction(self, key: str, ttl_seconds: float) -> dict | None:
+        await self._rtt()
+        return self.cache.get(key)
+
+    async def put_cached_extraction(self, key: str, model: str, prompt_version: str, result: dict) -> None:
+        await self._rtt()
+        self.cache[key] = {"result": result, "age": 0.0}
+
+    async def prune_extraction_cache(self, ttl_seconds: float) -> int:
+        return 0
+
+    async def purge_extraction_cache(self) -> int:
+        n = len(self.cache)
+        self.cache.clear()
+        return n
+
+    async def add_subscriber(self, chat_id: int, tz: str) -> bool:
+        await self._rtt()
+        new = chat_id not in self.subscribers
+        self.subscribers[chat_id] = tz
+        return new
+
+    async def remove_subscriber(self, chat_id: int) -> bool:
+        await self._rtt()
+        return self.subscribers.pop(chat_id, None) is not None
+
+    async def subscriber_timezones(self) -> list[str]:
+        await self._rtt()
+        return sorted(set(self.subscribers.values()))
+
+    async def get_digest_run(self, digest_date, tz: str) -> dict | None:
+        await self._rtt()
+        run = self.runs.get((digest_date, tz))
+        return dict(run) if run else None
+
+    async def create_digest_run(self, digest_date, tz: str, body: str | None) -> dict:
+        await self._rtt()
+        run = self.runs.setdefault((digest_date, tz), {"id": next(self._run_ids), "digest_date": digest_date,
+                                                      "tz": tz, "body": body, "finished_at": None})
+        return dict(run)
+
+    async def undelivered_subscribers(self, run_id: int, tz: str, after: int | None, limit: int) -> list[int]:
+        await self._rtt()
+        ids = sorted(c for c, t in self.subscribers.items()
+                     if t == tz and (after is None or c > after) and (run_id, c) not in self.deliveries)
+        return ids[:limit]
+
+    async def record_delivery(self, run_id: int, chat_id: int, status: str) -> None:
+        await self._rtt()
+        self.deliveries.setdefault((run_id, chat_id), status)
+
+    async def finish_digest_run(self, run_id: int) -> None:
+        await self._rtt()
+        for run in self.runs.values():
+            if run["id"] == run_id:
+                run["finished_at"] = datetime.now(timezone.utc)
+
+    async def maintain_partitions(self) -> dict:
+        return {"archived": [], "detached": []}  # one flat table here
+
+    async def list_events_sorted(self, select=None, *, sort_by="start_ts", asc=True, limit=5, after=None, before=None) -> dict:
+        await self._rtt()
+        keyed = sorted(((e[sort_by], e["id"]), e) for e in self.events.values())
+        if not asc:
+            keyed.reverse()
+        if after or before:
+            cursor = db_list_events_sorted.decode_cursor(after or before)
+            ahead = lambda k: k > cursor if asc else k < cursor
+            keyed = [(k, e) for k, e in keyed if ahead(k) == bool(after) and k != cursor]
+        rows = [e for _, e in keyed]
+        page = rows[-limit:] if before else rows[:limit]
+        more = len(rows) > limit
+        token = lambda r: db_list_events_sorted.encode_cursor(r[sort_by], r["id"])
+        return {"rows": [dict(r) for r in page],
+                "next": token(page[-1]) if page and (more or before) else None,
+                "prev": token(page[0]) if page and (after or (before and more)) else None}
+
+    async def first_event_per_sort(self) -> list[dict]:
+        await self._rtt()
+        if not self.events:
+            return []
+        rows = list(self.events.values())
+        pick = [
+            ("start_ts", min(rows, key=lambda e: (e["start_ts"], e["id"]))),
+            ("created_at", max(rows, key=lambda e: (e["created_at"], e["id"]))),
+            ("updated_at", max(rows, key=lambda e: (e["updated_at"], e["id"]))),
+        ]
+        return [{"sort_by": s, "id": e["id"], "title": e["title"], "start_ts": e["start_ts"]} for s, e in pick]
+
+def install(fake: InMemoryDB) -> None:
+    """Point every loaded module's references to the real query functions at `fake`."""
+    originals = {}
+    for module in (db, db_list_events_sorted, db_search_events, db_subscribers, db_partitions):
+        for name in dir(fake):
+            if not name.startswith("_") and callable(getattr(module, name, None)):
+                originals[getattr(module, name)] = getattr(fake, name)
+    for module in list(sys.modules.values()):
+        for attr, value in list(vars(module).items()) if hasattr(module, "__dict__") else []:
+            try:
+                replacement = originals.get(value)
+            except TypeError:
+                continue  # unhashable
+            if replacement is not None:
+                setattr(module, attr, replacement)
@@ -0,0 +1,118 @@
+# bench/fake_ollama.py
+"""
+Stand-in for Ollama's HTTP API with a configurable speed.
+
+Answers /api/chat (streaming and not) with the canned JSON for the corpus
+announcement found in the prompt. Each generation waits `latency` seconds
+(prompt evaluation) and then emits tokens at `tps` tokens per second, with at
+most `parallel` generations at once, like OLLAMA_NUM_PARALLEL. Setting `fail`
+makes /api/chat answer 500, for failover tests.
+
+    python bench/fake_ollama.py --port 11435 --latency 0.5 --tps 40
+"""
+import json, time, asyncio, argparse
+from aiohttp import web
+
+import corpus
+
+CHARS_PER_TOKEN = 4
+
+class FakeOllama:
+    def __init__(self, latency: float = 0.5, tps: float = 40.0, parallel: int = 1):
+        self.latency = latency
+        self.tps = tps
+        self.parallel = parallel
+        self.requests = 0
+        self.fail = False
+        self._slots = asyncio.Semaphore(parallel)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/api/chat", self.chat)
+        app.router.add_post("/api/generate", self.generate)
+        app.router.add_get("/api/version", self.version)
+        app.router.add_get("/api/tags", self.tags)
+        return app
+
+    async def version(self, request: web.Request) -> web.Response:
+        return web.json_response({"version": "0.0.0-fake"})
+
+    async def tags(self, request: web.Request) -> web.Response:
+        return web.json_response({"models": [{"name": "fake"}]})
+
+    async def generate(self, request: web.Request) -> web.Response:
+        # Model preload/keep-alive requests carry no prompt
+        body = await request.json()
+        return web.json_response({"model": body.get("model"), "response": "", "done": True,
+                                  "load_duration": 0, "total_duration": 0})
+
+    def _stats(self, content: str, eval_seconds: float) -> dict:
+        tokens = max(1, len(content) // CHARS_PER_TOKEN)
+        return {
+            "total_duration": int((self.latency + eval_seconds) * 1e9),
+            "load_duration": 0,
+            "prompt_eval_count": 600,
+            "prompt_eval_duration": int(self.latency * 1e9),
+            "eval_count": tokens,
+            "eval_duration": int(eval_seconds * 1e9),
+        }
+
+    async def chat(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+        content = json.dumps(corpus.answer(corpus.find(prompt)), ensure_ascii=False)
+        model = body.get("model", "fake")
+        self.requests += 1
+        if self.fail:
+            return web.json_response({"error": "fake failure"}, status=500)
+
+        async with self._slots:
+            await asyncio.sleep(self.latency)
+            if not body.get("stream", True):
+                eval_seconds = len(content) / CHARS_PER_TOKEN / self.tps
+                await asyncio.sleep(eval_seconds)
+                return web.json_response({
+                    "model": model, "done": True,
+                    "message": {"role": "assistant", "content": content},
+                    **self._stats(content, eval_seconds),
+                })
+
+            resp = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+            await resp.prepare(request)
+            started = time.monotonic()
+            try:
+                for i in range(0, len(content), CHARS_PER_TOKEN):
+                    await asyncio.sleep(1 / self.tps)
+                    chunk = {"model": model, "done": False,
+                             "message": {"role": "assistant", "content": content[i:i + CHARS_PER_TOKEN]}}
+                    await resp.write((json.dumps(chunk) + "\n").encode())
+                final = {"model": model, "done": True, "message": {"role": "assistant", "content": ""},
+                         **self._stats(content, time.monotonic() - started)}
+                await resp.write((json.dumps(final) + "\n").encode())
+                await resp.write_eof()
+            except (ConnectionResetError, asyncio.CancelledError):
+                pass  # client stopped reading once the JSON object closed
+            return resp
+
+async def start(fake: FakeOllama, host: str = "127.0.0.1", port: int = 0) -> tuple[web.AppRunner, str]:
+    """Serve `fake` in the running loop; returns the runner and its base URL."""
+    runner = web.AppRunner(fake.app())
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{port}"
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=11435)
+    ap.add_argument("--latency", type=float, default=0.5, help="seconds of prompt evaluation per request")
+    ap.add_argument("--tps", type=float, default=40.0, help="generated tokens per second")
+    ap.add_argument("--parallel", type=int, default=1, help="generations served at once")
+    args = ap.parse_args()
+    fake = FakeOllama(args.latency, args.tps, args.parallel)
+    web.run_app(fake.app(), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
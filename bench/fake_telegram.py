@@ -0,0 +1,112 @@
+# bench/fake_telegram.py
+"""
+Fake Bot API for running the real handlers offline, plus synthetic updates.
+
+FakeBotAPI plugs into ApplicationBuilder().request(...): every Bot API call
+is answered locally (after an optional simulated round trip) and recorded, and
+callers can wait for the reply that completes a request in a given chat.
+With flood_limit set, a chat sent more than that many messages/edits within
+one second gets a 429 with retry_after, like Telegram's flood control.
+"""
+import json, time, asyncio, itertools
+from typing import Callable
+from telegram import Update, Bot
+from telegram.request import BaseRequest, RequestData
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot",
+            "can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": False}
+
+class FakeBotAPI(BaseRequest):
+    def __init__(self, latency: float = 0.0, flood_limit: int | None = None):
+        self.latency = latency
+        self.flood_limit = flood_limit
+        self.flood_errors = 0
+        self._recent: dict[int, list[float]] = {}  # chat -> send times within the last second
+        self.calls: list[tuple[str, dict]] = []
+        self._message_ids = itertools.count(100_000)
+        self._waiters: dict[int, list[tuple[Callable[[str], bool], asyncio.Future]]] = {}
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def wait_for(self, chat_id: int, predicate: Callable[[str], bool]) -> asyncio.Future:
+        """Future resolved with the first text sent or edited into chat_id that matches predicate."""
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(chat_id, []).append((predicate, fut))
+        return fut
+
+    def _deliver(self, chat_id: int, text: str) -> None:
+        waiting = self._waiters.get(chat_id, [])
+        for entry in list(waiting):
+            predicate, fut = entry
+            if not fut.done() and predicate(text):
+                fut.set_result(text)
+                waiting.remove(entry)
+
+    def _flooded(self, chat_id: int) -> bool:
+        now = time.monotonic()
+        recent = [t for t in self._recent.get(chat_id, []) if now - t < 1.0]
+        if len(recent) >= self.flood_limit:
+            self._recent[chat_id] = recent
+            return True
+        self._recent[chat_id] = recent + [now]
+        return False
+
+    def _message(self, chat_id: int, text: str, message_id: int | None = None) -> dict:
+        return {
+            "message_id": message_id or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": text,
+        }
+
+    async def do_request(self, url: str, method: str, request_data: RequestData | None = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None, pool_timeout=None) -> tuple[int, bytes]:
+        endpoint = url.rsplit("/", 1)[-1]
+        params = dict(request_data.parameters) if request_data else {}
+        self.calls.append((endpoint, params))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if (self.flood_limit and endpoint in ("sendMessage", "editMessageText")
+                and self._flooded(int(params["chat_id"]))):
+            self.flood_errors += 1
+            return 429, json.dumps({"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                                    "parameters": {"retry_after": 1}}).encode()
+
+        if endpoint == "getMe":
+            result = BOT_USER
+        elif endpoint == "sendMessage":
+            chat_id = int(params["chat_id"])
+            result = self._message(chat_id, params["text"])
+            self._deliver(chat_id, params["text"])
+        elif endpoint == "editMessageText":
+            chat_id = int(params["chat_id"])
+            result = self._message(chat_id, params["text"], int(params["message_id"]))
+            self._deliver(chat_id, params["text"])
+        elif endpoint == "getUpdates":
+            await asyncio.sleep(1)
+            result = []
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+_update_ids = itertools.count(1)
+_incoming_ids = itertools.count(1)
+
+def text_update(bot: Bot, chat_id: int, user_id: int, text: str) -> Update:
+    """A private-chat text message; a leading /command gets its bot_command entity."""
+    message = {
+        "message_id": next(_incoming_ids),
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return Update.de_json({"update_id": next(_update_ids), "message": message}, bot)
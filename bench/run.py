@@ -0,0 +1,210 @@
+# bench/run.py
+"""
+Offline end-to-end benchmark for the bot's hot paths.
+
+Builds the real Application (handlers, update processor, job queue) with a
+fake Bot API, points the extractor at an in-process fake Ollama, and uses an
+in-memory stand-in for Postgres unless --pg is given (then PG_DSN is used).
+Synthetic updates go through the update queue exactly like polled ones.
+
+Workloads (each at every --concurrency level, one chat per client):
+  ingest      /add, then an announcement; latency = paste -> "Saved" reply
+  list        /list, warm (the rendered-list cache may answer)
+  list_cold   /list with the rendered-list cache dropped before each call
+  quick       /edit_event quick picker
+  search      /search workshop
+
+    python bench/run.py
+    python bench/run.py --workloads ingest --concurrency 1 4 --llm-latency 0.5 --tps 40
+    python bench/run.py --workloads ingest --endpoints 2      # two fake GPU boxes
+    python bench/run.py --telegram-limits --flood-limit 3     # rate limiter vs. flood control
+    python bench/run.py --save-baseline      # store results in bench/baseline.json
+"""
+import os, sys, json, time, asyncio, argparse, statistics
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent / "bot"))
+
+ADMIN_ID = 42
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "1:bench")
+os.environ["TELEGRAM_ADMIN_IDS"] = str(ADMIN_ID)
+os.environ.setdefault("STREAM_PROGRESS", "1")
+
+import corpus
+from fake_ollama import FakeOllama, start as start_ollama
+from fake_telegram import FakeBotAPI, text_update
+
+import main as bot_main
+import handlers_parse
+from services import db, extract, extract_cache, list_cache, llm_router
+
+BASELINE = HERE / "baseline.json"
+WORKLOADS = ("ingest", "list", "list_cold", "quick", "search")
+
+def _done(text: str) -> bool:
+    return text.startswith(("Saved", "Parse failed", "DB save failed", "This looks like an event I already have"))
+
+async def _ingest(app, api, chat_id: int, n: int) -> list[float]:
+    bot = app.bot
+    latencies = []
+    for i in range(n):
+        entry = corpus.CORPUS[(chat_id + i) % len(corpus.CORPUS)]
+        # Each /add takes one announcement
+        ready = api.wait_for(chat_id, lambda text: text.startswith("Okay!"))
+        await app.update_queue.put(text_update(bot, chat_id, ADMIN_ID, "/add"))
+        await ready
+        reply = api.wait_for(chat_id, _done)
+        t = time.perf_counter()
+        await app.update_queue.put(text_update(bot, chat_id, ADMIN_ID, entry["text"]))
+        await reply
+        latencies.append(time.perf_counter() - t)
+    return latencies
+
+async def _command(app, api, chat_id: int, n: int, command: str, before=None) -> list[float]:
+    latencies = []
+    for _ in range(n):
+        if before:
+            before()
+        reply = api.wait_for(chat_id, lambda text: True)
+        t = time.perf_counter()
+        await app.update_queue.put(text_update(app.bot, chat_id, ADMIN_ID, command))
+        await reply
+        latencies.append(time.perf_counter() - t)
+    return latencies
+
+def _client(workload: str):
+    if workload == "ingest":
+        return _ingest
+    if workload == "list":
+        return lambda app, api, chat, n: _command(app, api, chat, n, "/list")
+    if workload == "list_cold":
+        return lambda app, api, chat, n: _command(app, api, chat, n, "/list",
+                                                  before=list_cache._entries.clear)
+    if workload == "quick":
+        return lambda app, api, chat, n: _command(app, api, chat, n, "/edit_event")
+    if workload == "search":
+        return lambda app, api, chat, n: _command(app, api, chat, n, "/search workshop")
+    raise ValueError(workload)
+
+def _pct(sorted_values: list[float], p: float) -> float:
+    k = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+def _summarize(latencies: list[float], wall: float) -> dict:
+    values = sorted(latencies)
+    return {
+        "n": len(values),
+        "p50_ms": round(_pct(values, 50) * 1000, 2),
+        "p95_ms": round(_pct(values, 95) * 1000, 2),
+        "p99_ms": round(_pct(values, 99) * 1000, 2),
+        "mean_ms": round(statistics.fmean(values) * 1000, 2),
+        "rps": round(len(values) / wall, 2),
+    }
+
+async def _run(args) -> dict:
+    ollama_runners, urls = [], []
+    for _ in range(args.endpoints):
+        runner, url = await start_ollama(FakeOllama(args.llm_latency, args.tps, args.llm_parallel))
+        ollama_runners.append(runner)
+        urls.append(url)
+    extract.OLLAMA = args.ollama or urls[0]
+    if args.endpoints > 1 and not args.ollama:
+        llm_router.OLLAMA_ENDPOINTS = ",".join(urls)
+
+    handlers_parse.BUFFER_DURATION = args.buffer
+    if not args.dedup:
+        handlers_parse.DUP_SIMILARITY = 0  # the corpus is pasted over and over; measure extraction
+    if not args.cache:
+        extract_cache.EXTRACT_CACHE_SIZE = 0
+
+    # Telegram's per-chat limits would dominate the latencies being measured
+    bot_main.SEND_RATE_LIMIT = args.telegram_limits
+    bot_main.PERSISTENCE = args.pg  # the in-memory DB has no bot_state table
+    api = FakeBotAPI(latency=args.api_latency, flood_limit=args.flood_limit)
+    app = bot_main.build_application(request=api)
+    if args.pg:
+        await db.open_pool()
+    else:
+        import fake_db
+        memdb = fake_db.InMemoryDB(latency=args.db_latency)
+        if not args.cache:
+            async def no_cache(key, ttl):
+                return None
+            memdb.get_cached_extraction = no_cache
+        fake_db.install(memdb)
+    await extract.open_client()
+    await app.initialize()
+    await app.start()
+
+    results = {}
+    try:
+        # Seed one of each corpus event so list/quick have rows to render
+        await _ingest(app, api, chat_id=999_999, n=len(corpus.CORPUS))
+        for workload in args.workloads:
+            for c in args.concurrency:
+                client = _client(workload)
+                t = time.perf_counter()
+                per_client = await asyncio.gather(*(client(app, api, 10_000 + i, args.requests) for i in range(c)))
+                wall = time.perf_counter() - t
+                latencies = [x for lat in per_client for x in lat]
+                results[f"{workload}@{c}"] = _summarize(latencies, wall)
+                print(f"{workload:>10} c={c:<3} " + "  ".join(f"{k}={v}" for k, v in results[f'{workload}@{c}'].items()),
+                      flush=True)
+        if args.flood_limit:
+            print(f"429s from the fake Bot API: {api.flood_errors}")
+    finally:
+        await app.stop()
+        await app.shutdown()
+        await extract.close_client()
+        if args.pg:
+            await db.close_pool()
+        for runner in ollama_runners:
+            await runner.cleanup()
+    return results
+
+def _compare(results: dict, baseline: dict) -> None:
+    print("\nvs baseline (negative latency / positive rps is better):")
+    for key, cur in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        deltas = []
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "rps"):
+            if base[metric]:
+                deltas.append(f"{metric} {100 * (cur[metric] - base[metric]) / base[metric]:+.1f}%")
+        print(f"  {key:>14}: " + ", ".join(deltas))
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--workloads", nargs="+", default=list(WORKLOADS), choices=WORKLOADS)
+    ap.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16])
+    ap.add_argument("--requests", type=int, default=5, help="requests per client")
+    ap.add_argument("--llm-latency", type=float, default=0.2, help="fake Ollama prompt-eval seconds")
+    ap.add_argument("--tps", type=float, default=400.0, help="fake Ollama tokens per second")
+    ap.add_argument("--llm-parallel", type=int, default=1, help="fake Ollama concurrent generations")
+    ap.add_argument("--endpoints", type=int, default=1, help="fake Ollama servers behind the LLM router")
+    ap.add_argument("--ollama", help="use this Ollama URL instead of the in-process fake")
+    ap.add_argument("--api-latency", type=float, default=0.0, help="simulated Bot API round trip, seconds")
+    ap.add_argument("--telegram-limits", action="store_true", help="keep the outbound rate limiter on")
+    ap.add_argument("--flood-limit", type=int, help="fake Bot API answers 429 past this many sends per chat per second")
+    ap.add_argument("--db-latency", type=float, default=0.001, help="in-memory DB round trip, seconds")
+    ap.add_argument("--buffer", type=float, default=0.0, help="BUFFER_DURATION for /add, seconds")
+    ap.add_argument("--cache", action="store_true", help="leave the extraction cache on")
+    ap.add_argument("--dedup", action="store_true", help="leave near-duplicate detection on (repeat pastes skip the LLM)")
+    ap.add_argument("--pg", action="store_true", help="use Postgres at PG_DSN instead of the in-memory DB")
+    ap.add_argument("--save-baseline", action="store_true", help=f"write results to {BASELINE.name}")
+    ap.add_argument("--out", help="also write results as JSON to this path")
+    args = ap.parse_args()
+
+    results = asyncio.run(_run(args))
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2))
+    if args.save_baseline:
+        BASELINE.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"\nbaseline saved to {BASELINE}")
+    elif BASELINE.exists():
+        _compare(results, json.loads(BASELINE.read_text()))
+
+if __name__ == "__main__":
+    main()
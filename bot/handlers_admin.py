@@ -3,6 +3,7 @@ import os
 from telegram import Update
 from telegram.ext import ContextTypes
 from services.db import delete_all_events
+from services import extract_cache
 
 ADMIN_ID = os.getenv("TELEGRAM_ADMIN_ID")  # set this in .env to your user id
 
@@ -12,5 +13,11 @@ async def delete_all(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     #     await update.message.reply_text("Sorry, you’re not allowed to run this command.")
     #     return
 
-    delete_all_events()
+    await delete_all_events()
     await update.message.reply_text("All events deleted and IDs reset.")
+
+async def purge_cache(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    st = extract_cache.stats
+    summary = f"memory hits {st['memory_hits']}, db hits {st['db_hits']}, misses {st['misses']}"
+    rows = await extract_cache.purge()
+    await update.message.reply_text(f"Extraction cache purged ({rows} stored results removed).\nSince start: {summary}")
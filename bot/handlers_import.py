@@ -0,0 +1,58 @@
+# bot/handlers_import.py
+import os, time
+from telegram import Update, Message
+from telegram.error import TelegramError
+from telegram.ext import ContextTypes, ConversationHandler
+
+import outbound
+from services.importer import parse_file, run_import, ImportResult, DEFAULT_DELIMITER
+
+AWAIT_IMPORT_FILE = 2
+
+TZ = os.getenv("TZ", "America/Vancouver")
+PROGRESS_EDIT_INTERVAL = 3  # seconds between edits of the status message
+
+async def start_import(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    # /import [delimiter] — the delimiter only matters for plain-text files
+    context.user_data["import_delimiter"] = context.args[0] if context.args else DEFAULT_DELIMITER
+    await update.message.reply_text(
+        "Send the file to import: a Telegram chat export (result.json), or a text file with "
+        f"one announcement per block and a line containing only {context.user_data['import_delimiter']} "
+        "between blocks. Send /cancel to abort."
+    )
+    return AWAIT_IMPORT_FILE
+
+async def _run(status: Message, items) -> None:
+    last_edit = 0.0
+
+    async def progress(result: ImportResult) -> None:
+        nonlocal last_edit
+        if time.monotonic() - last_edit < PROGRESS_EDIT_INTERVAL:
+            return
+        last_edit = time.monotonic()
+        outbound.edit_text(status, f"Importing… {result.processed}/{result.total} processed, "
+                                   f"{result.saved} saved, {len(result.failed)} failed")
+
+    result = await run_import(items, tz_name=TZ, on_progress=progress)
+    try:
+        await outbound.edit_text(status, result.summary())
+    except TelegramError:  # the status message was deleted during the import, or the edit failed
+        await outbound.send_text(status.get_bot(), status.chat_id, result.summary())
+
+async def receive_import_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    doc = update.message.document
+    data = bytes(await (await doc.get_file()).download_as_bytearray())
+    delimiter = context.user_data.pop("import_delimiter", DEFAULT_DELIMITER)
+    try:
+        items = list(parse_file(data, doc.file_name or "", delimiter))
+    except ValueError as e:  # includes json.JSONDecodeError
+        await update.message.reply_text("Could not read that file:\n" + str(e))
+        return AWAIT_IMPORT_FILE
+    if not items:
+        await update.message.reply_text("No announcements found in that file—check the format or /cancel.")
+        return AWAIT_IMPORT_FILE
+
+    status = await update.message.reply_text(f"Importing {len(items)} announcements…")
+    # Runs in the background so the conversation (and other updates) are not held up
+    context.application.create_task(_run(status, items), update=update)
+    return ConversationHandler.END
@@ -1,10 +1,13 @@
 from telegram import Update
 from telegram.ext import ContextTypes
 from services.db import list_next_events
+from services import list_cache
+import outbound
 from zoneinfo import ZoneInfo
 from datetime import datetime, timedelta
 
 LOCAL_TZ = ZoneInfo("America/Vancouver")
+LIST_LIMIT = 10
 
 def _fmt_same_day_range(s: datetime, e: datetime) -> str:
     date_str = s.strftime("%a %b %-d")
@@ -22,39 +25,44 @@ def _roll_end_if_needed(s_local: datetime, e_local: datetime | None) -> datetime
         return e_local + timedelta(days=1)
     return e_local
 
-async def list_next(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    rows = list_next_events(limit=10)
-    if not rows:
-        await update.message.reply_text("No upcoming events found.")
-        return
-
-    blocks = []
-    for r in rows:
-        title = r["title"]
-        loc   = r["location"] or "—"
-        desc  = (r.get("description") or "").strip()
-
-        # Convert to local tz
-        s_local = r["start_ts"].astimezone(LOCAL_TZ)
-        e_local = r["end_ts"].astimezone(LOCAL_TZ) if r["end_ts"] else None
-        e_local = _roll_end_if_needed(s_local, e_local)
-
-        # Build the when line
-        if e_local is None:
-            when = f"{s_local.strftime('%a %b %-d')} • {s_local.strftime('%-I:%M %p')}"
+def format_event_block(r: dict, tz: ZoneInfo = LOCAL_TZ) -> str:
+    title = r["title"]
+    loc   = r["location"] or "—"
+    desc  = (r.get("description") or "").strip()
+
+    # Convert to local tz
+    s_local = r["start_ts"].astimezone(tz)
+    e_local = r["end_ts"].astimezone(tz) if r["end_ts"] else None
+    e_local = _roll_end_if_needed(s_local, e_local)
+
+    # Build the when line
+    if e_local is None:
+        when = f"{s_local.strftime('%a %b %-d')} • {s_local.strftime('%-I:%M %p')}"
+    else:
+        if s_local.date() == e_local.date():
+            when = _fmt_same_day_range(s_local, e_local)
         else:
-            if s_local.date() == e_local.date():
-                when = _fmt_same_day_range(s_local, e_local)
-            else:
-                when = _fmt_cross_day_range(s_local, e_local)
+            when = _fmt_cross_day_range(s_local, e_local)
+
+    # Keep description short in the list view
+    # if len(desc) > 140:
+    #     desc = desc[:137] + "…"
 
-        # Keep description short in the list view
-        # if len(desc) > 140:
-        #     desc = desc[:137] + "…"
+    block = f"{title}\n{when}\n{loc}"
+    if desc:
+        block += f"\n{desc}"
+    return block
 
-        block = f"{title}\n{when}\n{loc}"
-        if desc:
-            block += f"\n{desc}"
-        blocks.append(block)
+def render_event_list(rows: list[dict], tz: ZoneInfo = LOCAL_TZ) -> str:
+    return "\n\n".join(format_event_block(r, tz) for r in rows)
 
-    await update.message.reply_text("\n\n".join(blocks))
+async def list_next(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    text = list_cache.get(LIST_LIMIT, LOCAL_TZ.key)
+    if text is None:
+        generation = list_cache.generation()
+        rows = await list_next_events(limit=LIST_LIMIT)
+        text = render_event_list(rows) if rows else "No upcoming events found."
+        # Valid until the first listed event starts (or the next write)
+        list_cache.put(LIST_LIMIT, LOCAL_TZ.key, text, rows[0]["start_ts"] if rows else None, generation)
+    # Ten long descriptions can pass Telegram's 4096-character limit
+    await outbound.reply_text(update.message, text)
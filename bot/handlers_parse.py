@@ -1,13 +1,18 @@
 # bot/handlers_parse.py
-import os
+import os, time, uuid, asyncio, logging
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-from telegram import Update
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import TelegramError
 from telegram.ext import ContextTypes, ConversationHandler
 
-from services.extract import extract_event
-from services.db import upsert_event
-import asyncio
+from services.extract import extract_event, occurrence_events
+from services.db import upsert_event, upsert_events, update_event, find_similar_event
+from services import metrics
+from handlers_list import format_event_block
+import outbound
+
+log = logging.getLogger(__name__)
 
 AWAIT_ANNOUNCEMENT = 1
 
@@ -15,6 +20,15 @@ REF_DATE = os.getenv("REF_DATE", "2025-08-11")
 TZ = os.getenv("TZ", "America/Vancouver")
 LOCAL_TZ = ZoneInfo(TZ)
 
+# Show fields in a placeholder message while the model is still generating
+STREAM_PROGRESS = os.getenv("STREAM_PROGRESS", "1") == "1"
+PROGRESS_EDIT_INTERVAL = 1.0  # seconds between edits; Telegram throttles faster edits of one message
+
+# A paste at least this similar (pg_trgm, 0..1) to the announcement a stored event
+# came from is offered as an update of that event before any LLM call. 0 disables.
+DUP_SIMILARITY = float(os.getenv("DUP_SIMILARITY", "0.9"))
+MAX_PENDING_DUPLICATES = 20  # unanswered "update it?" prompts remembered per chat
+
 def _fmt_same_day_range(s: datetime, e: datetime) -> str:
     date_str = s.strftime("%a %b %-d")
     return f"{date_str} • {s.strftime('%-I:%M %p')}–{e.strftime('%-I:%M %p')}"
@@ -31,7 +45,17 @@ def _roll_end_if_needed(s_local: datetime, e_local: datetime | None) -> datetime
         return e_local + timedelta(days=1)
     return e_local
 
+def _fmt_when(start: datetime, end: datetime | None) -> str:
+    s_local = start.astimezone(LOCAL_TZ)
+    e_local = _roll_end_if_needed(s_local, end.astimezone(LOCAL_TZ) if end else None)
+    if e_local is None:
+        return s_local.strftime("%a %b %-d") + " • " + s_local.strftime("%-I:%M %p")
+    return (_fmt_same_day_range(s_local, e_local)
+            if s_local.date() == e_local.date()
+            else _fmt_cross_day_range(s_local, e_local))
+
 async def start_add(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    context.chat_data.get("add_finished", set()).discard(update.effective_user.id)
     await update.message.reply_text(
         "Okay! Send the announcement text (paste it in full). Send /cancel to abort."
     )
@@ -87,79 +111,247 @@ async def start_add(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 #     await update.message.reply_text("\n".join(parts))
 #     return ConversationHandler.END
 
-BUFFER_DURATION = 3  # seconds to wait for additional message parts
+def _progress_text(fields: dict) -> str:
+    lines = ["Reading the announcement…"]
+    if fields.get("title"):
+        lines.append(fields["title"])
+    if fields.get("start_iso"):
+        try:
+            s_local = datetime.fromisoformat(fields["start_iso"]).astimezone(LOCAL_TZ)
+            lines.append(s_local.strftime("%a %b %-d") + " • " + s_local.strftime("%-I:%M %p"))
+        except ValueError:
+            pass  # the final validation step reports bad dates
+    if fields.get("location"):
+        lines.append(fields["location"])
+    return "\n".join(lines)
+
+BUFFER_DURATION = 3  # seconds of quiet after the last part before the announcement is processed
+
+def _buffer_job_name(chat_id: int, user_id: int) -> str:
+    return f"announcement:{chat_id}:{user_id}"
+
+def _cancel_buffer_timer(context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int) -> None:
+    for job in context.job_queue.get_jobs_by_name(_buffer_job_name(chat_id, user_id)):
+        job.schedule_removal()
 
 async def receive_announcement(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """
+    Buffer one part of a (possibly multi-message) announcement and return at once.
+
+    Each user in each chat has a single timer; every new part restarts it, so
+    exactly one extraction runs, BUFFER_DURATION after the last part arrives.
+    """
     user_id = update.effective_user.id
-    if "announcement_buffer" not in context.chat_data:
-        context.chat_data["announcement_buffer"] = {}
-    
-    buffer = context.chat_data["announcement_buffer"].setdefault(user_id, [])
+    chat_id = update.effective_chat.id
     message = (update.message.text or "").strip()
 
+    finished = context.chat_data.get("add_finished", set())
+    if user_id in finished:
+        # The announcement was already taken (see _flush_announcement); the job
+        # can't end the conversation itself, so the next update does
+        finished.discard(user_id)
+        await update.message.reply_text("That /add is done—send /add to add another announcement.")
+        return ConversationHandler.END
+
     if not message:
         await update.message.reply_text("I didn’t receive any text—try again or /cancel.")
         return AWAIT_ANNOUNCEMENT
 
-    buffer.append(message)
-
-    # Store the latest time we saw a message
-    context.chat_data["announcement_last_seen"] = datetime.now()
-
-    # Wait a moment to see if more messages come in
-    await asyncio.sleep(BUFFER_DURATION)
+    buffers = context.chat_data.setdefault("announcement_buffer", {})
+    buffers.setdefault(user_id, []).append(message)
+
+    _cancel_buffer_timer(context, chat_id, user_id)
+    context.job_queue.run_once(
+        _flush_announcement,
+        BUFFER_DURATION,
+        chat_id=chat_id,
+        user_id=user_id,
+        name=_buffer_job_name(chat_id, user_id),
+        data=update.message.message_id,
+    )
+    return AWAIT_ANNOUNCEMENT
 
-    # If nothing new was seen during the wait, proceed
-    if datetime.now() - context.chat_data["announcement_last_seen"] < timedelta(seconds=BUFFER_DURATION - 1):
-        return AWAIT_ANNOUNCEMENT  # more messages still arriving
+async def flush_pending_announcements(application) -> None:
+    """Process every buffered announcement now instead of waiting for its timer (used on shutdown)."""
+    jobs = application.job_queue.jobs(pattern="^announcement:")
+    for job in jobs:
+        job.schedule_removal()
+    await asyncio.gather(*(job.run(application) for job in jobs))
+
+async def reschedule_pending_announcements(application) -> None:
+    """
+    After a restart, restart the timer of every announcement buffer that was
+    persisted mid-paste (its job died with the old process).
+    """
+    if application.persistence is None:
+        return
+    for chat_id in await application.persistence.chats_with("announcement_buffer"):
+        chat_data = application.chat_data[chat_id]
+        await application.persistence.refresh_chat_data(chat_id, chat_data)
+        for user_id in chat_data.get("announcement_buffer", {}):
+            application.job_queue.run_once(
+                _flush_announcement,
+                BUFFER_DURATION,
+                chat_id=chat_id,
+                user_id=user_id,
+                name=_buffer_job_name(chat_id, user_id),
+            )
+
+async def _flush_announcement(context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Runs as a JobQueue job, outside update handling
+    job = context.job
+    parts = context.chat_data.get("announcement_buffer", {}).pop(job.user_id, None)
+    if not parts:
+        return  # cancelled meanwhile
+    # A job is its own unit of work: new trace, and its own handler latency
+    metrics.new_trace()
+    started = time.perf_counter()
+    text = "\n".join(parts)
+    try:
+        with metrics.span("job.flush_announcement", parts=len(parts)):
+            done = (await _offer_duplicate(context, job.chat_id, text, reply_to=job.data)
+                    or await _process_announcement(context, job.chat_id, text, reply_to=job.data))
+        if done:
+            # After a failure the /add keeps waiting, so the admin can paste again
+            context.chat_data.setdefault("add_finished", set()).add(job.user_id)
+    finally:
+        metrics.HANDLER.labels("flush_announcement").observe(time.perf_counter() - started)
+
+async def _offer_duplicate(context: ContextTypes.DEFAULT_TYPE, chat_id: int, text: str, reply_to: int | None) -> bool:
+    """If `text` looks like a repost of a stored event, ask what to do with it and return True."""
+    if not DUP_SIMILARITY:
+        return False
+    try:
+        match = await find_similar_event(text, DUP_SIMILARITY)
+    except Exception:
+        log.warning("duplicate check failed; extracting anyway", exc_info=True)
+        return False
+    if match is None:
+        return False
+
+    pending = context.chat_data.setdefault("pending_duplicates", {})
+    while len(pending) >= MAX_PENDING_DUPLICATES:
+        pending.pop(next(iter(pending)))
+    token = uuid.uuid4().hex[:8]
+    pending[token] = {"text": text, "event_id": match["id"], "reply_to": reply_to}
+
+    keyboard = InlineKeyboardMarkup([[
+        InlineKeyboardButton("Update it", callback_data=f"dup:update:{token}"),
+        InlineKeyboardButton("Save as new", callback_data=f"dup:new:{token}"),
+        InlineKeyboardButton("Keep as is", callback_data=f"dup:keep:{token}"),
+    ]])
+    await outbound.send_text(
+        context.bot, chat_id,
+        f"This looks like an event I already have ({match['score']:.0%} similar, id {match['id']}):\n\n"
+        + format_event_block(match, LOCAL_TZ) + "\n\nUpdate it?",
+        reply_markup=keyboard,
+        reply_to_message_id=reply_to,
+    )
+    return True
+
+async def resolve_duplicate(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Button press on an "update it?" prompt: dup:<update|new|keep>:<token>."""
+    query = update.callback_query
+    _, action, token = query.data.split(":")
+    pending = context.chat_data.get("pending_duplicates", {}).pop(token, None)
+    await query.answer()
+    if pending is None:
+        await query.edit_message_text("This prompt has expired; paste the announcement again.")
+        return
+    if action == "keep":
+        await query.edit_message_text(f"Kept event id {pending['event_id']} as it is.")
+        return
+
+    await query.edit_message_reply_markup(None)
+    # Extraction takes seconds; don't hold up the chat's other updates
+    context.application.create_task(
+        _process_announcement(
+            context, update.effective_chat.id, pending["text"], pending["reply_to"],
+            replace_id=pending["event_id"] if action == "update" else None,
+        ),
+        update=update,
+    )
 
-    # Combine the buffered parts
-    full_announcement = "\n".join(buffer)
-    context.chat_data["announcement_buffer"].pop(user_id, None)
+async def _process_announcement(context: ContextTypes.DEFAULT_TYPE, chat_id: int, full_announcement: str,
+                                reply_to: int | None, replace_id: int | None = None) -> bool:
+    """Extract, save and reply; True once the announcement is saved."""
+    on_fields = None
+    placeholder = None
+    if STREAM_PROGRESS:
+        placeholder = await context.bot.send_message(chat_id, "Reading the announcement…", reply_to_message_id=reply_to)
+        last_edit, last_text = 0.0, placeholder.text
+
+        async def on_fields(fields: dict) -> None:
+            nonlocal last_edit, last_text
+            text = _progress_text(fields)
+            if text == last_text or time.monotonic() - last_edit < PROGRESS_EDIT_INTERVAL:
+                return
+            last_edit, last_text = time.monotonic(), text
+            # Not awaited: reading the stream shouldn't wait on the rate limiter
+            outbound.edit_text(placeholder, text)
+
+    async def reply(text: str) -> None:
+        if placeholder is not None:
+            try:
+                await outbound.edit_text(placeholder, text)  # replaces any progress edit still queued
+                return
+            except TelegramError:
+                pass  # the placeholder was deleted, or the edit failed; reply with a new message
+        await outbound.send_text(context.bot, chat_id, text, reply_to_message_id=reply_to)
 
-    # --- proceed with extract/save as before ---
     try:
         event_norm = await extract_event(
             announcement=full_announcement,
             ref_date=datetime.now(ZoneInfo(TZ)).date().isoformat(),
             tz_name=TZ,
+            on_fields=on_fields,
         )
     except Exception as e:
-        await update.message.reply_text("Parse failed:\n" + str(e))
-        return AWAIT_ANNOUNCEMENT
+        await reply("Parse failed:\n" + str(e))
+        return False
 
+    event_norm["source_text"] = full_announcement
+    events = occurrence_events(event_norm)
     try:
-        event_id = upsert_event(event_norm)
+        event_id = None
+        if len(events) > 1:
+            # All dates in one transaction; dates already stored (same title
+            # and start) are updated in place, so "Update it" needs no replace_id
+            rows = await upsert_events(events)
+        else:
+            if replace_id is not None:
+                event_id = await update_event(replace_id, event_norm)
+            if event_id is None:  # not replacing, or the old event was deleted meanwhile
+                event_id = await upsert_event(event_norm)
     except Exception as e:
-        await update.message.reply_text("DB save failed:\n" + str(e))
-        return AWAIT_ANNOUNCEMENT
+        await reply("DB save failed:\n" + str(e))
+        return False
 
     # Format and send response
     title = (event_norm.get("title") or "Untitled event").strip()
     loc   = (event_norm.get("location") or "—").strip()
     desc  = (event_norm.get("description") or "").strip()
 
-    s_utc_iso = event_norm.get("start_ts_utc")
-    e_utc_iso = event_norm.get("end_ts_utc")
-
-    s_local = datetime.fromisoformat(s_utc_iso).astimezone(LOCAL_TZ)
-    e_local = datetime.fromisoformat(e_utc_iso).astimezone(LOCAL_TZ) if e_utc_iso else None
-    e_local = _roll_end_if_needed(s_local, e_local)
-
-    if e_local is None:
-        when = s_local.strftime("%a %b %-d") + " • " + s_local.strftime("%-I:%M %p")
+    if len(events) == 1:
+        e_utc_iso = event_norm["end_ts_utc"]
+        when = _fmt_when(datetime.fromisoformat(event_norm["start_ts_utc"]),
+                         datetime.fromisoformat(e_utc_iso) if e_utc_iso else None)
+        parts = [f"{'Updated' if event_id == replace_id else 'Saved'} (id {event_id}):", title, when, loc]
     else:
-        when = (_fmt_same_day_range(s_local, e_local)
-                if s_local.date() == e_local.date()
-                else _fmt_cross_day_range(s_local, e_local))
-
-    parts = [f"Saved (id {event_id}):", title, when, loc]
+        rows.sort(key=lambda r: r["start_ts"])
+        dates = [f"• {_fmt_when(r['start_ts'], r['end_ts'])} (id {r['id']})" for r in rows]
+        parts = [f"Saved {len(rows)} dates:", title, *dates, loc]
     if desc:
         parts.append(desc)
+    parts.append("\nSend /add to add another.")
 
-    await update.message.reply_text("\n".join(parts))
-    return ConversationHandler.END
+    await reply("\n".join(parts))
+    return True
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    if update.effective_user and update.effective_chat:
+        _cancel_buffer_timer(context, update.effective_chat.id, update.effective_user.id)
+        context.chat_data.get("announcement_buffer", {}).pop(update.effective_user.id, None)
+        context.chat_data.get("add_finished", set()).discard(update.effective_user.id)
     await update.message.reply_text("Cancelled.")
     return ConversationHandler.END
@@ -0,0 +1,56 @@
+# bot/handlers_search.py
+import uuid
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes
+
+from handlers_list import render_event_list
+from outbound import fit_text
+from services.db_search_events import search_events
+
+SEARCH_PAGE = 5
+MAX_SEARCHES = 20  # queries remembered per chat for the paging buttons
+
+def _page_keyboard(token: str, offset: int, more: bool) -> InlineKeyboardMarkup | None:
+    buttons = []
+    if offset > 0:
+        buttons.append(InlineKeyboardButton("◀ Prev", callback_data=f"search:{token}:{max(0, offset - SEARCH_PAGE)}"))
+    if more:
+        buttons.append(InlineKeyboardButton("Next ▶", callback_data=f"search:{token}:{offset + SEARCH_PAGE}"))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
+
+async def _render_page(terms: str, token: str, offset: int) -> tuple[str, InlineKeyboardMarkup | None]:
+    page = await search_events(terms, limit=SEARCH_PAGE, offset=offset)
+    if not page["rows"]:
+        return (f"No events match “{terms}”." if offset == 0 else "No more results."), None
+    first = offset + 1
+    header = f"Results {first}–{offset + len(page['rows'])} for “{terms}”:"
+    # One message per page, since the buttons edit it in place
+    return fit_text(header + "\n\n" + render_event_list(page["rows"])), _page_keyboard(token, offset, page["more"])
+
+async def search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    terms = " ".join(context.args or []).strip()
+    if not terms:
+        await update.message.reply_text("Usage: /search <terms>, e.g. /search rope workshop")
+        return
+
+    # Callback data is capped at 64 bytes, so the buttons carry a token for the terms
+    searches = context.chat_data.setdefault("searches", {})
+    while len(searches) >= MAX_SEARCHES:
+        searches.pop(next(iter(searches)))
+    token = uuid.uuid4().hex[:8]
+    searches[token] = terms
+
+    text, keyboard = await _render_page(terms, token, 0)
+    await update.message.reply_text(text, reply_markup=keyboard)
+
+async def search_page(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Prev/Next buttons: search:<token>:<offset>."""
+    query = update.callback_query
+    _, token, offset = query.data.split(":")
+    terms = context.chat_data.get("searches", {}).get(token)
+    await query.answer()
+    if terms is None:
+        await query.edit_message_text("This search has expired; run /search again.")
+        return
+    text, keyboard = await _render_page(terms, token, int(offset))
+    await query.edit_message_text(text, reply_markup=keyboard)
@@ -1,123 +1,120 @@
-# bot/handlers_admin.py
-import os
+# bot/handlers_select_event.py
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
-from telegram.ext import ContextTypes, ConversationHandler
+from telegram.ext import ContextTypes
 from zoneinfo import ZoneInfo
-from datetime import datetime, timedelta
-from bot.services.db_list_events_sorted import list_events_sorted
-# need to import the function to edit an event
+
+import outbound
+from handlers_list import format_event_block
+from services import page_cache
+from services.db import get_event
+from services.db_list_events_sorted import list_events_sorted, first_event_per_sort
 
 LOCAL_TZ = ZoneInfo("America/Vancouver")
+PAGE_SIZE = 5
 
+# Callback data (Telegram allows 64 bytes), all starting with "pk:":
+#   pk:q                  quick menu        pk:s   sort menu        pk:x   close
+#   pk:p:<sort>:<d>:<c>   a page: sort code, d = f(irst) / n(ext) / p(rev), c = cursor
+#   pk:e:<id>             one event
+SORTS = {
+    "d": ("start_ts", True, "by date"),
+    "c": ("created_at", False, "newest first"),
+    "u": ("updated_at", False, "recently updated"),
+}
+PATTERNS = {"date": "d", "created": "c", "updated": "u"}  # /edit_event <pattern>
 
-async def select_event_entry(update: Update, context: ContextTypes.DEFAULT_TYPE, pattern="quick", action="edit") -> None:
-    """_summary_
+def _event_button(event: dict, prefix: str = "") -> list[InlineKeyboardButton]:
+    text = f"{prefix}{event['title']} ({event['start_ts'].astimezone(LOCAL_TZ).strftime('%m-%d')})"
+    return [InlineKeyboardButton(text, callback_data=f"pk:e:{event['id']}")]
 
-    Args:
-        update (Update): _description_
-        context (ContextTypes.DEFAULT_TYPE): _description_
-        pattern (str, optional): _description_. Defaults to "quick".
-        action (str, optional): _description_. Defaults to "edit".
-    
-    This function is the entry point for selecting an event.
-    The pattern parameter allows the user to choose the order they want to select the events by:
-    eg: /edit_event gives the quick option. A menue with the first 5 events in each of the possible sort orders.
-    eg: /edit_event date jumps to the first page of events sorted by start_ts asc.
-    
-    The action parameter allows this menu to be used for different actions. 
-    Possible future actions could include:
-    select an event a user wants to rsvp to or see the details of an event.
-    """
-    
-    if pattern == "quick":
-        # Quick select event
-        await select_event_quick(update, context, action=action)
-    if pattern == "date":
-        # Select event by date
-        await select_event_by_date(update, context, action=action, page_number=0)
-    if pattern == "created":
-        # Select event by created_at
-        await select_event_by_created(update, context, action=action, page_number=0)
-    if pattern == "updated":
-        # Select event by updated_at
-        await select_event_by_updated(update, context, action=action, page_number=0)
+def _footer(*extra: InlineKeyboardButton) -> list[InlineKeyboardButton]:
+    return [*extra, InlineKeyboardButton("Sort by", callback_data="pk:s"), InlineKeyboardButton("Close", callback_data="pk:x")]
 
-    
-    
-async def select_event_quick(update: Update, context: ContextTypes.DEFAULT_TYPE, action = "view"):
-    """
+async def _quick_view() -> tuple[str, InlineKeyboardMarkup]:
+    """The first event in each order, one round trip."""
+    events = await first_event_per_sort()
+    prefixes = {"start_ts": "Soonest: ", "created_at": "Newest: ", "updated_at": "Updated: "}
+    buttons = [_event_button(e, prefixes[e["sort_by"]]) for e in events]
+    buttons.append(_footer())
+    text = "Select an event or choose a sort order:" if events else "No events yet."
+    return text, InlineKeyboardMarkup(buttons)
 
-    We use this menu system to allow a user to select an event so that they can interact with it.
-    The user can choose to list the events in the database sorted by
-    start_ts asc, created_at desc, or updated_at desc.
-    The user will initally be presented with the first event in each of the possible sort orders
-    with buttons to view the first 5 events in the order of their choice.
-    """
-    # Query the database for the events we will display
-    select = ["id", "title", "start_ts"]
-    events = [
-        list_events_sorted(select = select, sort_by="start_ts", asc=True, limit=1, offset=0),
-        list_events_sorted(select = select, sort_by="created_at", asc=False, limit=1, offset=0),
-        list_events_sorted(select = select, sort_by="updated_at", asc=False, limit=1, offset=0)
-    ]
-    
-    # Build buttons for each event
-    buttons = []
-    # Each button is its own row
-    for i, event in enumerate(events):
-        text = f"{event["title"]} ({event["start_ts"].astimezone(LOCAL_TZ).strftime('%m-%d')})"
-        call_back_data = f"event:{event["id"]}:"
-        buttons.append([InlineKeyboardButton(text, callback_data=call_back_data)])
-        
-    # Buttons on one row.
-    buttons.append([ 
-        InlineKeyboardButton("Sort By", callback_data="sort_by"), # Goes to the sort by menu
-        InlineKeyboardButton("Cancel", callback_data="cancel") # Exits the selection process
-        ])
-        
-    # Create the inline keyboard markup
-    reply_markup = InlineKeyboardMarkup(buttons)
-    # Send the message with the inline keyboard
-    await update.message.reply_text("Select an event or choose a sort order:", reply_markup=reply_markup)
-    
-    # if the update is "event:<event_id>:" then we will call the apropriate action function
-    if update.callback_query and update.callback_query.data.startswith("event:"):
-        event_id = int(update.callback_query.data.split(":")[1])
-        if action == "edit":
-            # Call the edit function for the selected event
-            await edit_event(update, context, event_id) # To be implemented
-            
-    elif update.callback_query and update.callback_query.data == "sort_by":
-        await sort_by_menu(update, context, action)  # Go to the sort by menu
-    
-    # If the user selects cancel we will exit the selection process
-    # Question: After a user edits an event, does the program come back to this point?
-    # If so, we should always exit the selection process if the program reaches this point and we would not have an elif.
-    
-async def sort_by_menu(update: Update, context: ContextTypes.DEFAULT_TYPE), action):
-    """
-    This function is called when the user selects the Sort By button.
-    It will present the user with a menu to select the sort order they want to use.
-    It sends the user to the first page of the appropriate sort order.
+def _sort_view() -> tuple[str, InlineKeyboardMarkup]:
+    buttons = [[InlineKeyboardButton(label.capitalize(), callback_data=f"pk:p:{code}:f:")]
+               for code, (_, _, label) in SORTS.items()]
+    buttons.append([InlineKeyboardButton("◀ Back", callback_data="pk:q"), InlineKeyboardButton("Close", callback_data="pk:x")])
+    return "Select a sort order:", InlineKeyboardMarkup(buttons)
+
+def _page_request(code: str, direction: str, cursor: str):
+    sort_by, asc, _ = SORTS[code]
+    after = cursor if direction == "n" else None
+    before = cursor if direction == "p" else None
+
+    def fetch():
+        return list_events_sorted(("id", "title", "start_ts"), sort_by=sort_by, asc=asc,
+                                  limit=PAGE_SIZE, after=after, before=before)
+    return (sort_by, asc, after, before), fetch
+
+async def _page_view(user_id: int, code: str, direction: str, cursor: str) -> tuple[str, InlineKeyboardMarkup]:
+    key, fetch = _page_request(code, direction, cursor)
+    page = await page_cache.get(user_id, key, fetch)
+    if page["next"]:
+        # The likely next click; fetched while the user reads this page
+        page_cache.prefetch(user_id, *_page_request(code, "n", page["next"]))
+
+    buttons = [_event_button(e) for e in page["rows"]]
+    nav = []
+    if page["prev"]:
+        nav.append(InlineKeyboardButton("◀ Prev", callback_data=f"pk:p:{code}:p:{page['prev']}"))
+    if page["next"]:
+        nav.append(InlineKeyboardButton("Next ▶", callback_data=f"pk:p:{code}:n:{page['next']}"))
+    if nav:
+        buttons.append(nav)
+    buttons.append(_footer())
+    text = f"Events {SORTS[code][2]} — pick one:" if page["rows"] else "No events yet."
+    return text, InlineKeyboardMarkup(buttons)
+
+async def _event_view(event_id: int, back: str) -> tuple[str, InlineKeyboardMarkup]:
+    event = await get_event(event_id)
+    text = (format_event_block(event, LOCAL_TZ) + f"\n\n(id {event_id})") if event else "That event no longer exists."
+    keyboard = [[InlineKeyboardButton("◀ Back", callback_data=back), InlineKeyboardButton("Close", callback_data="pk:x")]]
+    return text, InlineKeyboardMarkup(keyboard)
+
+async def select_event_entry(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
-    buttons = [
-        [InlineKeyboardButton("Date", callback_data="sort_by:start_ts")],
-        [InlineKeyboardButton("Created", callback_data="sort_by:created_at")],
-        [InlineKeyboardButton("Updated", callback_data="sort_by:updated_at")],
-        [InlineKeyboardButton("Back", callback_data="back_to_quick_select")],
-        [InlineKeyboardButton("Cancel", callback_data="cancel")]
-    ]
-    
-    reply_markup = InlineKeyboardMarkup(buttons)
-    await update.message.reply_text("Select a sort order:", reply_markup=reply_markup)
-    
-    if update.callback_query and update.callback_query.data.startswith("sort_by:"):
-        sort_by = update.callback_query.data.split(":")[1]
-        await select_event_by_date(update, context, action, page_number=0, sort_by=sort_by)  # Go to the first page of the selected sort order
-    
-async def select_event_by_date(update: Update, context: ContextTypes.DEFAULT_TYPE, action, page_number=0):
+    /edit_event [date|created|updated] — the event picker.
 
-async def select_event_by_created(update: Update, context: ContextTypes.DEFAULT_TYPE, action, page_number=0):
-    
-async def select_event_by_updated(update: Update, context: ContextTypes.DEFAULT_TYPE, action, page_number=0):
+    Without an argument it opens the quick menu: the first event by start date,
+    by creation and by last update, plus a sort menu. With one it jumps to the
+    first page of that order. Everything after that edits the same message.
+    """
+    pattern = (context.args or ["quick"])[0].lower()
+    if pattern == "quick":
+        text, keyboard = await _quick_view()
+    elif pattern in PATTERNS:
+        text, keyboard = await _page_view(update.effective_user.id, PATTERNS[pattern], "f", "")
+    else:
+        await update.message.reply_text("Usage: /edit_event [date|created|updated]")
+        return
+    await update.message.reply_text(text, reply_markup=keyboard)
 
+async def picker_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Button presses on the picker (pk:...); the message is edited in place."""
+    query = update.callback_query
+    await query.answer()
+    parts = query.data.split(":")
+    op = parts[1]
+    if op == "x":
+        await outbound.edit_text(query.message, "Closed.")
+        return
+    if op == "q":
+        text, keyboard = await _quick_view()
+    elif op == "s":
+        text, keyboard = _sort_view()
+    elif op == "p":
+        _, _, code, direction, cursor = parts
+        text, keyboard = await _page_view(update.effective_user.id, code, direction, cursor)
+        context.user_data["picker_back"] = query.data  # where "◀ Back" on an event returns to
+    else:  # "e"
+        text, keyboard = await _event_view(int(parts[2]), context.user_data.get("picker_back", "pk:q"))
+    await outbound.edit_text(query.message, text, reply_markup=keyboard)
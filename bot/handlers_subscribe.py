@@ -0,0 +1,117 @@
+# bot/handlers_subscribe.py
+import os, asyncio, logging
+from datetime import datetime, time as dtime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from telegram import Update
+from telegram.error import BadRequest, Forbidden, TelegramError
+from telegram.ext import ContextTypes
+
+import outbound
+from handlers_list import render_event_list
+from services import metrics
+from services.db_search_events import feed_events
+from services.db_subscribers import (
+    add_subscriber, remove_subscriber, subscriber_timezones, get_digest_run, create_digest_run,
+    undelivered_subscribers, record_delivery, finish_digest_run,
+)
+
+log = logging.getLogger(__name__)
+
+TZ = os.getenv("TZ", "America/Vancouver")
+DIGEST_HOUR = int(os.getenv("DIGEST_HOUR", "8"))                          # local hour the digest goes out
+DIGEST_DAYS = int(os.getenv("DIGEST_DAYS", "1"))                          # days covered: 1 = rest of today
+DIGEST_CHECK_INTERVAL = float(os.getenv("DIGEST_CHECK_INTERVAL", "300"))  # seconds between due checks
+DIGEST_BATCH = 500       # subscribers fetched per query
+DIGEST_CONCURRENCY = 8   # sends in flight; keeps the broadcast from queueing ahead of interactive replies
+
+_broadcasting = asyncio.Lock()
+
+async def subscribe(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/subscribe [timezone] — the day's events every morning."""
+    tz_name = context.args[0] if context.args else TZ
+    try:
+        ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        await update.message.reply_text(f"Unknown timezone “{tz_name}”. Usage: /subscribe [timezone], e.g. /subscribe Europe/Berlin")
+        return
+    new = await add_subscriber(update.effective_chat.id, tz_name)
+    await update.message.reply_text(
+        f"{'Subscribed' if new else 'Updated'}: what's on arrives daily at {DIGEST_HOUR:02d}:00 ({tz_name}). "
+        "/unsubscribe to stop."
+    )
+
+async def unsubscribe(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    removed = await remove_subscriber(update.effective_chat.id)
+    await update.message.reply_text("Unsubscribed." if removed else "This chat isn't subscribed.")
+
+async def _build(tz: ZoneInfo, now: datetime) -> str | None:
+    """The digest text for one timezone, or None if nothing is on. One query."""
+    end = datetime.combine(now.date() + timedelta(days=DIGEST_DAYS), dtime(), tz)
+    rows = await feed_events(now, end)
+    if not rows:
+        return None
+    header = f"What's on today, {now:%a %b %-d}:" if DIGEST_DAYS == 1 else f"What's on in the next {DIGEST_DAYS} days:"
+    return header + "\n\n" + render_event_list(rows, tz)
+
+async def _deliver_one(context: ContextTypes.DEFAULT_TYPE, run: dict, chat_id: int) -> bool:
+    """Send the digest to one chat and record it. False if it should be retried later."""
+    if not context.application.running:
+        return False  # shutting down; the next run picks up from the log
+    try:
+        await outbound.send_text(context.bot, chat_id, run["body"])
+        status = "sent"
+    except Forbidden:
+        status = "gone"  # blocked the bot or left the group
+    except BadRequest as e:
+        if "chat not found" not in str(e).lower():
+            log.warning("digest to chat %s failed: %s", chat_id, e)
+            return False
+        status = "gone"
+    except TelegramError as e:
+        log.warning("digest to chat %s failed: %s", chat_id, e)
+        return False
+    # Recorded right after the send; a crash in between re-sends to this chat only
+    await record_delivery(run["id"], chat_id, status)
+    if status == "gone":
+        await remove_subscriber(chat_id)
+    return True
+
+async def _broadcast(context: ContextTypes.DEFAULT_TYPE, run: dict) -> bool:
+    """Send `run` to every subscriber in its timezone without a delivery row. True if nobody is left."""
+    slots = asyncio.Semaphore(DIGEST_CONCURRENCY)
+
+    async def one(chat_id: int) -> bool:
+        async with slots:
+            return await _deliver_one(context, run, chat_id)
+
+    complete, after = True, None
+    while chat_ids := await undelivered_subscribers(run["id"], run["tz"], after, DIGEST_BATCH):
+        results = await asyncio.gather(*(one(c) for c in chat_ids))
+        complete = complete and all(results)
+        after = chat_ids[-1]
+    return complete
+
+async def send_digests(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Repeating job: for each subscriber timezone where DIGEST_HOUR has passed,
+    build today's digest once (stored in digest_runs) and send it to everyone
+    without a delivery row. Runs cut short by a restart or send errors are
+    finished on a later check the same day.
+    """
+    if _broadcasting.locked():
+        return  # the previous check is still sending
+    async with _broadcasting:
+        metrics.new_trace()
+        for tz_name in await subscriber_timezones():
+            tz = ZoneInfo(tz_name)
+            now = datetime.now(tz)
+            if now.hour < DIGEST_HOUR:
+                continue
+            run = await get_digest_run(now.date(), tz_name)
+            if run is None:
+                run = await create_digest_run(now.date(), tz_name, await _build(tz, now))
+            if run["finished_at"] is not None:
+                continue
+            with metrics.span("job.digest", tz=tz_name):
+                if run["body"] is None or await _broadcast(context, run):
+                    await finish_digest_run(run["id"])
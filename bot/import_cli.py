@@ -0,0 +1,53 @@
+# bot/import_cli.py
+"""
+Bulk-import announcements without going through Telegram.
+
+    python import_cli.py result.json
+    python import_cli.py announcements.txt --delimiter "===" --workers 2
+"""
+import os, sys, time, asyncio, argparse
+
+from services.db import open_pool, close_pool
+from services.extract import open_client, close_client
+from services.importer import parse_file, run_import, ImportResult, DEFAULT_DELIMITER, IMPORT_WORKERS, IMPORT_BATCH_SIZE
+
+async def _main(args) -> int:
+    with open(args.path, "rb") as f:
+        data = f.read()
+    try:
+        items = parse_file(data, args.path, args.delimiter)
+    except ValueError as e:  # includes json.JSONDecodeError
+        print(f"Could not read {args.path}: {e}", file=sys.stderr)
+        return 2
+
+    last = 0.0
+    async def progress(result: ImportResult) -> None:
+        nonlocal last
+        if time.monotonic() - last >= 1:
+            last = time.monotonic()
+            print(f"\r{result.processed}/{result.total} processed, {result.saved} saved, "
+                  f"{len(result.failed)} failed", end="", file=sys.stderr, flush=True)
+
+    await open_pool()
+    await open_client()
+    try:
+        result = await run_import(items, tz_name=args.tz, on_progress=progress,
+                                  workers=args.workers, batch_size=args.batch_size)
+    finally:
+        await close_client()
+        await close_pool()
+    print(file=sys.stderr)
+    print(result.summary(max_failures=len(result.failed)))
+    return 1 if result.failed else 0
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Bulk-import event announcements.")
+    ap.add_argument("path", help="Telegram export (.json) or text file of announcements")
+    ap.add_argument("--delimiter", default=DEFAULT_DELIMITER, help="line separating announcements in text files")
+    ap.add_argument("--tz", default=os.getenv("TZ", "America/Vancouver"))
+    ap.add_argument("--workers", type=int, default=IMPORT_WORKERS)
+    ap.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    sys.exit(asyncio.run(_main(ap.parse_args())))
+
+if __name__ == "__main__":
+    main()
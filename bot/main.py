@@ -1,18 +1,49 @@
 # bot/main.py
-import os
+import os, signal, asyncio, logging
+from telegram import Update
+from telegram.request import BaseRequest
 from telegram.ext import (
-    ApplicationBuilder, CommandHandler, MessageHandler, ConversationHandler, filters
+    Application, ApplicationBuilder, CommandHandler, MessageHandler, CallbackQueryHandler, ConversationHandler,
+    TypeHandler, filters
+)
+from handlers_parse import (
+    start_add, receive_announcement, cancel, resolve_duplicate, flush_pending_announcements,
+    reschedule_pending_announcements, AWAIT_ANNOUNCEMENT
 )
-from handlers_parse import start_add, receive_announcement, cancel, AWAIT_ANNOUNCEMENT
 from handlers_list import list_next
-from handlers_admin import delete_all
-from handlers_select_event import select_event_entry
+from handlers_search import search, search_page
+from handlers_subscribe import subscribe, unsubscribe, send_digests, DIGEST_CHECK_INTERVAL
+from handlers_import import start_import, receive_import_file, AWAIT_IMPORT_FILE
+from handlers_admin import delete_all, purge_cache
+from handlers_select_event import select_event_entry, picker_callback
+from update_processor import PerChatUpdateProcessor
+from persistence import PostgresPersistence, PERSISTENCE, refresh_conversations
+from outbound import TokenBucketRateLimiter, SEND_RATE_LIMIT
+from services.metrics import timed_handler
+from services.db import open_pool, close_pool
+from services.db_partitions import maintain_partitions
+from services.extract import open_client, close_client, warm_up
+from web import build_web_app, start_web, set_ready, WEBHOOK_PATH, WEBHOOK_SECRET
+
+log = logging.getLogger(__name__)
 
 # Load token
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 if not TOKEN:
     raise SystemExit("TELEGRAM_BOT_TOKEN is not set (see .env / docker-compose.yml).")
 
+# Updates handled at once across chats; each chat's updates still run in order.
+# Extractions run in jobs/tasks and do not hold one of these slots.
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "16"))
+ADD_CONVERSATION_TIMEOUT = int(os.getenv("ADD_CONVERSATION_TIMEOUT", "600"))  # seconds
+
+# "polling" (default) or "webhook" (Telegram POSTs updates to WEBHOOK_PATH on our HTTP server)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Public base URL Telegram should call, e.g. https://bot.example.org. If unset in
+# webhook mode the webhook is assumed to be registered already (or you are
+# posting recorded updates by hand).
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+
 # Parse admin IDs from env
 ADMIN_IDS = [int(x) for x in os.getenv("TELEGRAM_ADMIN_IDS", "").split(",") if x.strip()]
 
@@ -21,44 +52,159 @@ def restrict_to_admins(func):
     async def wrapper(update, context, *args, **kwargs):
         user_id = update.effective_user.id if update.effective_user else None
         if user_id not in ADMIN_IDS:
-            await update.message.reply_text("⛔ You are not authorized to use this bot.")
+            await update.effective_message.reply_text("⛔ You are not authorized to use this bot.")
             return
         return await func(update, context, *args, **kwargs)
     return wrapper
 
-def main() -> None:
-    app = ApplicationBuilder().token(TOKEN).build()
+def admin_handler(func):
+    """restrict_to_admins plus per-handler latency metrics and a trace id."""
+    return timed_handler(func.__name__, restrict_to_admins(func))
+
+async def _start_services() -> None:
+    # Finished before /readyz says yes: loading the model now makes the first
+    # /add as fast as any other
+    await open_client()
+    await warm_up()
+
+async def _partition_maintenance(context) -> None:
+    await maintain_partitions()
+
+async def _stop_services() -> None:
+    await close_client()
+    await close_pool()
+
+def build_application(request: BaseRequest | None = None) -> Application:
+    """Build the Application with all handlers. `request` replaces the HTTP layer to the Bot API (benchmarks)."""
+    builder = (
+        ApplicationBuilder()
+        .token(TOKEN)
+        .concurrent_updates(PerChatUpdateProcessor(MAX_CONCURRENT_UPDATES))
+    )
+    if SEND_RATE_LIMIT:
+        # Every Bot API call except getUpdates passes through it (see outbound.py)
+        builder = builder.rate_limiter(TokenBucketRateLimiter())
+    if PERSISTENCE:
+        # chat_data/user_data and conversation states survive restarts (see persistence.py)
+        builder = builder.persistence(PostgresPersistence())
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    app = builder.build()
+    if PERSISTENCE:
+        # Another bot process may have moved a conversation on since we last saw it
+        app.add_handler(TypeHandler(Update, refresh_conversations), group=-1)
 
     # Add conversation with admin restriction
     add_conv = ConversationHandler(
-        entry_points=[CommandHandler("add", restrict_to_admins(start_add))],
+        entry_points=[CommandHandler("add", admin_handler(start_add))],
         states={
             AWAIT_ANNOUNCEMENT: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, restrict_to_admins(receive_announcement))
+                MessageHandler(filters.TEXT & ~filters.COMMAND, admin_handler(receive_announcement))
             ],
         },
-        fallbacks=[CommandHandler("cancel", restrict_to_admins(cancel))],
+        fallbacks=[CommandHandler("cancel", admin_handler(cancel))],
         name="add_conversation",
-        persistent=False,
+        persistent=PERSISTENCE,
+        # Extraction runs after the handler returns, so the flush job marks the /add
+        # finished and the admin's next message ends it (see receive_announcement);
+        # the timeout only closes an /add nobody pasted into
+        conversation_timeout=ADD_CONVERSATION_TIMEOUT,
+        allow_reentry=True,
     )
     app.add_handler(add_conv)
+    # "Update it?" buttons sent when a paste matches a stored announcement
+    app.add_handler(CallbackQueryHandler(admin_handler(resolve_duplicate), pattern=r"^dup:"))
+
+    # Bulk import: /import, then send a chat export or delimited text file
+    import_conv = ConversationHandler(
+        entry_points=[CommandHandler("import", admin_handler(start_import))],
+        states={
+            AWAIT_IMPORT_FILE: [
+                MessageHandler(filters.Document.ALL, admin_handler(receive_import_file))
+            ],
+        },
+        fallbacks=[CommandHandler("cancel", admin_handler(cancel))],
+        name="import_conversation",
+        persistent=PERSISTENCE,
+    )
+    app.add_handler(import_conv)
 
     # Restricted commands
-    app.add_handler(CommandHandler("list", restrict_to_admins(list_next)))
-    app.add_handler(CommandHandler("deleteall", restrict_to_admins(delete_all)))
+    app.add_handler(CommandHandler("list", admin_handler(list_next)))
+    app.add_handler(CommandHandler("search", admin_handler(search)))
+    app.add_handler(CallbackQueryHandler(admin_handler(search_page), pattern=r"^search:"))
+    app.add_handler(CommandHandler("deleteall", admin_handler(delete_all)))
+    app.add_handler(CommandHandler("purgecache", admin_handler(purge_cache)))
     
     # Edit Event command
     # We allow the user to add a parameter /edit_event <pattern>
-    app.add_handler(CommandHandler("edit_event", restrict_to_admins(select_event_entry)))
+    app.add_handler(CommandHandler("edit_event", admin_handler(select_event_entry)))
+    app.add_handler(CallbackQueryHandler(admin_handler(picker_callback), pattern=r"^pk:"))
 
+    # Daily digest: open to every chat, not just admins
+    app.add_handler(CommandHandler("subscribe", timed_handler("subscribe", subscribe)))
+    app.add_handler(CommandHandler("unsubscribe", timed_handler("unsubscribe", unsubscribe)))
+    # Checks which timezones are due; the first check also resumes a broadcast cut short by a restart
+    app.job_queue.run_repeating(send_digests, interval=DIGEST_CHECK_INTERVAL, first=30, name="digest")
+    # Monthly partitions of events: create ahead, archive and detach old ones
+    app.job_queue.run_repeating(_partition_maintenance, interval=86400, first=60, name="partitions")
 
-    @restrict_to_admins
+
+    @admin_handler
     async def _hi(update, context):
-        await update.message.reply_text("Hi! Use /add to paste an announcement, or /list to see the next 5 events.")
+        await update.message.reply_text("Hi! Use /add to paste an announcement, /list to see upcoming events, or /search to find one.")
 
     app.add_handler(CommandHandler("start", _hi))
+    return app
+
+def main() -> None:
+    asyncio.run(_serve(build_application()))
+
+async def _serve(app) -> None:
+    """
+    Run the bot until SIGINT/SIGTERM, then shut down gracefully: stop taking
+    updates (readiness goes 503 first), flush buffered announcements and wait
+    for every running extraction/import before closing the pool and client.
+    """
+    webhook = BOT_MODE == "webhook"
+    web_app = build_web_app(app, webhook=webhook)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
 
-    app.run_polling(close_loop=False)
+    # Serve /healthz right away; /readyz stays 503 until startup has finished
+    runner = await start_web(web_app)
+    try:
+        # The pool (and schema migrations) first: persistence loads conversation
+        # states in initialize()
+        await open_pool()
+        await app.initialize()
+        await _start_services()
+        if webhook:
+            if WEBHOOK_URL:
+                await app.bot.set_webhook(
+                    url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                    secret_token=WEBHOOK_SECRET,
+                    allowed_updates=Update.ALL_TYPES,
+                )
+        else:
+            await app.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+        await app.start()
+        await reschedule_pending_announcements(app)
+        set_ready(web_app, True)
+        log.info("Bot running in %s mode", BOT_MODE)
+        await stop.wait()
+    finally:
+        set_ready(web_app, False)
+        if app.updater.running:
+            await app.updater.stop()
+        if app.running:
+            await flush_pending_announcements(app)
+            await app.stop()  # processes queued updates, waits for jobs and create_task tasks
+        await runner.cleanup()
+        await app.shutdown()
+        await _stop_services()
 
 if __name__ == "__main__":
     main()
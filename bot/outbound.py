@@ -0,0 +1,244 @@
+# bot/outbound.py
+import os, time, asyncio, logging
+from datetime import timedelta
+from typing import Any, Callable, Coroutine
+from telegram import Message
+from telegram.constants import MessageLimit
+from telegram.error import BadRequest, RetryAfter, TelegramError
+from telegram.ext import BaseRateLimiter
+
+from services import metrics
+
+log = logging.getLogger(__name__)
+
+# Telegram's documented limits: ~30 messages/s per bot, ~1/s per private chat
+# (short bursts are tolerated), 20/min per group. Edits count like messages.
+SEND_RATE_LIMIT = os.getenv("SEND_RATE_LIMIT", "1") == "1"
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "30"))      # calls per second, whole bot
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))           # calls per second, private chat
+SEND_GROUP_RATE = float(os.getenv("SEND_GROUP_RATE", "20")) / 60   # env is per minute
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))         # RetryAfter retries per call
+MAX_RETRY_AFTER = 60  # seconds; a longer flood wait is raised instead of slept through
+CHAT_BURST = 3
+GROUP_BURST = 5
+MAX_IDLE_BUCKETS = 1000  # per-chat buckets kept before full (idle) ones are dropped
+
+# Calls that don't post anything into a chat
+UNLIMITED = {"getMe", "getFile", "getWebhookInfo", "setWebhook", "deleteWebhook",
+             "answerCallbackQuery", "setMyCommands", "logOut", "close"}
+
+MAX_TEXT_LENGTH = MessageLimit.MAX_TEXT_LENGTH  # 4096, counted in UTF-16 code units
+
+class TokenBucket:
+    """`rate` tokens per second, up to `burst` banked. Callers reserve a token and sleep off any debt."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.stamp = time.monotonic()
+        self.blocked_until = 0.0  # set from RetryAfter
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def reserve(self) -> float:
+        """Take a token (possibly going into debt) and return how long to wait before using it."""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+    def block(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def idle(self) -> bool:
+        now = time.monotonic()
+        self._refill(now)
+        return self.tokens >= self.burst and self.blocked_until <= now
+
+def _seconds(retry_after: int | float | timedelta) -> float:
+    return retry_after.total_seconds() if isinstance(retry_after, timedelta) else float(retry_after)
+
+class TokenBucketRateLimiter(BaseRateLimiter[None]):
+    """
+    Spaces out Bot API calls with a global bucket and one bucket per chat, and
+    retries calls Telegram answers with 429 (RetryAfter) after the given wait.
+    A flood wait pauses only the chat it came from.
+    """
+
+    def __init__(self):
+        self._global = TokenBucket(SEND_GLOBAL_RATE, int(SEND_GLOBAL_RATE))
+        self._chats: dict[int | str, TokenBucket] = {}
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= MAX_IDLE_BUCKETS:
+                self._chats = {k: b for k, b in self._chats.items() if not b.idle()}
+            # Groups and channels have negative ids (or @usernames)
+            group = not isinstance(chat_id, int) or chat_id < 0
+            bucket = self._chats[chat_id] = (TokenBucket(SEND_GROUP_RATE, GROUP_BURST) if group
+                                             else TokenBucket(SEND_CHAT_RATE, CHAT_BURST))
+        return bucket
+
+    async def _acquire(self, chat: TokenBucket | None) -> None:
+        waited = 0.0
+        # Chat first, so a call queued behind a busy chat doesn't hold a global token
+        for bucket in (chat, self._global):
+            if bucket is not None and (wait := bucket.reserve()) > 0:
+                await asyncio.sleep(wait)
+                waited += wait
+        metrics.SEND_WAIT.observe(waited)
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, bool | dict | list[dict]]],
+        args: Any,
+        kwargs: dict[str, Any],
+        endpoint: str,
+        data: dict[str, Any],
+        rate_limit_args: None,
+    ) -> bool | dict | list[dict]:
+        if endpoint in UNLIMITED:
+            return await callback(*args, **kwargs)
+
+        chat_id = data.get("chat_id")
+        chat = self._chat_bucket(chat_id) if chat_id is not None else None
+        retries = 0
+        while True:
+            await self._acquire(chat)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                delay = _seconds(e.retry_after)
+                if retries >= SEND_MAX_RETRIES or delay > MAX_RETRY_AFTER:
+                    raise
+                retries += 1
+                log.info("%s to chat %s hit flood control; retrying in %.0fs", endpoint, chat_id, delay)
+                metrics.SEND_RETRIES.labels(endpoint).inc()
+                (chat or self._global).block(delay)
+
+def _units(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+def split_text(text: str, limit: int = MAX_TEXT_LENGTH, _seps: tuple[str, ...] = ("\n\n", "\n", " ")) -> list[str]:
+    """
+    Cut `text` into messages of at most `limit` UTF-16 units, on blank lines
+    (event blocks) where possible, then on lines, then on spaces.
+    """
+    if _units(text) <= limit:
+        return [text]
+    if not _seps:
+        parts, current, size = [], "", 0
+        for ch in text:
+            n = _units(ch)
+            if size + n > limit:
+                parts.append(current)
+                current, size = "", 0
+            current += ch
+            size += n
+        return parts + [current]
+
+    sep, finer = _seps[0], _seps[1:]
+    sep_units = _units(sep)
+    parts, current, size = [], None, 0
+    for piece in text.split(sep):
+        for chunk in split_text(piece, limit, finer):
+            n = _units(chunk)
+            if current is not None and size + sep_units + n <= limit:
+                current += sep + chunk
+                size += sep_units + n
+            else:
+                if current is not None:
+                    parts.append(current)
+                current, size = chunk, n
+    parts.append(current)
+    return parts
+
+def fit_text(text: str, limit: int = MAX_TEXT_LENGTH) -> str:
+    """`text` cut to one message at a block boundary, for edits (which can't be split)."""
+    if _units(text) <= limit:
+        return text
+    return split_text(text, limit - 2)[0] + "\n…"
+
+async def reply_text(message: Message, text: str, **kwargs) -> Message:
+    """message.reply_text, split into several messages if needed; a keyboard goes on the last one."""
+    parts = split_text(text)
+    markup = kwargs.pop("reply_markup", None)
+    metrics.MESSAGE_PARTS.inc(len(parts) - 1)
+    for i, part in enumerate(parts):
+        sent = await message.reply_text(part, reply_markup=markup if i == len(parts) - 1 else None, **kwargs)
+    return sent
+
+async def send_text(bot, chat_id: int, text: str, reply_to_message_id: int | None = None, **kwargs) -> Message:
+    """bot.send_message, split like reply_text; only the first part replies to reply_to_message_id."""
+    parts = split_text(text)
+    markup = kwargs.pop("reply_markup", None)
+    metrics.MESSAGE_PARTS.inc(len(parts) - 1)
+    for i, part in enumerate(parts):
+        sent = await bot.send_message(
+            chat_id, part,
+            reply_to_message_id=reply_to_message_id if i == 0 else None,
+            reply_markup=markup if i == len(parts) - 1 else None,
+            **kwargs,
+        )
+    return sent
+
+class _PendingEdit:
+    __slots__ = ("text", "kwargs", "task")
+
+    def __init__(self, text: str, kwargs: dict):
+        self.text, self.kwargs, self.task = text, kwargs, None
+
+_pending_edits: dict[tuple[int, int], _PendingEdit] = {}
+
+async def _run_edits(key: tuple[int, int], message: Message, pending: _PendingEdit) -> None:
+    try:
+        while pending.text is not None:
+            text, kwargs = pending.text, pending.kwargs
+            pending.text = None
+            try:
+                await message.edit_text(text, **kwargs)
+            except TelegramError as e:
+                if isinstance(e, BadRequest) and "not modified" in e.message.lower():
+                    continue
+                log.warning("editing message %s in chat %s failed: %s", key[1], key[0], e)
+                if pending.text is None:
+                    raise  # the latest text was not delivered (message deleted, network, flood wait, ...)
+    finally:
+        del _pending_edits[key]
+
+def _consume(task: asyncio.Task) -> None:
+    # Progress edits aren't awaited; their failure is already logged above
+    if not task.cancelled():
+        task.exception()
+
+def edit_text(message: Message, text: str, **kwargs) -> asyncio.Task:
+    """
+    Edit `message` to `text`, coalescing: while an edit of the same message is
+    waiting on the rate limiter, newer texts replace the queued one instead of
+    queueing behind it. Returns the task sending the edits; await it to be sure
+    the latest text has been delivered (progress updates needn't). The task
+    raises the TelegramError if the latest text couldn't be, e.g. because the
+    message was deleted; "message is not modified" is ignored.
+    """
+    key = (message.chat_id, message.message_id)
+    pending = _pending_edits.get(key)
+    if pending is not None:
+        if pending.text is not None:
+            metrics.EDITS_COALESCED.inc()
+        pending.text, pending.kwargs = fit_text(text), kwargs
+        return pending.task
+    pending = _pending_edits[key] = _PendingEdit(fit_text(text), kwargs)
+    pending.task = asyncio.create_task(_run_edits(key, message, pending))
+    pending.task.add_done_callback(_consume)
+    return pending.task
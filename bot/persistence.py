@@ -0,0 +1,211 @@
+# bot/persistence.py
+import os, json, pickle, asyncio, logging
+from telegram import Update
+from telegram.ext import BasePersistence, ConversationHandler, ContextTypes, PersistenceInput
+
+from services import db_state, metrics
+
+log = logging.getLogger(__name__)
+
+PERSISTENCE = os.getenv("PERSISTENCE", "1") == "1"
+# Seconds between writes of changed chat_data/user_data/conversation states;
+# everything changed in one interval is written in a single transaction. With
+# several processes this is also how long the others may work from a stale copy.
+PERSISTENCE_INTERVAL = float(os.getenv("PERSISTENCE_INTERVAL", "5"))
+
+class PostgresPersistence(BasePersistence):
+    """
+    chat_data, user_data and ConversationHandler states in the bot_state table.
+
+    Several bot processes may share the table. Every row carries a version:
+    before each update (or job) the chat's and user's rows are checked and
+    reloaded if another process has written them since (refresh_conversations
+    does the same for conversation states), and a row is only written if it is
+    still at the version this process last saw. A write that loses that race
+    is dropped, logged and counted (persistence_conflicts); the row is reloaded
+    before its next use. chat_data/user_data are loaded lazily, conversation
+    states at startup and then per update.
+    """
+
+    def __init__(self):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=True, user_data=True, callback_data=False),
+            update_interval=PERSISTENCE_INTERVAL,
+        )
+        self._versions: dict[tuple[str, str], int] = {}    # last version read or written
+        self._writes: dict[tuple[str, str], object] = {}    # (kind, key) -> value to pickle
+        self._deletes: set[tuple[str, str]] = set()
+        self._pending: asyncio.Task | None = None  # collecting rows, not yet started
+        self._saving: asyncio.Task | None = None   # transaction in progress
+
+    # --- write batching: PTB calls the update_* methods for one interval
+    # concurrently; they all queue their row and await the same transaction
+
+    def _queue(self, kind: str, key: str, value: object | None) -> asyncio.Task:
+        if value is None:
+            self._writes.pop((kind, key), None)
+            self._deletes.add((kind, key))
+        else:
+            self._deletes.discard((kind, key))
+            self._writes[(kind, key)] = value
+        return self._schedule()
+
+    def _schedule(self) -> asyncio.Task:
+        if self._pending is None:
+            self._pending = asyncio.create_task(self._write())
+        return self._pending
+
+    async def _write(self) -> None:
+        await asyncio.sleep(0)  # let the rest of this round queue up
+        if self._saving is not None:
+            await asyncio.wait([self._saving])  # the versions to check come from it
+        writes, deletes = self._writes, self._deletes
+        self._writes, self._deletes = {}, set()
+        self._pending, self._saving = None, asyncio.current_task()
+        rows = [
+            {"kind": kind, "key": key, "data": pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+             "keys": [k for k, v in value.items() if v] if isinstance(value, dict) else [],
+             "version": self._versions.get((kind, key))}
+            for (kind, key), value in writes.items()
+        ]
+        # A row this process never saw isn't its to delete (a conversation
+        # that ended before its first write, or one another process owns)
+        gone = [{"kind": kind, "key": key, "version": self._versions[(kind, key)]}
+                for kind, key in deletes if (kind, key) in self._versions]
+        try:
+            versions, conflicts = await db_state.save_states(rows, gone)
+        except Exception:
+            # Retried with the next write (or flush), unless superseded meanwhile
+            for entry, value in writes.items():
+                if entry not in self._deletes:
+                    self._writes.setdefault(entry, value)
+            self._deletes |= {entry for entry in deletes if entry not in self._writes}
+            raise
+        finally:
+            self._saving = None
+        self._versions.update(versions)
+        for entry in deletes:
+            self._versions.pop(entry, None)
+        for kind, key in conflicts:
+            log.warning("%s %s was changed by another process; dropped this write, reloading", kind, key)
+            metrics.PERSISTENCE_CONFLICTS.labels(kind.split(":")[0]).inc()
+            self._versions[(kind, key)] = 0  # matches no row: the next refresh reloads it, or clears it if gone
+
+    async def _reload(self, kind: str, key: str) -> tuple[bool, object | None]:
+        """
+        (changed, value): whether the row differs from what this process last
+        read or wrote, and its current value (None if there is no row).
+        """
+        while (task := self._pending or self._saving) is not None:
+            # Our own write would otherwise look like another process's and
+            # replace newer in-memory data with the snapshot being saved, and a
+            # queued write would be checked against the version read here
+            await asyncio.wait([task])
+        known = self._versions.get((kind, key))
+        row = await db_state.load_state(kind, key, known)
+        if row is None:
+            self._versions.pop((kind, key), None)
+            return known is not None, None  # deleted by another process
+        self._versions[(kind, key)] = row["version"]
+        if row["data"] is None:
+            return False, None
+        return True, pickle.loads(row["data"])
+
+    async def _refresh(self, kind: str, key: str, data: dict) -> None:
+        changed, value = await self._reload(kind, key)
+        if changed:
+            data.clear()
+            data.update(value or {})
+
+    # --- chat_data / user_data
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_user_data(self) -> dict:
+        return {}
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        await self._refresh("chat_data", str(chat_id), chat_data)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        await self._refresh("user_data", str(user_id), user_data)
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        await self._queue("chat_data", str(chat_id), data)
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        await self._queue("user_data", str(user_id), data)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        await self._queue("chat_data", str(chat_id), None)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        await self._queue("user_data", str(user_id), None)
+
+    async def chats_with(self, data_key: str) -> list[int]:
+        """Chats whose stored chat_data has a non-empty `data_key`."""
+        return [int(k) for k in await db_state.keys_with("chat_data", data_key)]
+
+    # --- conversations
+
+    async def get_conversations(self, name: str) -> dict:
+        kind = f"conversation:{name}"
+        rows = await db_state.load_states(kind)
+        self._versions.update({(kind, r["key"]): r["version"] for r in rows})
+        return {tuple(json.loads(r["key"])): pickle.loads(r["data"]) for r in rows}
+
+    async def update_conversation(self, name: str, key: tuple, new_state: object | None) -> None:
+        await self._queue(f"conversation:{name}", json.dumps(list(key)), new_state)
+
+    async def refresh_conversation(self, handler: ConversationHandler, update: Update) -> None:
+        """Bring `handler`'s state for the conversation `update` belongs to up to date."""
+        try:
+            key = handler._get_key(update)
+        except RuntimeError:
+            return  # no chat or user: not part of any conversation
+        changed, state = await self._reload(f"conversation:{handler.name}", json.dumps(list(key)))
+        if not changed:
+            return
+        # Untracked, so PTB doesn't write the state straight back
+        if state is None:
+            handler._conversations.data.pop(key, None)
+        else:
+            handler._conversations.update_no_track({key: state})
+
+    # --- not stored (see store_data)
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def flush(self) -> None:
+        if self._writes or self._deletes:
+            await self._schedule()
+        elif self._saving is not None:
+            await asyncio.wait([self._saving])
+
+async def refresh_conversations(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    TypeHandler callback, registered in a group before the conversations: PTB
+    reads conversation states only at startup, so reload the ones this update
+    belongs to in case another process has moved them on.
+    """
+    persistence = context.application.persistence
+    if not isinstance(update, Update) or not isinstance(persistence, PostgresPersistence):
+        return
+    for handlers in context.application.handlers.values():
+        for handler in handlers:
+            if isinstance(handler, ConversationHandler) and handler.persistent and handler.name:
+                await persistence.refresh_conversation(handler, update)
@@ -1,39 +1,121 @@
-import os, json
+import os, json, asyncio, logging
+from typing import Callable
 import psycopg
 from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+from services import metrics, migrations
+from services.metrics import timed_query
+
+log = logging.getLogger(__name__)
 
 
 PG_DSN = os.getenv("PG_DSN", "postgresql://app:app@db:5432/eventsdb")
+PG_POOL_MIN = int(os.getenv("PG_POOL_MIN", "1"))
+PG_POOL_MAX = int(os.getenv("PG_POOL_MAX", "10"))
+PG_POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", "10"))      # seconds to wait for a free connection
+PG_POOL_MAX_IDLE = float(os.getenv("PG_POOL_MAX_IDLE", "600"))   # close idle connections above min_size after this
 
-DDL = """
-CREATE TABLE IF NOT EXISTS events (
-  id SERIAL PRIMARY KEY,
-  title     TEXT NOT NULL,
-  start_ts  TIMESTAMPTZ NOT NULL,
-  end_ts    TIMESTAMPTZ,
-  location  TEXT,
-  capacity  INT,
-  description TEXT,
-  notes     TEXT,
-  raw       JSONB,
-  created_at TIMESTAMPTZ DEFAULT now(),
-  updated_at TIMESTAMPTZ DEFAULT now()
-);
-CREATE UNIQUE INDEX IF NOT EXISTS ux_events_title_start ON events (lower(title), start_ts);
-"""
+_pool: AsyncConnectionPool | None = None
+_listen_task: asyncio.Task | None = None
+
+# Writes to `events` are announced on this channel (payload: comma-separated ids, or "*")
+# so caches in every bot process can drop stale entries.
+EVENTS_CHANNEL = "events_changed"
+NOTIFY_PAYLOAD_MAX = 7000  # bytes; Postgres rejects payloads of 8000 or more
+_change_listeners: list[Callable[[set[int] | None], None]] = []
+
+async def open_pool() -> None:
+    """Open the shared connection pool and bring the schema up to date. Call once at startup."""
+    global _pool
+    if _pool is not None:
+        return
+    _pool = AsyncConnectionPool(
+        PG_DSN,
+        min_size=PG_POOL_MIN,
+        max_size=PG_POOL_MAX,
+        timeout=PG_POOL_TIMEOUT,
+        max_idle=PG_POOL_MAX_IDLE,
+        kwargs={"row_factory": dict_row},
+        # Health check: connections are tested when handed out, broken ones are replaced
+        check=AsyncConnectionPool.check_connection,
+        open=False,
+    )
+    await _pool.open(wait=True, timeout=PG_POOL_TIMEOUT)
+    metrics.DB_POOL_SIZE.set_function(lambda: _pool_stat("pool_size"))
+    metrics.DB_POOL_AVAILABLE.set_function(lambda: _pool_stat("pool_available"))
+    metrics.DB_POOL_WAITING.set_function(lambda: _pool_stat("requests_waiting"))
+    async with _conn() as conn:
+        await migrations.migrate(conn)
+    _start_change_listener()
+
+async def close_pool() -> None:
+    global _pool, _listen_task
+    if _listen_task is not None:
+        _listen_task.cancel()
+        _listen_task = None
+    if _pool is None:
+        return
+    await _pool.close()
+    _pool = None
+
+def _pool_stat(name: str) -> int:
+    return _pool.get_stats().get(name, 0) if _pool is not None else 0
 
 def _conn():
-    return psycopg.connect(PG_DSN, row_factory=dict_row)
+    if _pool is None:
+        raise RuntimeError("Database pool is not open; call open_pool() at startup.")
+    return _pool.connection()
+
+def add_change_listener(callback: Callable[[set[int] | None], None]) -> None:
+    """
+    Register callback(ids) to run whenever events change, in this process or
+    another one. ids is the set of touched event ids, or None for "anything
+    may have changed" (TRUNCATE, or a missed notification).
+    """
+    _change_listeners.append(callback)
+
+def _events_changed(ids: set[int] | None) -> None:
+    for callback in _change_listeners:
+        try:
+            callback(ids)
+        except Exception:
+            log.exception("events change listener failed")
+
+async def _notify_changed(cur, ids: set[int] | None) -> None:
+    # Delivered to listeners when the surrounding transaction commits
+    payload = "*" if ids is None else ",".join(str(i) for i in sorted(ids))
+    if len(payload) > NOTIFY_PAYLOAD_MAX:
+        payload = "*"
+    await cur.execute("SELECT pg_notify(%s, %s);", (EVENTS_CHANNEL, payload))
 
-# Initialize schema once on import
-with _conn() as c:
-    with c.cursor() as cur:
-        cur.execute(DDL)
-        c.commit()
+def _start_change_listener() -> None:
+    global _listen_task
+    if _listen_task is None:
+        _listen_task = asyncio.create_task(_listen_for_changes())
+
+async def _listen_for_changes() -> None:
+    """LISTEN on a dedicated connection (not from the pool) for the life of the process."""
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(PG_DSN, autocommit=True) as conn:
+                await conn.execute(f"LISTEN {EVENTS_CHANNEL};")
+                # Anything written while we were not listening is unknown
+                _events_changed(None)
+                async for n in conn.notifies():
+                    if n.payload == "*":
+                        _events_changed(None)
+                    else:
+                        _events_changed({int(i) for i in n.payload.split(",") if i})
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.warning("events LISTEN connection lost; reconnecting", exc_info=True)
+            await asyncio.sleep(5)
 
 UPSERT_SQL = """
-INSERT INTO events (title, start_ts, end_ts, location, capacity, description, notes, raw, updated_at)
-VALUES (%(title)s, %(start_ts)s, %(end_ts)s, %(location)s, %(capacity)s, %(description)s, %(notes)s, %(raw)s, now())
+INSERT INTO events (title, start_ts, end_ts, location, capacity, description, notes, raw, source_text, updated_at)
+VALUES (%(title)s, %(start_ts)s, %(end_ts)s, %(location)s, %(capacity)s, %(description)s, %(notes)s, %(raw)s, %(source_text)s, now())
 ON CONFLICT (lower(title), start_ts)
 DO UPDATE SET
   end_ts      = EXCLUDED.end_ts,
@@ -42,27 +124,185 @@ DO UPDATE SET
   description = EXCLUDED.description,
   notes       = EXCLUDED.notes,
   raw         = EXCLUDED.raw,
+  source_text = COALESCE(EXCLUDED.source_text, events.source_text),
   updated_at  = now()
 RETURNING id;
 """
 
-def upsert_event(n: dict) -> int:
-    with _conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(UPSERT_SQL, {
-                "title": n["title"],
-                "start_ts": n["start_ts_utc"],
-                "end_ts": n["end_ts_utc"],
-                "location": n.get("location"),
-                "capacity": n.get("capacity"),
-                "description": n.get("description"),
-                "notes": n.get("notes"),
-                "raw": json.dumps(n.get("raw", {}), ensure_ascii=False),
-            })
-            row = cur.fetchone()
-            conn.commit()
-            return row["id"]
-        
+def _event_params(n: dict) -> dict:
+    return {
+        "title": n["title"],
+        "start_ts": n["start_ts_utc"],
+        "end_ts": n["end_ts_utc"],
+        "location": n.get("location"),
+        "capacity": n.get("capacity"),
+        "description": n.get("description"),
+        "notes": n.get("notes"),
+        "raw": json.dumps(n.get("raw", {}), ensure_ascii=False),
+        "source_text": n.get("source_text"),
+    }
+
+async def _write_event(conn, cur, sql: str, params: dict) -> dict | None:
+    """
+    Run a single-row INSERT/UPDATE of events as the first statement of a
+    transaction; if the row's month has no partition yet, create it and retry.
+    """
+    try:
+        await cur.execute(sql, params, prepare=True)
+    except psycopg.errors.CheckViolation:  # no partition of relation "events" found for row
+        await conn.rollback()
+        await cur.execute("SELECT events_ensure_partition(%s);", (params["start_ts"],))
+        await conn.commit()
+        await cur.execute(sql, params, prepare=True)
+    return await cur.fetchone()
+
+@timed_query("upsert_event")
+async def upsert_event(n: dict) -> int:
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            row = await _write_event(conn, cur, UPSERT_SQL, _event_params(n))
+            await _notify_changed(cur, {row["id"]})
+            await conn.commit()
+    _events_changed({row["id"]})
+    return row["id"]
+
+EVENT_COLUMNS = ("title", "start_ts", "end_ts", "location", "capacity", "description", "notes", "raw", "source_text")
+
+# Bulk path: COPY the batch into a temp table, then merge it with one statement.
+# DISTINCT ON keeps the last copy of a (title, start) pair that appears twice in
+# the same batch, which a plain multi-row ON CONFLICT would reject.
+STAGING_DDL = """
+CREATE TEMP TABLE events_staging (
+  seq SERIAL,
+  title TEXT, start_ts TIMESTAMPTZ, end_ts TIMESTAMPTZ, location TEXT,
+  capacity INT, description TEXT, notes TEXT, raw JSONB, source_text TEXT
+) ON COMMIT DROP;
+"""
+
+# Imports can reach months outside the range maintenance creates ahead of time
+ENSURE_STAGING_PARTITIONS_SQL = """
+SELECT events_ensure_partition(m)
+FROM (SELECT DISTINCT date_trunc('month', start_ts AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS m FROM events_staging) months;
+"""
+
+MERGE_STAGING_SQL = """
+INSERT INTO events (title, start_ts, end_ts, location, capacity, description, notes, raw, source_text, updated_at)
+SELECT DISTINCT ON (lower(title), start_ts)
+  title, start_ts, end_ts, location, capacity, description, notes, raw, source_text, now()
+FROM events_staging
+ORDER BY lower(title), start_ts, seq DESC
+ON CONFLICT (lower(title), start_ts)
+DO UPDATE SET
+  end_ts      = EXCLUDED.end_ts,
+  location    = EXCLUDED.location,
+  capacity    = EXCLUDED.capacity,
+  description = EXCLUDED.description,
+  notes       = EXCLUDED.notes,
+  raw         = EXCLUDED.raw,
+  source_text = COALESCE(EXCLUDED.source_text, events.source_text),
+  updated_at  = now()
+RETURNING id, title, start_ts, end_ts;
+"""
+
+@timed_query("upsert_events")
+async def upsert_events(events: list[dict]) -> list[dict]:
+    """
+    Upsert many normalized events in one transaction. Returns one
+    {"id", "title", "start_ts", "end_ts"} per row written, in no particular
+    order; events repeating a (title, start) pair share one row.
+    """
+    if not events:
+        return []
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(STAGING_DDL)
+            copy_sql = f"COPY events_staging ({', '.join(EVENT_COLUMNS)}) FROM STDIN"
+            async with cur.copy(copy_sql) as copy:
+                for n in events:
+                    p = _event_params(n)
+                    await copy.write_row([p[c] for c in EVENT_COLUMNS])
+            await cur.execute(ENSURE_STAGING_PARTITIONS_SQL)
+            await cur.execute(MERGE_STAGING_SQL)
+            rows = await cur.fetchall()
+            ids = {r["id"] for r in rows}
+            await _notify_changed(cur, ids)
+            await conn.commit()
+    _events_changed(ids)
+    return rows
+
+UPDATE_BY_ID_SQL = """
+UPDATE events SET
+  title       = %(title)s,
+  start_ts    = %(start_ts)s,
+  end_ts      = %(end_ts)s,
+  location    = %(location)s,
+  capacity    = %(capacity)s,
+  description = %(description)s,
+  notes       = %(notes)s,
+  raw         = %(raw)s,
+  source_text = COALESCE(%(source_text)s, source_text),
+  updated_at  = now()
+WHERE id = %(id)s
+RETURNING id;
+"""
+
+@timed_query("update_event")
+async def update_event(event_id: int, n: dict) -> int | None:
+    """Overwrite event `event_id` with a normalized event. Returns None if it no longer exists."""
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            # Moves the row to another partition if start_ts changes month
+            row = await _write_event(conn, cur, UPDATE_BY_ID_SQL, {**_event_params(n), "id": event_id})
+            if row is None:
+                await conn.rollback()
+                return None
+            await _notify_changed(cur, {event_id})
+            await conn.commit()
+    _events_changed({event_id})
+    return event_id
+
+# pg_trgm similarity (0..1) of the stored announcement text; `%` uses the GIN
+# index with the threshold set for this transaction only.
+SIMILAR_EVENT_SQL = """
+SELECT id, title, location, description, notes, start_ts, end_ts,
+       similarity(source_text, %(text)s) AS score
+FROM events
+WHERE source_text %% %(text)s
+ORDER BY score DESC, id DESC
+LIMIT 1;
+"""
+
+@timed_query("find_similar_event")
+async def find_similar_event(text: str, threshold: float) -> dict | None:
+    """The stored event whose source announcement is most similar to `text`, if at least `threshold`."""
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT set_config('pg_trgm.similarity_threshold', %s, true);", (str(threshold),))
+            await cur.execute(SIMILAR_EVENT_SQL, {"text": text})
+            row = await cur.fetchone()
+            await conn.rollback()
+            return row
+
+# Bounded like the feed query, so only the partitions of its window are read
+EVENTS_STAMP_SQL = """
+SELECT count(*) AS count, max(updated_at) AS last_updated
+FROM events
+WHERE start_ts >= %(start)s AND start_ts < %(end)s;
+"""
+
+@timed_query("events_stamp")
+async def events_stamp(start, end) -> dict:
+    """
+    {"count", "last_updated"} over the events starting in [start, end): changes
+    whenever an event in that window is written or deleted, or moves in or out.
+    """
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(EVENTS_STAMP_SQL, {"start": start, "end": end}, prepare=True)
+            return await cur.fetchone()
+
+# now() is fixed at executor startup, so only the current and later monthly
+# partitions are scanned (run-time partition pruning, also for the prepared plan)
 LIST_NEXT_SQL = """
 SELECT
   id, title, location, description, notes,
@@ -73,47 +313,81 @@ ORDER BY start_ts
 LIMIT %(limit)s;
 """
 
-def list_next_events(limit: int = 5) -> list[dict]:
-    with _conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(LIST_NEXT_SQL, {"limit": limit})
-            return cur.fetchall()
-
-def delete_all_events() -> int:
-    with _conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("TRUNCATE events RESTART IDENTITY;")
-            conn.commit()
-            # TRUNCATE doesn't return rowcount; return 0 to indicate success
-            return 0
-        
-def list_events_sorted(
-    select: list = ["id", "title"],
-    sort_by: str = "start_ts",
-    asc: bool = True,
-    limit: int = 5,
-    offset: int = 0) -> list[dict]:
-    """
-    List events sorted by the specified field.
-    :param sort_by: Field to sort by (e.g., 'start_ts', 'created_at', 'updated_at').
-    :param limit: Number of events to return.
-    :param offset: Offset for pagination. To be muultiplied by 'limit' in the SQL query.
-    :return: List of events.
-    """
-    valid_sorts = ["start_ts", "created_at", "updated_at"]
-    if sort_by not in valid_sorts:
-        raise ValueError(f"Invalid sort_by value. Must be one of {valid_sorts}.")
-    
-    order = "ASC" if asc else "DESC"
-    select_clause = ", ".join(select)
-    sql = f"""
-    SELECT {select_clause}
-    FROM events
-    ORDER BY {sort_by} {order}
-    LIMIT %(limit)s OFFSET %(offset)s;
-    """
-    with _conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, {"limit": limit, "offset": offset * limit})
-            return cur.fetchall()   
-        
\ No newline at end of file
+@timed_query("list_next_events")
+async def list_next_events(limit: int = 5) -> list[dict]:
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(LIST_NEXT_SQL, {"limit": limit}, prepare=True)
+            return await cur.fetchall()
+
+@timed_query("get_event")
+async def get_event(event_id: int) -> dict | None:
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("""
+                SELECT id, title, location, description, notes, start_ts, end_ts, created_at, updated_at
+                FROM events WHERE id = %(id)s;
+            """, {"id": event_id}, prepare=True)
+            return await cur.fetchone()
+
+@timed_query("delete_all_events")
+async def delete_all_events() -> int:
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            # The archive is keyed by event id, and the ids start over
+            await cur.execute("TRUNCATE events, events_raw_archive RESTART IDENTITY;")
+            await _notify_changed(cur, None)
+            await conn.commit()
+    _events_changed(None)
+    # TRUNCATE doesn't return rowcount; return 0 to indicate success
+    return 0
+
+@timed_query("get_cached_extraction")
+async def get_cached_extraction(key: str, ttl_seconds: float) -> dict | None:
+    """Return {"result", "age"} for a live cache row, or None. age is in seconds."""
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("""
+                SELECT result, extract(epoch FROM now() - created_at) AS age
+                FROM extract_cache
+                WHERE key = %(key)s AND created_at > now() - make_interval(secs => %(ttl)s);
+            """, {"key": key, "ttl": ttl_seconds}, prepare=True)
+            row = await cur.fetchone()
+            if row is None:
+                return None
+            return {"result": row["result"], "age": float(row["age"])}
+
+@timed_query("put_cached_extraction")
+async def put_cached_extraction(key: str, model: str, prompt_version: str, result: dict) -> None:
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("""
+                INSERT INTO extract_cache (key, model, prompt_version, result, created_at)
+                VALUES (%(key)s, %(model)s, %(prompt_version)s, %(result)s, now())
+                ON CONFLICT (key) DO UPDATE SET result = EXCLUDED.result, created_at = now();
+            """, {
+                "key": key,
+                "model": model,
+                "prompt_version": prompt_version,
+                "result": json.dumps(result, ensure_ascii=False),
+            }, prepare=True)
+            await conn.commit()
+
+@timed_query("prune_extraction_cache")
+async def prune_extraction_cache(ttl_seconds: float) -> int:
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "DELETE FROM extract_cache WHERE created_at <= now() - make_interval(secs => %(ttl)s);",
+                {"ttl": ttl_seconds},
+            )
+            await conn.commit()
+            return cur.rowcount
+
+@timed_query("purge_extraction_cache")
+async def purge_extraction_cache() -> int:
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("DELETE FROM extract_cache;")
+            await conn.commit()
+            return cur.rowcount
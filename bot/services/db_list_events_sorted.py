@@ -1,32 +1,61 @@
-from typing import Iterable, Sequence
+import base64, struct
+from datetime import datetime, timedelta, timezone
+from typing import Sequence
 from psycopg import sql
 
+from services.db import _conn
+from services.metrics import timed_query
+
 # Keep a single source of truth for allowed columns
 ALLOWED_COLUMNS: set[str] = {
     "id", "title", "start_ts", "end_ts", "location",
     "capacity", "notes", "created_at", "updated_at", "description",
 }
 
-def list_events_sorted(
+# Columns that can be paged with a keyset on (column, id). Each has a matching
+# (column, id) index in services/migrations.py.
+SORT_COLUMNS: tuple[str, ...] = ("start_ts", "created_at", "updated_at")
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+_CURSOR = struct.Struct(">qi")  # microseconds since epoch, event id -> 12 bytes, 16 base64 chars
+
+def encode_cursor(sort_value: datetime, event_id: int) -> str:
+    """Opaque position token, short enough to embed in Telegram callback data (64 bytes)."""
+    micros = (sort_value - _EPOCH) // _MICROSECOND
+    return base64.urlsafe_b64encode(_CURSOR.pack(micros, event_id)).decode("ascii")
+
+def decode_cursor(token: str) -> tuple[datetime, int]:
+    try:
+        micros, event_id = _CURSOR.unpack(base64.urlsafe_b64decode(token))
+    except (ValueError, struct.error):
+        raise ValueError(f"Invalid cursor: {token!r}")
+    return _EPOCH + micros * _MICROSECOND, event_id
+
+@timed_query("list_events_sorted")
+async def list_events_sorted(
     select: Sequence[str] | None = None,
     *,
     sort_by: str = "start_ts",
     asc: bool = True,
     limit: int = 5,
-    page: int = 0,
-) -> list[dict]:
+    after: str | None = None,
+    before: str | None = None,
+) -> dict:
     """
-    Return events sorted by a given field.
+    Return one page of events sorted by a given field, using keyset pagination.
 
     Args:
         select: Columns to return. Defaults to ("id", "title").
-        sort_by: Column to sort by (must be in ALLOWED_COLUMNS).
+        sort_by: Column to sort by (must be in SORT_COLUMNS).
         asc: Sort ascending if True, descending if False.
         limit: Page size (number of rows).
-        page: Zero-based page index (0 -> first page).
+        after: Cursor from a previous page's "next"; returns the rows after it.
+        before: Cursor from a previous page's "prev"; returns the rows before it.
 
     Returns:
-        List of dict rows.
+        {"rows": list of dict rows, "next": cursor or None, "prev": cursor or None}.
+        Cursors are only valid with the same sort_by and asc.
     """
     if select is None:
         select = ("id", "title")
@@ -36,26 +65,79 @@ def list_events_sorted(
     if invalid_select:
         raise ValueError(f"Invalid select columns: {invalid_select}")
 
-    if sort_by not in ALLOWED_COLUMNS:
-        raise ValueError(f"Invalid sort_by value: {sort_by}")
+    if sort_by not in SORT_COLUMNS:
+        raise ValueError(f"Invalid sort_by value: {sort_by}. Must be one of {SORT_COLUMNS}.")
+    if after and before:
+        raise ValueError("Pass at most one of after/before.")
+
+    # Walking backwards means reading in the opposite order and flipping the page afterwards
+    forward = asc != bool(before)
+    order = sql.SQL("ASC") if forward else sql.SQL("DESC")
+    cmp = sql.SQL(">") if forward else sql.SQL("<")
 
-    order = sql.SQL("ASC") if asc else sql.SQL("DESC")
+    # The keyset needs the sort column and id even if the caller did not ask for them
+    columns = list(dict.fromkeys([*select, sort_by, "id"]))
+    select_identifiers = [sql.Identifier(c) for c in columns]
 
-    # Build identifier list safely
-    select_identifiers = [sql.Identifier(c) for c in select]
+    where = sql.SQL("")
+    params: list = []
+    cursor = after or before
+    if cursor:
+        where = sql.SQL("WHERE ({sort_col}, id) {cmp} (%s, %s)").format(
+            sort_col=sql.Identifier(sort_by), cmp=cmp,
+        )
+        params.extend(decode_cursor(cursor))
 
     query = sql.SQL("""
         SELECT {cols}
         FROM events
-        ORDER BY {sort_col} {order}
-        LIMIT %s OFFSET %s
+        {where}
+        ORDER BY {sort_col} {order}, id {order}
+        LIMIT %s
     """).format(
         cols=sql.SQL(", ").join(select_identifiers),
+        where=where,
         sort_col=sql.Identifier(sort_by),
         order=order,
     )
+    params.append(limit + 1)  # one extra row tells us whether another page exists
+
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(query, params)
+            rows = await cur.fetchall()
 
-    with _conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(query, (limit, page * limit))
-            return cur.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if before:
+        rows.reverse()
+
+    def token(r):
+        return encode_cursor(r[sort_by], r["id"])
+
+    if before:
+        next_token = token(rows[-1]) if rows else None
+        prev_token = token(rows[0]) if rows and has_more else None
+    else:
+        next_token = token(rows[-1]) if rows and has_more else None
+        prev_token = token(rows[0]) if rows and after else None
+    return {"rows": rows, "next": next_token, "prev": prev_token}
+
+FIRST_PER_SORT_SQL = """
+(SELECT 'start_ts'   AS sort_by, id, title, start_ts FROM events ORDER BY start_ts ASC, id ASC LIMIT 1)
+UNION ALL
+(SELECT 'created_at' AS sort_by, id, title, start_ts FROM events ORDER BY created_at DESC, id DESC LIMIT 1)
+UNION ALL
+(SELECT 'updated_at' AS sort_by, id, title, start_ts FROM events ORDER BY updated_at DESC, id DESC LIMIT 1);
+"""
+
+@timed_query("first_event_per_sort")
+async def first_event_per_sort() -> list[dict]:
+    """
+    The first event under each picker ordering (soonest start, newest created,
+    latest updated) in one round trip. Each is a single index probe.
+    """
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(FIRST_PER_SORT_SQL, prepare=True)
+            return await cur.fetchall()
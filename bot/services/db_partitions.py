@@ -0,0 +1,69 @@
+import os, logging
+from psycopg import sql
+
+from services.db import _conn, _notify_changed, _events_changed
+from services.metrics import timed_query
+
+log = logging.getLogger(__name__)
+
+# events is partitioned by UTC month of start_ts (migration 8). Maintenance keeps
+# partitions ready ahead of time, moves `raw` out of past months into
+# events_raw_archive, and optionally detaches months nobody needs to query.
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "12"))
+ARCHIVE_AFTER_MONTHS = int(os.getenv("ARCHIVE_AFTER_MONTHS", "1"))  # full months after a month ends
+DETACH_AFTER_MONTHS = int(os.getenv("DETACH_AFTER_MONTHS", "0"))    # 0 keeps every month attached
+
+PAST_PARTITIONS_SQL = """
+SELECT month, name FROM events_partitions
+WHERE detached_at IS NULL
+  AND month < (date_trunc('month', now() AT TIME ZONE 'UTC') - make_interval(months => %(months)s))::date
+ORDER BY month;
+"""
+
+@timed_query("maintain_partitions")
+async def maintain_partitions() -> dict:
+    """Create the coming months' partitions, archive and detach old ones. Returns what changed."""
+    archived, detached = [], []
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "SELECT events_ensure_partition(now() + make_interval(months => g)) FROM generate_series(0, %(ahead)s) g;",
+                {"ahead": PARTITION_MONTHS_AHEAD},
+            )
+            await conn.commit()
+
+            await cur.execute(PAST_PARTITIONS_SQL, {"months": ARCHIVE_AFTER_MONTHS})
+            for p in await cur.fetchall():
+                # Every attached month is checked, not only ones never archived: a
+                # backfill or import can still write raw into a month after that
+                part = sql.Identifier(p["name"])
+                await cur.execute(sql.SQL("SELECT EXISTS (SELECT 1 FROM {part} WHERE raw IS NOT NULL) AS raw;")
+                                  .format(part=part))
+                if not (await cur.fetchone())["raw"]:
+                    continue
+                # One transaction per month, so a long archive run holds no lock for long
+                await cur.execute(sql.SQL("""
+                    INSERT INTO events_raw_archive (id, start_ts, raw)
+                    SELECT id, start_ts, raw FROM {part} WHERE raw IS NOT NULL
+                    ON CONFLICT (id, start_ts) DO UPDATE SET raw = EXCLUDED.raw, archived_at = now();
+                """).format(part=part))
+                await cur.execute(sql.SQL("UPDATE {part} SET raw = NULL WHERE raw IS NOT NULL;").format(part=part))
+                await cur.execute("UPDATE events_partitions SET archived_at = now() WHERE month = %s;", (p["month"],))
+                await conn.commit()
+                archived.append(p["name"])
+
+            if DETACH_AFTER_MONTHS:
+                await cur.execute(PAST_PARTITIONS_SQL, {"months": DETACH_AFTER_MONTHS})
+                for p in await cur.fetchall():
+                    # The table stays (pg_dump it, then DROP it); its events leave every query
+                    await cur.execute(sql.SQL("ALTER TABLE events DETACH PARTITION {part};").format(
+                        part=sql.Identifier(p["name"])))
+                    await cur.execute("UPDATE events_partitions SET detached_at = now() WHERE month = %s;", (p["month"],))
+                    await _notify_changed(cur, None)
+                    await conn.commit()
+                    detached.append(p["name"])
+    if detached:
+        _events_changed(None)
+    if archived or detached:
+        log.info("events partitions: archived %s, detached %s", archived, detached)
+    return {"archived": archived, "detached": detached}
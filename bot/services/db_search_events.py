@@ -0,0 +1,50 @@
+from services.db import _conn
+from services.metrics import timed_query
+
+# Both predicates are served by GIN indexes (ix_events_search_tsv and
+# ix_events_location_trgm) and combined with a BitmapOr, so the cost tracks the
+# number of matches rather than the size of the table. `<%` is pg_trgm's word
+# similarity: "duke salon" still finds "The Duke Saloon, 502 Discovery St".
+SEARCH_SQL = """
+WITH q AS (SELECT websearch_to_tsquery('english', %(terms)s) AS tsq)
+SELECT id, title, location, description, notes, start_ts, end_ts,
+       ts_rank_cd(search_tsv, q.tsq) + coalesce(word_similarity(%(terms)s, location), 0) AS rank
+FROM events, q
+WHERE search_tsv @@ q.tsq OR %(terms)s <%% location
+ORDER BY rank DESC, start_ts DESC, id DESC
+LIMIT %(limit)s OFFSET %(offset)s;
+"""
+
+@timed_query("search_events")
+async def search_events(terms: str, *, limit: int = 5, offset: int = 0) -> dict:
+    """
+    Full-text search over title, location, description and notes, best match first.
+
+    `terms` uses web search syntax: words, "quoted phrases", -excluded, or.
+    Returns {"rows": list of dict rows, "more": whether a next page exists}.
+    """
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            # One extra row tells us whether there is a next page
+            await cur.execute(SEARCH_SQL, {"terms": terms, "limit": limit + 1, "offset": offset}, prepare=True)
+            rows = await cur.fetchall()
+    return {"rows": rows[:limit], "more": len(rows) > limit}
+
+FEED_SQL = """
+SELECT id, title, location, description, notes, start_ts, end_ts, created_at, updated_at
+FROM events
+WHERE start_ts >= %(start)s AND start_ts < %(end)s
+  AND (%(terms)s::text IS NULL
+       OR search_tsv @@ websearch_to_tsquery('english', %(terms)s)
+       OR %(terms)s <%% location)
+ORDER BY start_ts, id
+LIMIT %(limit)s;
+"""
+
+@timed_query("feed_events")
+async def feed_events(start, end, terms: str | None = None, limit: int = 2000) -> list[dict]:
+    """Events starting in [start, end), optionally only those matching `terms` (same rules as search_events)."""
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(FEED_SQL, {"start": start, "end": end, "terms": terms or None, "limit": limit}, prepare=True)
+            return await cur.fetchall()
@@ -0,0 +1,83 @@
+from services.db import _conn
+from services.metrics import timed_query
+
+# Storage for persistence.PostgresPersistence: one row per chat_data/user_data
+# dict or conversation key, pickled. `version` is bumped on every write; a
+# process writes a row only if it is still at the version that process last
+# saw, and asks "has this row changed since?" without transferring the data.
+
+@timed_query("load_state")
+async def load_state(kind: str, key: str, known_version: int | None) -> dict | None:
+    """
+    {"version", "data"} for a row, None if there is no row. data is None when
+    the row is still at known_version.
+    """
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("""
+                SELECT version, CASE WHEN version = %(known)s THEN NULL ELSE data END AS data
+                FROM bot_state WHERE kind = %(kind)s AND key = %(key)s;
+            """, {"kind": kind, "key": key, "known": known_version}, prepare=True)
+            return await cur.fetchone()
+
+@timed_query("load_states")
+async def load_states(kind: str) -> list[dict]:
+    """Every row of one kind: {"key", "version", "data"}."""
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT key, version, data FROM bot_state WHERE kind = %(kind)s;", {"kind": kind})
+            return await cur.fetchall()
+
+@timed_query("keys_with")
+async def keys_with(kind: str, data_key: str) -> list[str]:
+    """Keys of the rows of `kind` whose data has a non-empty `data_key`."""
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "SELECT key FROM bot_state WHERE kind = %(kind)s AND keys @> ARRAY[%(data_key)s];",
+                {"kind": kind, "data_key": data_key},
+            )
+            return [r["key"] for r in await cur.fetchall()]
+
+async def _returned(cur) -> list[dict]:
+    # executemany(returning=True) leaves one result set per parameter set
+    rows = []
+    while True:
+        rows += await cur.fetchall()
+        if not cur.nextset():
+            return rows
+
+@timed_query("save_states")
+async def save_states(writes: list[dict], deletes: list[dict]) -> tuple[dict[tuple[str, str], int], set[tuple[str, str]]]:
+    """
+    Write `writes` ({"kind", "key", "data", "keys", "version"}) and delete
+    `deletes` ({"kind", "key", "version"}) in one transaction, each only if the
+    row is still at `version` (None: there must be no row yet).
+
+    Returns the new version of each written row, and the (kind, key) of the
+    rows another process changed or deleted meanwhile, which are left alone.
+    """
+    versions, done = {}, set()
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            if writes:
+                await cur.executemany("""
+                    INSERT INTO bot_state (kind, key, data, keys) VALUES (%(kind)s, %(key)s, %(data)s, %(keys)s)
+                    ON CONFLICT (kind, key) DO UPDATE
+                      SET data = EXCLUDED.data, keys = EXCLUDED.keys,
+                          version = bot_state.version + 1, updated_at = now()
+                      WHERE bot_state.version = %(version)s
+                    RETURNING kind, key, version;
+                """, writes, returning=True)
+                for row in await _returned(cur):
+                    versions[(row["kind"], row["key"])] = row["version"]
+            if deletes:
+                await cur.executemany("""
+                    DELETE FROM bot_state WHERE kind = %(kind)s AND key = %(key)s AND version = %(version)s
+                    RETURNING kind, key;
+                """, deletes, returning=True)
+                done = {(row["kind"], row["key"]) for row in await _returned(cur)}
+            await conn.commit()
+    conflicts = {(w["kind"], w["key"]) for w in writes} - versions.keys()
+    conflicts |= {(d["kind"], d["key"]) for d in deletes} - done
+    return versions, conflicts
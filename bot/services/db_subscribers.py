@@ -0,0 +1,97 @@
+from services.db import _conn
+from services.metrics import timed_query
+
+DIGEST_RETENTION_DAYS = 30  # finished runs (and their delivery rows) kept this long
+
+@timed_query("add_subscriber")
+async def add_subscriber(chat_id: int, tz: str) -> bool:
+    """Subscribe `chat_id` to the digest in timezone `tz`. False if it was already subscribed (tz is updated)."""
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("""
+                INSERT INTO subscribers (chat_id, tz) VALUES (%(chat_id)s, %(tz)s)
+                ON CONFLICT (chat_id) DO UPDATE SET tz = EXCLUDED.tz
+                RETURNING (xmax = 0) AS inserted;
+            """, {"chat_id": chat_id, "tz": tz})
+            row = await cur.fetchone()
+            await conn.commit()
+            return row["inserted"]
+
+@timed_query("remove_subscriber")
+async def remove_subscriber(chat_id: int) -> bool:
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("DELETE FROM subscribers WHERE chat_id = %(chat_id)s;", {"chat_id": chat_id})
+            await conn.commit()
+            return cur.rowcount > 0
+
+@timed_query("subscriber_timezones")
+async def subscriber_timezones() -> list[str]:
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT DISTINCT tz FROM subscribers ORDER BY tz;")
+            return [r["tz"] for r in await cur.fetchall()]
+
+@timed_query("get_digest_run")
+async def get_digest_run(digest_date, tz: str) -> dict | None:
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("""
+                SELECT id, digest_date, tz, body, finished_at FROM digest_runs
+                WHERE digest_date = %(date)s AND tz = %(tz)s;
+            """, {"date": digest_date, "tz": tz}, prepare=True)
+            return await cur.fetchone()
+
+@timed_query("create_digest_run")
+async def create_digest_run(digest_date, tz: str, body: str | None) -> dict:
+    """Store the day's digest for `tz`; if another process got there first, its run is returned."""
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("""
+                INSERT INTO digest_runs (digest_date, tz, body) VALUES (%(date)s, %(tz)s, %(body)s)
+                ON CONFLICT (digest_date, tz) DO NOTHING;
+            """, {"date": digest_date, "tz": tz, "body": body})
+            await cur.execute("""
+                SELECT id, digest_date, tz, body, finished_at FROM digest_runs
+                WHERE digest_date = %(date)s AND tz = %(tz)s;
+            """, {"date": digest_date, "tz": tz})
+            row = await cur.fetchone()
+            await conn.commit()
+            return row
+
+@timed_query("undelivered_subscribers")
+async def undelivered_subscribers(run_id: int, tz: str, after: int | None, limit: int) -> list[int]:
+    """Next `limit` chats in `tz` (by chat_id, after `after`) with no delivery recorded for the run."""
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("""
+                SELECT s.chat_id FROM subscribers s
+                WHERE s.tz = %(tz)s
+                  AND (%(after)s::bigint IS NULL OR s.chat_id > %(after)s)
+                  AND NOT EXISTS (SELECT 1 FROM digest_deliveries d
+                                  WHERE d.run_id = %(run_id)s AND d.chat_id = s.chat_id)
+                ORDER BY s.chat_id
+                LIMIT %(limit)s;
+            """, {"tz": tz, "after": after, "run_id": run_id, "limit": limit}, prepare=True)
+            return [r["chat_id"] for r in await cur.fetchall()]
+
+@timed_query("record_delivery")
+async def record_delivery(run_id: int, chat_id: int, status: str) -> None:
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("""
+                INSERT INTO digest_deliveries (run_id, chat_id, status) VALUES (%(run_id)s, %(chat_id)s, %(status)s)
+                ON CONFLICT (run_id, chat_id) DO NOTHING;
+            """, {"run_id": run_id, "chat_id": chat_id, "status": status}, prepare=True)
+            await conn.commit()
+
+@timed_query("finish_digest_run")
+async def finish_digest_run(run_id: int) -> None:
+    async with _conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("UPDATE digest_runs SET finished_at = now() WHERE id = %(id)s;", {"id": run_id})
+            await cur.execute(
+                "DELETE FROM digest_runs WHERE digest_date < current_date - %(days)s;",
+                {"days": DIGEST_RETENTION_DAYS},
+            )
+            await conn.commit()
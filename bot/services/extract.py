@@ -1,13 +1,158 @@
-import os, json
-from datetime import timezone, timedelta
+import os, json, time, logging
+from typing import Awaitable, Callable
 from zoneinfo import ZoneInfo
 from pydantic import BaseModel, ValidationError
 from dateutil import parser as dp
-import httpx
+
+from services import extract_cache, llm_router, metrics, prompt, recurrence, repair
+from services.prompt import PROMPT_VERSION
+
+log = logging.getLogger(__name__)
 
 OLLAMA = os.getenv("OLLAMA_BASE_URL", "http://ollama:11434")
 MODEL  = os.getenv("LLM_MODEL", "gemma3:4b-it-qat")
 
+# Load the model (and run one tiny generation) during startup, before readiness
+OLLAMA_PRELOAD = os.getenv("OLLAMA_PRELOAD", "1") == "1"
+OLLAMA_PRELOAD_TIMEOUT = float(os.getenv("OLLAMA_PRELOAD_TIMEOUT", "300"))  # model loads from disk can be slow
+
+async def open_client() -> None:
+    """Open the Ollama endpoint pool (OLLAMA_ENDPOINTS, else OLLAMA_BASE_URL). Call once at startup."""
+    await llm_router.open_endpoints(OLLAMA)
+
+async def close_client() -> None:
+    await llm_router.close_endpoints()
+
+async def warm_up() -> float | None:
+    """
+    Load the model on every endpoint with a one-token generation that shares
+    the static prompt prefix, so the first real extraction doesn't pay for it. Returns the seconds taken, or None if
+    no endpoint warmed up (the bot still starts; the first extraction is slow).
+    """
+    if not OLLAMA_PRELOAD:
+        return None
+    started = time.perf_counter()
+    payload = {
+        "model": MODEL,
+        "messages": prompt.warm_up_messages(),
+        # Same num_ctx as real requests, or Ollama reloads the model on the first one
+        "options": {"temperature": 0, "num_predict": 1, "num_ctx": prompt.PROMPT_CTX_SIZES[0]},
+        "format": "json",
+        "stream": False,
+    }
+    results = await llm_router.warm_up(payload, OLLAMA_PRELOAD_TIMEOUT)
+    for url, result in results.items():
+        if result is not None:
+            elapsed, resp = result
+            log.info("model %s warm on %s in %.1fs (load %.1fs, keep_alive %s)", resp.get("model", MODEL),
+                     url, elapsed, resp.get("load_duration", 0) / 1e9, llm_router.OLLAMA_KEEP_ALIVE)
+    if not any(results.values()):
+        return None
+    elapsed = time.perf_counter() - started
+    metrics.LLM_WARM_UP.set(elapsed)
+    return elapsed
+
+async def _chat(payload: dict) -> dict:
+    """Blocking /api/chat through the endpoint pool; returns the response JSON."""
+    if not llm_router.is_open():
+        raise RuntimeError("Ollama client is not open; call open_client() at startup.")
+    started = time.perf_counter()
+    resp = await llm_router.chat(payload)
+    model = resp.get("model") or payload["model"]
+    metrics.LLM_REQUEST.labels(model, PROMPT_VERSION, "blocking").observe(time.perf_counter() - started)
+    metrics.observe_ollama(resp, model, PROMPT_VERSION)
+    return resp
+
+class _JsonObjectScanner:
+    """
+    Follows a JSON object as it streams in, one chunk at a time.
+
+    Tracks nesting so it knows when the top-level object closes, and at every
+    top-level comma parses the prefix (plus a closing brace) to expose the
+    fields that are already complete.
+    """
+    def __init__(self):
+        self.text = ""
+        self.fields: dict = {}
+        self.closed = False
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+
+    def feed(self, chunk: str) -> bool:
+        """Consume a chunk; returns True if new complete fields became available."""
+        grew = False
+        for ch in chunk:
+            if self.closed:
+                break
+            self.text += ch
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+            elif ch == '"':
+                self._in_str = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.closed = True
+                    grew |= self._parse(self.text)
+            elif ch == "," and self._depth == 1:
+                grew |= self._parse(self.text[:-1] + "}")
+        return grew
+
+    def _parse(self, text: str) -> bool:
+        start = text.find("{")
+        try:
+            fields = json.loads(text[start:])
+        except ValueError:
+            return False
+        if not isinstance(fields, dict) or fields == self.fields:
+            return False
+        self.fields = fields
+        return True
+
+async def _chat_stream(payload: dict, on_fields: Callable[[dict], Awaitable[None]]) -> tuple[str, str]:
+    """
+    Stream /api/chat and return the JSON text of the first complete object,
+    and the model that wrote it.
+
+    on_fields is awaited each time more top-level fields are complete. The
+    request is closed as soon as the object ends, which stops generation
+    instead of letting the model run on to num_predict.
+    """
+    if not llm_router.is_open():
+        raise RuntimeError("Ollama client is not open; call open_client() at startup.")
+    scanner = _JsonObjectScanner()
+    labels = (payload["model"], PROMPT_VERSION)
+    started = time.perf_counter()
+    first_token = True
+
+    async def on_chunk(chunk: dict) -> bool:
+        nonlocal first_token, labels
+        if "error" in chunk:
+            raise RuntimeError(chunk["error"])
+        if first_token:
+            first_token = False
+            # The endpoint may serve its own model (OLLAMA_ENDPOINTS url=model)
+            labels = (chunk.get("model") or payload["model"], PROMPT_VERSION)
+            metrics.LLM_FIRST_TOKEN.labels(*labels).observe(time.perf_counter() - started)
+        if chunk.get("done"):
+            # Ollama's timings only arrive if the model finished on its own
+            metrics.observe_ollama(chunk, *labels)
+        if scanner.feed(chunk.get("message", {}).get("content", "")):
+            await on_fields(dict(scanner.fields))
+        return scanner.closed or chunk.get("done", False)
+
+    await llm_router.chat_stream(payload, on_chunk)
+    metrics.LLM_REQUEST.labels(*labels, "stream").observe(time.perf_counter() - started)
+    return scanner.text, labels[0]
+
 class EventOut(BaseModel):
     title: str
     start_iso: str
@@ -16,31 +161,8 @@ class EventOut(BaseModel):
     capacity: int | None = None
     description: str | None = None 
     notes: str | None = None
-
-SCHEMA = {
-  "type":"object","properties":{
-    "title":{"type":"string"},
-    "start_iso":{"type":"string"},
-    "end_iso":{"type":"string","nullable":True},
-    "location":{"type":"string","nullable":True},
-    "capacity":{"type":"integer","nullable":True},
-    "description":{"type":"string","nullable":True},
-    "notes":{"type":"string","nullable":True}
-  },"required":["title","start_iso"]
-}
-
-def _to_utc(iso_str: str | None):
-    if not iso_str: return None
-    return dp.isoparse(iso_str).astimezone(timezone.utc).isoformat()
-
-def _roll_end_if_needed(start_iso: str, end_iso: str | None, tz_name: str):
-    if not end_iso: return None
-    tz = ZoneInfo(tz_name)
-    s_local = dp.isoparse(start_iso).astimezone(tz)
-    e_local = dp.isoparse(end_iso).astimezone(tz)
-    if e_local <= s_local:
-        e_local = e_local + timedelta(days=1)
-    return e_local.astimezone(timezone.utc).isoformat()
+    rrule: str | None = None
+    occurrences: list[dict] = []
 
 def _fmt_local(iso_str: str | None, tz_name: str) -> str | None:
     if not iso_str: return None
@@ -49,58 +171,90 @@ def _fmt_local(iso_str: str | None, tz_name: str) -> str | None:
     # Example: Sun Jan 5, 1:00 PM
     return dt.strftime("%a %b %-d, %-I:%M %p")
 
-async def extract_event(announcement: str, ref_date: str, tz_name: str = "America/Vancouver") -> dict:
-    system = (
-        "Return ONLY one JSON object matching the schema. If a field is unknown, use null. "
-        f"Timezone: assume {tz_name} if missing and include the offset in all ISO times. "
-        f"Reference date: {ref_date}. All decisions MUST be made relative to this date. "
-        "If the announcement includes a month and day but no year, ALWAYS assume the reference year. "
-        "If multiple date/time mentions exist, return the one that is NEXT or UPCOMING relative to the reference date. "
-        "NEVER return a date in the past. This is critical. "
-        "Title: use the explicit event name; if multiple, pick the one nearest the 'When:' line; do not invent. "
-        "Ignore usernames or social media handles. Remove trailing handles, hashtags, or location tags like 'yyj'. "
-        "Times: Extract both start_iso and end_iso if a time range appears — including informal formats such as '5:30 PM – 6:15 PM', '5 - 7pm', '5–7 PM', or 'between 5 and 7 PM'. Do not ignore ranges due to punctuation, formatting, or spacing. If only one time is present, set end_iso to null. "
-        "Treat ranges like '5:30 PM – 6:15 PM' as same-day unless there's clear evidence of an overnight event (e.g. ending after midnight)."
-        "If multiple times or time ranges appear, prefer the one that: (1) includes both start and end time, (2) is more specific, and (3) occurs in the future relative to the reference date."
-        "For recurring events or if the date is missing, infer the next future date and time using context (e.g. weekday + time).""Location: prefer 'venue (name), address, city, province, country' if present. "
-        "Location: Always include at least a venue name or hosting group name—never return just the city. If a city is not explicitly mentioned, default to 'Victoria, British Columbia, Canada'. If no venue is mentioned, use 'hosting group (name), city, province, country'. If location is vague or partial, append the default city information."
-        "Capacity: convert written numbers to integers if unambiguous; else null. "
-        "Description: Return EXACTLY ONE sentence (≤140 chars) summarizing the event’s *main activities* and vibe. "
-        "Include whether it’s a dance party, workshop, social, etc. Highlight anything sensory, queer, or kink-related. "
-        "Do NOT repeat the date/time/venue.\n"
-        "Notes: Return up to 280 characters. Include extra details that didn’t fit in the description, like dress code, accessibility, theme, ticket info, or performances. "
-        "If relevant, include safety policies (e.g. 'Consent required', '19+', 'Kink/fetish positive'). "
-        "Deduplicate repeated sentences. Skip marketing fluff."
-    )
-
-
-    user_content = f"Schema:\n{json.dumps(SCHEMA)}\n\nAnnouncement:\n{announcement}"
+async def _validated(payload: dict, content: str, tz_name: str) -> tuple[dict, str]:
+    """
+    Model output -> fields that pass EventOut, plus how they were obtained
+    ("ok", "repaired_local" or "repaired_llm"). Local fixes come first; only
+    fields still missing or invalid after that are asked for again.
+    """
+    faults: list[str] = []
+    data = repair.parse_json(content, faults)
+    if data is not None:
+        fields, bad = repair.coerce(data, tz_name, faults)
+        if not bad:
+            return fields, ("repaired_local" if faults else "ok")
+    else:
+        fields, bad = {}, None
+
+    try:
+        resp = await _chat(repair.followup_payload(payload, content, bad))
+    except Exception:
+        metrics.EXTRACTIONS.labels("llm_error").inc()
+        raise
+    more = repair.parse_json(resp["message"]["content"], faults) or {}
+    # Re-check the already coerced fields with the answers filled in
+    fields, bad = repair.coerce({**fields, **more}, tz_name, faults)
+    if bad:
+        metrics.EXTRACTIONS.labels("invalid_output").inc()
+        raise ValueError(f"The model's answer is missing or has invalid {', '.join(bad)}, even after a retry.")
+    return fields, "repaired_llm"
+
+async def extract_event(
+    announcement: str,
+    ref_date: str,
+    tz_name: str = "America/Vancouver",
+    on_fields: Callable[[dict], Awaitable[None]] | None = None,
+) -> dict:
+    """
+    Extract and normalize one event from an announcement.
+
+    The top-level start/end are its first date; "occurrences" holds every date
+    ({"start_ts_utc", "end_ts_utc"}), one entry for a single-date event. See
+    occurrence_events(). If on_fields is given the model output is streamed, and on_fields is
+    awaited with the raw fields (title, start_iso, ...) as they complete.
+    """
+    # Results are cached under the model that wrote them. With endpoints serving
+    # different models any of them may answer, so any of their entries will do.
+    for model in llm_router.models(MODEL):
+        cached = await extract_cache.get(extract_cache.make_key(announcement, ref_date, tz_name, model, PROMPT_VERSION))
+        if cached is not None:
+            metrics.EXTRACTIONS.labels("cache_hit").inc()
+            return cached
+
+    built = prompt.build(announcement, ref_date, tz_name)
+    if built.truncated:
+        metrics.PROMPT_TRUNCATED.inc()
+    metrics.PROMPT_TOKENS.observe(built.input_tokens)
     payload = {
         "model": MODEL,
-        "messages": [
-            {"role":"system","content": system},
-            {"role":"user","content": user_content}
-        ],
-        "options": {"temperature": 0, "num_predict": 256, "num_ctx": 4096},
+        "messages": built.messages,
+        "options": built.options,
         "format": "json",
         "stream": False
     }
 
-    async with httpx.AsyncClient(timeout=60) as client:
-        r = await client.post(f"{OLLAMA}/api/chat", json=payload)
-        r.raise_for_status()
-        data = json.loads(r.json()["message"]["content"])
-
-    # validate and normalize
+    try:
+        if on_fields is None:
+            resp = await _chat(payload)
+            content, model = resp["message"]["content"], resp.get("model") or MODEL
+        else:
+            content, model = await _chat_stream(payload, on_fields)
+    except Exception:
+        metrics.EXTRACTIONS.labels("llm_error").inc()
+        raise
+    data, outcome = await _validated(payload, content, tz_name)
     evt = EventOut.model_validate(data)
-    start_utc = _to_utc(evt.start_iso)
-    end_utc = _roll_end_if_needed(evt.start_iso, evt.end_iso, tz_name)
+    metrics.EXTRACTIONS.labels(outcome).inc()
+    occurrences = recurrence.expand(evt.start_iso, evt.end_iso, evt.rrule, evt.occurrences, tz_name, ref_date)
+    if len(occurrences) > 1:
+        metrics.EXTRACT_OCCURRENCES.observe(len(occurrences))
+    start_utc, end_utc = occurrences[0]
 
     # also compute display-local strings
-    start_local = _fmt_local(evt.start_iso, tz_name)
-    end_local = _fmt_local(evt.end_iso, tz_name) if end_utc else None
+    start_local = _fmt_local(start_utc, tz_name)
+    end_local = _fmt_local(end_utc, tz_name)
 
-    return {
+    result = {
         "title": evt.title.strip(),
         "start_ts_utc": start_utc,
         "end_ts_utc": end_utc,
@@ -110,5 +264,13 @@ async def extract_event(announcement: str, ref_date: str, tz_name: str = "Americ
         "capacity": evt.capacity,
         "description": evt.description,
         "notes": evt.notes,
-        "raw": data
+        "raw": data,
+        "occurrences": [{"start_ts_utc": s, "end_ts_utc": e} for s, e in occurrences],
     }
+    cache_key = extract_cache.make_key(announcement, ref_date, tz_name, model, PROMPT_VERSION)
+    await extract_cache.put(cache_key, model, PROMPT_VERSION, result)
+    return result
+
+def occurrence_events(event: dict) -> list[dict]:
+    """One normalized event per date of an extract_event() result, first date first."""
+    return [{**event, **o} for o in event.get("occurrences") or [{}]]
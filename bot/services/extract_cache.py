@@ -0,0 +1,82 @@
+import os, json, time, hashlib, logging, unicodedata
+from collections import OrderedDict
+
+from services import db, metrics
+
+log = logging.getLogger(__name__)
+
+# Extraction is deterministic (temperature 0), so identical inputs can skip the LLM.
+# Tier 1: in-process LRU. Tier 2: the extract_cache table, which survives restarts.
+EXTRACT_CACHE_SIZE = int(os.getenv("EXTRACT_CACHE_SIZE", "512"))          # entries kept in memory
+EXTRACT_CACHE_TTL  = float(os.getenv("EXTRACT_CACHE_TTL", str(7 * 86400)))  # seconds, both tiers
+PRUNE_INTERVAL = 3600  # seconds between deletes of expired rows
+
+_lru: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()  # key -> (expires_at monotonic, result)
+_last_prune = 0.0
+
+stats = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+
+def _normalize(text: str) -> str:
+    # Reposts differ in Unicode forms, trailing spaces and blank lines, not in content
+    text = unicodedata.normalize("NFKC", text)
+    lines = [" ".join(line.split()) for line in text.splitlines()]
+    return "\n".join(line for line in lines if line)
+
+def make_key(announcement: str, ref_date: str, tz_name: str, model: str, prompt_version: str) -> str:
+    h = hashlib.sha256()
+    for part in (prompt_version, model, tz_name, ref_date, _normalize(announcement)):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def _remember(key: str, result: dict, ttl: float) -> None:
+    _lru[key] = (time.monotonic() + ttl, result)
+    _lru.move_to_end(key)
+    while len(_lru) > EXTRACT_CACHE_SIZE:
+        _lru.popitem(last=False)
+
+def _copy(result: dict) -> dict:
+    # Callers may mutate what they get back; never hand out the cached object
+    return json.loads(json.dumps(result))
+
+async def get(key: str) -> dict | None:
+    entry = _lru.get(key)
+    if entry is not None:
+        expires_at, result = entry
+        if expires_at > time.monotonic():
+            _lru.move_to_end(key)
+            stats["memory_hits"] += 1
+            metrics.EXTRACT_CACHE.labels("memory_hit").inc()
+            return _copy(result)
+        del _lru[key]
+
+    try:
+        row = await db.get_cached_extraction(key, EXTRACT_CACHE_TTL)
+    except Exception:
+        log.warning("extract cache lookup failed", exc_info=True)
+        row = None
+    if row is None:
+        stats["misses"] += 1
+        metrics.EXTRACT_CACHE.labels("miss").inc()
+        return None
+
+    stats["db_hits"] += 1
+    metrics.EXTRACT_CACHE.labels("db_hit").inc()
+    _remember(key, row["result"], EXTRACT_CACHE_TTL - row["age"])
+    return _copy(row["result"])
+
+async def put(key: str, model: str, prompt_version: str, result: dict) -> None:
+    global _last_prune
+    _remember(key, _copy(result), EXTRACT_CACHE_TTL)
+    try:
+        await db.put_cached_extraction(key, model, prompt_version, result)
+        if time.monotonic() - _last_prune > PRUNE_INTERVAL:
+            _last_prune = time.monotonic()
+            await db.prune_extraction_cache(EXTRACT_CACHE_TTL)
+    except Exception:
+        log.warning("extract cache store failed", exc_info=True)
+
+async def purge() -> int:
+    """Drop both tiers. Returns the number of rows deleted from Postgres."""
+    _lru.clear()
+    return await db.purge_extraction_cache()
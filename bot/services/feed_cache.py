@@ -0,0 +1,24 @@
+from services.invalidation import Generation
+
+# Calendar feeds keyed by their query (terms, window): ETag plus the rendered body.
+# Entries are dropped on every events write (invalidation.Generation), so while
+# nothing changes a conditional GET is answered from memory without touching
+# Postgres. The body is rendered lazily: a 304 only needs the ETag.
+MAX_ENTRIES = 256  # distinct feed queries kept
+
+_entries: dict[tuple, tuple[str, bytes | None]] = {}
+_generation = Generation(lambda ids: _entries.clear())
+
+def generation() -> int:
+    """Take this before querying and pass it to put(), so a write racing the query is not cached over."""
+    return _generation.current()
+
+def get(key: tuple) -> tuple[str, bytes | None] | None:
+    return _entries.get(key)
+
+def put(key: tuple, etag: str, body: bytes | None, generation: int) -> None:
+    if not _generation.unchanged(generation):
+        return
+    if key not in _entries and len(_entries) >= MAX_ENTRIES:
+        _entries.pop(next(iter(_entries)))
+    _entries[key] = (etag, body)
@@ -0,0 +1,60 @@
+import os
+from datetime import datetime, timezone
+
+# Minimal RFC 5545 writer for the calendar feed served by web.py
+
+PRODID = "-//telegram_event_llm_bot//events feed//EN"
+# UIDs must never change, or calendar apps show every event twice
+UID_DOMAIN = os.getenv("FEED_UID_DOMAIN", "telegram-event-bot")
+
+def _escape(text: str) -> str:
+    return (text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+                .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+def _fold(line: str) -> str:
+    # Content lines are at most 75 octets; continuation lines start with a space
+    data = line.encode("utf-8")
+    if len(data) <= 75:
+        return line
+    parts, start, limit = [], 0, 75
+    while start < len(data):
+        end = min(start + limit, len(data))
+        while end < len(data) and (data[end] & 0xC0) == 0x80:
+            end -= 1  # don't split a UTF-8 sequence
+        parts.append(data[start:end].decode("utf-8"))
+        start, limit = end, 74
+    return "\r\n ".join(parts)
+
+def _utc(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+def render_calendar(rows: list[dict], name: str) -> bytes:
+    """A VCALENDAR with one VEVENT per row (rows as returned by feed_events)."""
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{_escape(name)}",
+    ]
+    for r in rows:
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:event-{r['id']}@{UID_DOMAIN}",
+            f"DTSTAMP:{_utc(r['updated_at'])}",
+            f"LAST-MODIFIED:{_utc(r['updated_at'])}",
+            f"CREATED:{_utc(r['created_at'])}",
+            f"DTSTART:{_utc(r['start_ts'])}",
+        ]
+        if r["end_ts"]:
+            lines.append(f"DTEND:{_utc(r['end_ts'])}")
+        lines.append(f"SUMMARY:{_escape(r['title'])}")
+        if r.get("location"):
+            lines.append(f"LOCATION:{_escape(r['location'])}")
+        details = "\n\n".join(x for x in (r.get("description"), r.get("notes")) if x)
+        if details:
+            lines.append(f"DESCRIPTION:{_escape(details)}")
+        lines.append("END:VEVENT")
+    lines.append("END:VCALENDAR")
+    return ("\r\n".join(_fold(line) for line in lines) + "\r\n").encode("utf-8")
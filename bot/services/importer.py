@@ -0,0 +1,159 @@
+import os, json, time, asyncio
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Iterable, Iterator
+from zoneinfo import ZoneInfo
+from datetime import datetime
+
+from services.extract import extract_event, occurrence_events
+from services.db import upsert_events
+
+IMPORT_WORKERS    = int(os.getenv("IMPORT_WORKERS", "4"))
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "50"))
+DEFAULT_DELIMITER = "---"
+MIN_LENGTH = 40  # shorter messages ("see you there!") are chatter, not announcements
+
+@dataclass
+class ImportItem:
+    index: int
+    text: str
+    ref_date: str | None = None   # date the announcement was posted, if known
+
+@dataclass
+class ImportResult:
+    total: int = 0        # read from the file so far
+    processed: int = 0    # extracted or failed, possibly not written yet
+    saved: int = 0
+    failed: list[tuple[int, str, str]] = field(default_factory=list)  # (index, first line, error)
+    started: float = field(default_factory=time.monotonic)
+
+    def summary(self, max_failures: int = 10) -> str:
+        elapsed = time.monotonic() - self.started
+        lines = [f"Import finished in {elapsed:.0f}s: {self.saved} saved, {len(self.failed)} failed, {self.total} read."]
+        for index, head, err in self.failed[:max_failures]:
+            lines.append(f"#{index} {head[:40]!r}: {err[:100]}")
+        if len(self.failed) > max_failures:
+            lines.append(f"… and {len(self.failed) - max_failures} more failures")
+        return "\n".join(lines)
+
+def _export_text(text) -> str:
+    # Telegram exports store formatted text as a list of plain strings and entity dicts
+    if isinstance(text, str):
+        return text
+    return "".join(part if isinstance(part, str) else part.get("text", "") for part in text)
+
+def parse_telegram_export(data: bytes) -> Iterator[ImportItem]:
+    """Announcements from a Telegram Desktop chat export (result.json)."""
+    # Checked here, not in the generator, so a wrong file fails before the import starts
+    export = json.loads(data)
+    if not isinstance(export, dict) or not isinstance(export.get("messages", []), list):
+        raise ValueError("not a Telegram chat export (expected an object with a \"messages\" list)")
+    return _export_items(export.get("messages", []))
+
+def _export_items(messages: list) -> Iterator[ImportItem]:
+    index = 0
+    for msg in messages:
+        if not isinstance(msg, dict) or msg.get("type") != "message":
+            continue
+        text = _export_text(msg.get("text", "")).strip()
+        if len(text) < MIN_LENGTH:
+            continue
+        index += 1
+        posted = msg.get("date")  # local time of the export, e.g. "2025-06-01T18:04:11"
+        yield ImportItem(index, text, posted[:10] if posted else None)
+
+def parse_delimited(data: bytes, delimiter: str = DEFAULT_DELIMITER) -> Iterator[ImportItem]:
+    """Announcements from a text file, one per block, blocks separated by a line equal to delimiter."""
+    index = 0
+    block: list[str] = []
+    for line in data.decode("utf-8", errors="replace").splitlines() + [delimiter]:
+        if line.strip() != delimiter:
+            block.append(line)
+            continue
+        text = "\n".join(block).strip()
+        block = []
+        if len(text) >= MIN_LENGTH:
+            index += 1
+            yield ImportItem(index, text)
+
+def parse_file(data: bytes, filename: str, delimiter: str = DEFAULT_DELIMITER) -> Iterator[ImportItem]:
+    if filename.lower().endswith(".json"):
+        return parse_telegram_export(data)
+    return parse_delimited(data, delimiter)
+
+async def run_import(
+    items: Iterable[ImportItem],
+    tz_name: str,
+    on_progress: Callable[[ImportResult], Awaitable[None]] | None = None,
+    workers: int = IMPORT_WORKERS,
+    batch_size: int = IMPORT_BATCH_SIZE,
+) -> ImportResult:
+    """
+    Extract and store many announcements.
+
+    A bounded queue feeds `workers` extraction tasks (the Ollama client's own
+    in-flight limit still applies), and a single writer upserts their results
+    in batches of `batch_size`. on_progress is awaited after every processed
+    item; callers throttle their own output.
+    """
+    result = ImportResult()
+    today = datetime.now(ZoneInfo(tz_name)).date().isoformat()
+    todo: asyncio.Queue = asyncio.Queue(maxsize=workers * 2)
+    extracted: asyncio.Queue = asyncio.Queue(maxsize=batch_size * 2)
+
+    async def produce():
+        for item in items:
+            result.total += 1
+            await todo.put(item)
+        for _ in range(workers):
+            await todo.put(None)
+
+    async def work():
+        while (item := await todo.get()) is not None:
+            try:
+                event = await extract_event(item.text, ref_date=item.ref_date or today, tz_name=tz_name)
+                event["source_text"] = item.text  # lets later pastes of it be recognised as duplicates
+                await extracted.put((item, event, None))
+            except Exception as e:
+                await extracted.put((item, None, str(e) or type(e).__name__))
+
+    async def flush(batch):
+        try:
+            await upsert_events([e for _, event in batch for e in occurrence_events(event)])
+            result.saved += len(batch)
+        except Exception as e:
+            if len(batch) > 1:
+                # One bad row fails the whole statement; retry one by one so
+                # only the real offender is reported
+                for entry in batch:
+                    await flush([entry])
+                return
+            item, _ = batch[0]
+            result.failed.append((item.index, item.text.splitlines()[0], f"DB save failed: {e}"))
+
+    async def write():
+        batch = []
+        while (entry := await extracted.get()) is not None:
+            item, event, err = entry
+            result.processed += 1
+            if err is not None:
+                result.failed.append((item.index, item.text.splitlines()[0], err))
+            else:
+                batch.append((item, event))
+            if len(batch) >= batch_size:
+                await flush(batch)
+                batch = []
+            if on_progress:
+                await on_progress(result)
+        if batch:
+            await flush(batch)
+
+    writer = asyncio.create_task(write())
+    pipeline = [asyncio.create_task(produce())] + [asyncio.create_task(work()) for _ in range(workers)]
+    try:
+        await asyncio.gather(*pipeline)
+        await extracted.put(None)
+        await writer
+    finally:
+        for task in pipeline + [writer]:
+            task.cancel()
+    return result
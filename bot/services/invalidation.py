@@ -0,0 +1,27 @@
+from typing import Callable
+
+from services import db
+
+class Generation:
+    """
+    Invalidation for a cache of query results over events: on every events
+    write (db.add_change_listener) the counter moves on and `drop(ids)` removes
+    the entries that may now be stale.
+    """
+
+    def __init__(self, drop: Callable[[set[int] | None], None]):
+        self.value = 0
+        self._drop = drop
+        db.add_change_listener(self._on_events_changed)
+
+    def _on_events_changed(self, ids: set[int] | None) -> None:
+        self.value += 1
+        self._drop(ids)
+
+    def current(self) -> int:
+        """Take this before querying and check it with unchanged() before caching the result."""
+        return self.value
+
+    def unchanged(self, generation: int) -> bool:
+        """False if events were written since `generation`: the result may already be stale."""
+        return generation == self.value
@@ -0,0 +1,27 @@
+from datetime import datetime, timezone
+
+from services.invalidation import Generation
+
+# Rendered /list replies keyed by (limit, tz name). An entry is dropped when
+# events are written (see invalidation.Generation) and when its first event
+# starts, since that event then falls out of the `start_ts >= now()` window.
+_entries: dict[tuple[int, str], tuple[str, datetime | None]] = {}
+_generation = Generation(lambda ids: _entries.clear())
+
+def generation() -> int:
+    """Take this before querying and pass it to put(), so a write racing the query is not cached over."""
+    return _generation.current()
+
+def get(limit: int, tz_name: str) -> str | None:
+    entry = _entries.get((limit, tz_name))
+    if entry is None:
+        return None
+    text, expires_at = entry
+    if expires_at is not None and expires_at <= datetime.now(timezone.utc):
+        del _entries[(limit, tz_name)]
+        return None
+    return text
+
+def put(limit: int, tz_name: str, text: str, expires_at: datetime | None, generation: int) -> None:
+    if _generation.unchanged(generation):
+        _entries[(limit, tz_name)] = (text, expires_at)
@@ -0,0 +1,315 @@
+import os, json, time, random, asyncio, logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable
+import httpx
+
+from services import metrics
+
+log = logging.getLogger(__name__)
+
+# Ollama servers to spread generations over: comma-separated "url" or "url=model"
+# (that box runs a different model than LLM_MODEL). Empty: only OLLAMA_BASE_URL.
+OLLAMA_ENDPOINTS = os.getenv("OLLAMA_ENDPOINTS", "")
+
+# HTTP connection pool to each endpoint
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "8"))
+OLLAMA_MAX_KEEPALIVE   = int(os.getenv("OLLAMA_MAX_KEEPALIVE", "4"))
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+OLLAMA_READ_TIMEOUT    = float(os.getenv("OLLAMA_READ_TIMEOUT", "120"))  # one generation, once it has started
+# Generations allowed in flight at once per endpoint; match the server's OLLAMA_NUM_PARALLEL.
+# Extra requests wait their turn here instead of timing out inside Ollama.
+OLLAMA_MAX_INFLIGHT    = int(os.getenv("OLLAMA_MAX_INFLIGHT", "1"))
+OLLAMA_QUEUE_TIMEOUT   = float(os.getenv("OLLAMA_QUEUE_TIMEOUT", "300"))  # max wait for a free slot
+# How long Ollama keeps the model loaded after a request ("30m", "24h", or -1 for
+# forever), sent with every request so an idle evening doesn't unload it
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+OLLAMA_HEALTH_INTERVAL  = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "10"))   # seconds between probes
+OLLAMA_BREAKER_FAILURES = int(os.getenv("OLLAMA_BREAKER_FAILURES", "3"))     # consecutive failures that open the circuit
+OLLAMA_BREAKER_COOLDOWN = float(os.getenv("OLLAMA_BREAKER_COOLDOWN", "30"))  # seconds before one trial request
+# A blocking request still running after this percentile of its endpoint's recent
+# latencies is also sent to an idle endpoint; the first answer wins. 0 disables.
+OLLAMA_HEDGE_PERCENTILE = float(os.getenv("OLLAMA_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = 20   # latencies needed before hedging from an endpoint
+LATENCY_WINDOW = 200     # recent latencies kept per endpoint
+
+NO_ENDPOINT = "No LLM server is available right now; try again in a minute."
+
+class Endpoint:
+    def __init__(self, url: str, model: str | None):
+        self.url = url
+        self.model = model
+        self.client = httpx.AsyncClient(
+            base_url=url,
+            timeout=httpx.Timeout(
+                connect=OLLAMA_CONNECT_TIMEOUT,
+                read=OLLAMA_READ_TIMEOUT,
+                write=OLLAMA_CONNECT_TIMEOUT,
+                pool=OLLAMA_CONNECT_TIMEOUT,
+            ),
+            limits=httpx.Limits(
+                max_connections=OLLAMA_MAX_CONNECTIONS,
+                max_keepalive_connections=OLLAMA_MAX_KEEPALIVE,
+            ),
+        )
+        self.slots = asyncio.Semaphore(OLLAMA_MAX_INFLIGHT)
+        self.outstanding = 0            # waiting for a slot or generating
+        self.up = True                  # last health probe answered
+        self.failures = 0               # consecutive failed requests
+        self.open_until = 0.0           # circuit open (no traffic) until this monotonic time
+        self.trial = False              # a half-open trial request is in flight
+        self.latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def available(self) -> bool:
+        if not self.up:
+            return False
+        if self.failures < OLLAMA_BREAKER_FAILURES:
+            return True
+        # Open circuit: after the cooldown, let exactly one request through
+        return time.monotonic() >= self.open_until and not self.trial
+
+    def hedge_delay(self) -> float | None:
+        if OLLAMA_HEDGE_PERCENTILE <= 0 or len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        k = min(len(ordered) - 1, int(len(ordered) * OLLAMA_HEDGE_PERCENTILE / 100))
+        return ordered[k]
+
+    def succeeded(self, latency: float | None = None) -> None:
+        if self.failures >= OLLAMA_BREAKER_FAILURES:
+            log.info("LLM endpoint %s recovered; closing circuit", self.url)
+        self.failures = 0
+        self.trial = False
+        metrics.LLM_BREAKER_OPEN.labels(self.url).set(0)
+        if latency is not None:
+            self.latencies.append(latency)
+
+    def failed(self) -> None:
+        self.failures += 1
+        self.trial = False
+        if self.failures >= OLLAMA_BREAKER_FAILURES:
+            self.open_until = time.monotonic() + OLLAMA_BREAKER_COOLDOWN
+            metrics.LLM_BREAKER_OPEN.labels(self.url).set(1)
+            log.warning("LLM endpoint %s failed %d times in a row; circuit open for %.0fs",
+                        self.url, self.failures, OLLAMA_BREAKER_COOLDOWN)
+
+_endpoints: list[Endpoint] = []
+_health_task: asyncio.Task | None = None
+
+def _parse_endpoints(spec: str, default_url: str) -> list[tuple[str, str | None]]:
+    parsed = []
+    for item in (spec or default_url).split(","):
+        url, _, model = item.strip().partition("=")
+        if url:
+            parsed.append((url.rstrip("/"), model or None))
+    return parsed
+
+async def open_endpoints(default_url: str) -> None:
+    """Create a client per endpoint and start health checks. Call once at startup."""
+    global _health_task
+    if _endpoints:
+        return
+    for url, model in _parse_endpoints(OLLAMA_ENDPOINTS, default_url):
+        _endpoints.append(Endpoint(url, model))
+        metrics.LLM_ENDPOINT_UP.labels(url).set(1)
+    if len(_endpoints) > 1:
+        _health_task = asyncio.create_task(_health_checks())
+
+async def close_endpoints() -> None:
+    global _health_task
+    if _health_task is not None:
+        _health_task.cancel()
+        _health_task = None
+    for ep in _endpoints:
+        await ep.client.aclose()
+    _endpoints.clear()
+
+def is_open() -> bool:
+    return bool(_endpoints)
+
+def models(default: str) -> list[str]:
+    """Every model the pool may answer with, `default` (LLM_MODEL) first."""
+    found = [default]
+    for ep in _endpoints:
+        if (ep.model or default) not in found:
+            found.append(ep.model)
+    return found
+
+async def _probe(ep: Endpoint) -> None:
+    try:
+        r = await ep.client.get("/api/version", timeout=OLLAMA_CONNECT_TIMEOUT)
+        r.raise_for_status()
+        up = True
+    except httpx.HTTPError:
+        up = False
+    if up != ep.up:
+        log.warning("LLM endpoint %s is %s", ep.url, "up" if up else "down")
+    ep.up = up
+    metrics.LLM_ENDPOINT_UP.labels(ep.url).set(int(up))
+
+async def _health_checks() -> None:
+    # With a single endpoint there is nowhere else to go, so this only runs for pools
+    while True:
+        await asyncio.gather(*(_probe(ep) for ep in _endpoints))
+        await asyncio.sleep(OLLAMA_HEALTH_INTERVAL)
+
+def _pick(exclude: set[Endpoint], idle_only: bool = False) -> Endpoint | None:
+    """Least outstanding requests among available endpoints; ties broken at random."""
+    candidates = [ep for ep in _endpoints if ep not in exclude and ep.available()]
+    if idle_only:
+        candidates = [ep for ep in candidates if ep.outstanding < OLLAMA_MAX_INFLIGHT]
+    if not candidates:
+        return None
+    least = min(ep.outstanding for ep in candidates)
+    ep = random.choice([ep for ep in candidates if ep.outstanding == least])
+    if ep.failures >= OLLAMA_BREAKER_FAILURES:
+        ep.trial = True  # half-open
+    return ep
+
+def _keep_alive() -> str | int:
+    # Ollama takes a duration string or a number of seconds (negative: never unload)
+    try:
+        return int(OLLAMA_KEEP_ALIVE)
+    except ValueError:
+        return OLLAMA_KEEP_ALIVE
+
+def _body(ep: Endpoint, payload: dict, **extra) -> dict:
+    return {**payload, "model": ep.model or payload["model"], "keep_alive": _keep_alive(), **extra}
+
+@asynccontextmanager
+async def _slot(ep: Endpoint):
+    queued_at = time.perf_counter()
+    metrics.LLM_QUEUED.labels(ep.url).inc()
+    try:
+        await asyncio.wait_for(ep.slots.acquire(), OLLAMA_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise RuntimeError("The model is busy with other announcements; try again in a few minutes.")
+    finally:
+        metrics.LLM_QUEUED.labels(ep.url).dec()
+    metrics.LLM_QUEUE_WAIT.observe(time.perf_counter() - queued_at)
+    metrics.LLM_IN_FLIGHT.labels(ep.url).inc()
+    try:
+        yield
+    finally:
+        metrics.LLM_IN_FLIGHT.labels(ep.url).dec()
+        ep.slots.release()
+
+async def _call(ep: Endpoint, payload: dict, record: bool = True) -> dict:
+    started = time.perf_counter()
+    try:
+        async with _slot(ep):
+            with metrics.span("llm.chat", endpoint=ep.url):
+                r = await ep.client.post("/api/chat", json=_body(ep, payload))
+                r.raise_for_status()
+                resp = r.json()
+    except (httpx.HTTPError, ValueError):
+        ep.failed()
+        raise
+    except BaseException:
+        # Lost a hedge race, or waited too long for a slot: says nothing about the endpoint
+        ep.trial = False
+        raise
+    ep.succeeded(time.perf_counter() - started if record else None)
+    return resp
+
+def _start(ep: Endpoint, payload: dict, record: bool = True) -> asyncio.Future:
+    # Count the request against the endpoint now, not when the task first runs,
+    # so a burst of picks made in the same tick still spreads out
+    ep.outstanding += 1
+    task = asyncio.ensure_future(_call(ep, payload, record))
+    task.add_done_callback(lambda _: setattr(ep, "outstanding", ep.outstanding - 1))
+    return task
+
+async def chat(payload: dict) -> dict:
+    """
+    POST /api/chat (stream=False) to the least busy endpoint and return the response JSON.
+
+    Endpoint errors fail over to the next endpoint. A request slower than the
+    endpoint's usual latency is hedged to an idle endpoint; the loser is
+    cancelled, which makes Ollama stop generating for it.
+    """
+    tried: set[Endpoint] = set()
+    last_error: BaseException | None = None
+    while (ep := _pick(tried)) is not None:
+        tried.add(ep)
+        pending = {_start(ep, payload)}
+        try:
+            delay = ep.hedge_delay()
+            if delay is not None:
+                done, _ = await asyncio.wait(pending, timeout=delay)
+                if not done and (other := _pick(tried, idle_only=True)) is not None:
+                    tried.add(other)
+                    metrics.LLM_HEDGES.inc()
+                    pending.add(_start(other, payload))
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+        metrics.LLM_FAILOVERS.inc()
+    if last_error is not None:
+        raise last_error
+    raise RuntimeError(NO_ENDPOINT)
+
+async def chat_stream(payload: dict, on_chunk: Callable[[dict], Awaitable[bool]]) -> None:
+    """
+    Stream /api/chat from the least busy endpoint, awaiting on_chunk(chunk) for
+    each NDJSON object until it returns True or the stream ends.
+
+    Fails over to another endpoint only while nothing has been delivered yet;
+    streams are not hedged, since on_chunk has side effects.
+    """
+    tried: set[Endpoint] = set()
+    last_error: BaseException | None = None
+    while (ep := _pick(tried)) is not None:
+        tried.add(ep)
+        delivered = False
+        ep.outstanding += 1
+        try:
+            async with _slot(ep):
+                with metrics.span("llm.chat_stream", endpoint=ep.url):
+                    async with ep.client.stream("POST", "/api/chat", json=_body(ep, payload, stream=True)) as r:
+                        r.raise_for_status()
+                        async for line in r.aiter_lines():
+                            if not line.strip():
+                                continue
+                            chunk = json.loads(line)
+                            delivered = True
+                            if await on_chunk(chunk):
+                                break
+        except (httpx.HTTPError, json.JSONDecodeError) as e:
+            ep.failed()
+            if delivered:
+                raise
+            last_error = e
+            metrics.LLM_FAILOVERS.inc()
+            continue
+        except BaseException:
+            ep.trial = False
+            raise
+        finally:
+            ep.outstanding -= 1
+        ep.succeeded()
+        return
+    if last_error is not None:
+        raise last_error
+    raise RuntimeError(NO_ENDPOINT)
+
+async def warm_up(payload: dict, timeout: float) -> dict[str, tuple[float, dict] | None]:
+    """Send `payload` to every endpoint at once. Returns url -> (seconds, response), or None where it failed."""
+    async def one(ep: Endpoint):
+        started = time.perf_counter()
+        try:
+            # A model load is no sample of normal latency; keep it out of the hedge percentile
+            resp = await asyncio.wait_for(_start(ep, payload, record=False), timeout)
+        except Exception:
+            log.warning("warming up %s failed", ep.url, exc_info=True)
+            return None
+        return time.perf_counter() - started, resp
+    results = await asyncio.gather(*(one(ep) for ep in _endpoints))
+    return {ep.url: result for ep, result in zip(_endpoints, results)}
@@ -0,0 +1,132 @@
+import os, json, time, uuid, logging, functools, contextvars
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+# Prometheus metrics for the LLM, DB and handler hot paths, served on /metrics
+# by web.py. Set TRACE_SPANS=1 to also log one JSON line per span, grouped by
+# a trace id per update.
+TRACE_SPANS = os.getenv("TRACE_SPANS", "0") == "1"
+
+trace_log = logging.getLogger("trace")
+_trace_id: contextvars.ContextVar[str | None] = contextvars.ContextVar("trace_id", default=None)
+
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+# --- LLM (values reported by Ollama, plus what we observe client-side)
+LLM_LABELS = ("model", "prompt_version")
+LLM_TOTAL = Histogram("llm_total_duration_seconds", "Ollama total_duration", LLM_LABELS, buckets=LLM_BUCKETS)
+LLM_LOAD = Histogram("llm_load_duration_seconds", "Ollama load_duration (model load)", LLM_LABELS, buckets=LLM_BUCKETS)
+LLM_PROMPT_EVAL = Histogram("llm_prompt_eval_duration_seconds", "Ollama prompt_eval_duration", LLM_LABELS, buckets=LLM_BUCKETS)
+LLM_EVAL = Histogram("llm_eval_duration_seconds", "Ollama eval_duration (generation)", LLM_LABELS, buckets=LLM_BUCKETS)
+LLM_PROMPT_TOKENS = Counter("llm_prompt_tokens", "Ollama prompt_eval_count", LLM_LABELS)
+LLM_EVAL_TOKENS = Counter("llm_eval_tokens", "Ollama eval_count", LLM_LABELS)
+LLM_REQUEST = Histogram("llm_request_seconds", "Wall time of one generation, including queueing, failover and hedging", ("model", "prompt_version", "mode"), buckets=LLM_BUCKETS)
+LLM_FIRST_TOKEN = Histogram("llm_first_token_seconds", "Time to first streamed token", LLM_LABELS, buckets=LLM_BUCKETS)
+LLM_QUEUE_WAIT = Histogram("llm_queue_wait_seconds", "Wait for a generation slot", buckets=LLM_BUCKETS)
+LLM_QUEUED = Gauge("llm_queued_requests", "Requests waiting for a generation slot", ("endpoint",))
+LLM_IN_FLIGHT = Gauge("llm_in_flight_requests", "Generations currently running", ("endpoint",))
+LLM_ENDPOINT_UP = Gauge("llm_endpoint_up", "Last health probe of an Ollama endpoint succeeded", ("endpoint",))
+LLM_BREAKER_OPEN = Gauge("llm_endpoint_circuit_open", "Endpoint taken out of rotation after repeated failures", ("endpoint",))
+LLM_HEDGES = Counter("llm_hedged_requests", "Slow requests duplicated to a second endpoint")
+LLM_FAILOVERS = Counter("llm_failovers", "Requests retried on another endpoint after an error")
+LLM_WARM_UP = Gauge("llm_warm_up_seconds", "Model preload at the last startup")
+PROMPT_TOKENS = Histogram("llm_prompt_estimated_tokens", "Estimated prompt size sent", buckets=(500, 750, 1000, 1500, 2000, 3000, 4000, 6000, 8000))
+PROMPT_TRUNCATED = Counter("llm_prompts_truncated", "Announcements cut down to fit the context window")
+EXTRACTIONS = Counter("extractions", "extract_event calls by outcome", ("outcome",))
+EXTRACT_FAULTS = Counter("extract_output_faults", "Problems found in model output, by kind", ("fault",))
+EXTRACT_CACHE = Counter("extract_cache_lookups", "Extraction cache lookups by result", ("result",))
+EXTRACT_OCCURRENCES = Histogram("extract_occurrences", "Dates per multi-date announcement", buckets=(2, 3, 4, 6, 8, 12, 16, 26))
+PAGE_CACHE = Counter("picker_page_cache_lookups", "Event picker page lookups: hit, prefetch (waited for one in flight) or miss", ("result",))
+
+# --- DB
+DB_QUERY = Histogram("db_query_seconds", "Time per data-layer call, including waiting for a connection", ("query",), buckets=FAST_BUCKETS)
+DB_ERRORS = Counter("db_query_errors", "Data-layer calls that raised", ("query",))
+DB_POOL_SIZE = Gauge("db_pool_connections", "Connections held by the pool")
+DB_POOL_AVAILABLE = Gauge("db_pool_available_connections", "Idle connections in the pool")
+DB_POOL_WAITING = Gauge("db_pool_waiting_requests", "Requests waiting for a pool connection")
+
+# --- Telegram handlers and update processing
+HANDLER = Histogram("handler_seconds", "Handler latency by command", ("handler",), buckets=FAST_BUCKETS + (10, 30))
+HANDLER_ERRORS = Counter("handler_errors", "Handlers that raised", ("handler",))
+UPDATES_IN_FLIGHT = Gauge("updates_in_flight", "Updates being processed")
+UPDATES_WAITING = Gauge("updates_waiting_for_chat", "Updates queued behind an earlier update of the same chat")
+PERSISTENCE_CONFLICTS = Counter("persistence_conflicts", "bot_state writes dropped because another process changed the row first", ("kind",))
+
+# --- Outbound Bot API calls
+SEND_WAIT = Histogram("telegram_send_wait_seconds", "Time a Bot API call waited for the rate limiter", buckets=FAST_BUCKETS + (10, 30))
+SEND_RETRIES = Counter("telegram_flood_retries", "Bot API calls retried after a 429 (RetryAfter)", ("endpoint",))
+EDITS_COALESCED = Counter("telegram_edits_coalesced", "Message edits dropped because a newer edit of the same message was queued")
+MESSAGE_PARTS = Counter("telegram_message_parts", "Extra messages sent because a reply was over Telegram's length limit")
+
+def render() -> tuple[bytes, str]:
+    """Body and content type for the /metrics endpoint."""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+def observe_ollama(resp: dict, model: str, prompt_version: str) -> None:
+    """Record the timing fields of a final Ollama response (durations are in nanoseconds)."""
+    labels = (model, prompt_version)
+    for field, hist in (("total_duration", LLM_TOTAL), ("load_duration", LLM_LOAD),
+                        ("prompt_eval_duration", LLM_PROMPT_EVAL), ("eval_duration", LLM_EVAL)):
+        if resp.get(field) is not None:
+            hist.labels(*labels).observe(resp[field] / 1e9)
+    if resp.get("prompt_eval_count") is not None:
+        LLM_PROMPT_TOKENS.labels(*labels).inc(resp["prompt_eval_count"])
+    if resp.get("eval_count") is not None:
+        LLM_EVAL_TOKENS.labels(*labels).inc(resp["eval_count"])
+
+def new_trace() -> None:
+    _trace_id.set(uuid.uuid4().hex[:16])
+
+@contextmanager
+def span(name: str, **attrs):
+    """Log a trace span (when TRACE_SPANS=1) around the block."""
+    if not TRACE_SPANS:
+        yield
+        return
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        trace_log.info(json.dumps({
+            "trace": _trace_id.get(), "span": name,
+            "ms": round((time.perf_counter() - start) * 1000, 2),
+            **({"error": error} if error else {}), **attrs,
+        }, default=str))
+
+def timed_query(query: str):
+    """Decorator for async data-layer functions."""
+    def wrap(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                with span(f"db.{query}"):
+                    return await func(*args, **kwargs)
+            except Exception:
+                DB_ERRORS.labels(query).inc()
+                raise
+            finally:
+                DB_QUERY.labels(query).observe(time.perf_counter() - start)
+        return wrapper
+    return wrap
+
+def timed_handler(name: str, func):
+    """Wrap a Telegram callback so its latency is recorded and it starts a new trace."""
+    @functools.wraps(func)
+    async def wrapper(update, context, *args, **kwargs):
+        new_trace()
+        start = time.perf_counter()
+        try:
+            with span(f"handler.{name}"):
+                return await func(update, context, *args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.labels(name).inc()
+            raise
+        finally:
+            HANDLER.labels(name).observe(time.perf_counter() - start)
+    return wrapper
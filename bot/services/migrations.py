@@ -0,0 +1,225 @@
+import logging
+
+log = logging.getLogger(__name__)
+
+# Versioned schema changes, applied in order by migrate() and recorded in
+# schema_migrations. Never edit a released step; append a new one. Steps use
+# IF NOT EXISTS so databases created by the old one-shot DDL adopt them cleanly.
+MIGRATIONS: list[tuple[int, str, str]] = [
+    (1, "events table", """
+CREATE TABLE IF NOT EXISTS events (
+  id SERIAL PRIMARY KEY,
+  title     TEXT NOT NULL,
+  start_ts  TIMESTAMPTZ NOT NULL,
+  end_ts    TIMESTAMPTZ,
+  location  TEXT,
+  capacity  INT,
+  description TEXT,
+  notes     TEXT,
+  raw       JSONB,
+  created_at TIMESTAMPTZ DEFAULT now(),
+  updated_at TIMESTAMPTZ DEFAULT now()
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_events_title_start ON events (lower(title), start_ts);
+"""),
+    (2, "keyset pagination indexes", """
+-- The event picker walks (sort column, id)
+ALTER TABLE events ALTER COLUMN created_at SET NOT NULL, ALTER COLUMN updated_at SET NOT NULL;
+CREATE INDEX IF NOT EXISTS ix_events_start_id   ON events (start_ts, id);
+CREATE INDEX IF NOT EXISTS ix_events_created_id ON events (created_at, id);
+CREATE INDEX IF NOT EXISTS ix_events_updated_id ON events (updated_at, id);
+"""),
+    (3, "extraction cache", """
+CREATE TABLE IF NOT EXISTS extract_cache (
+  key        TEXT PRIMARY KEY,        -- sha256 of normalized text + ref date + tz + model + prompt version
+  model      TEXT NOT NULL,
+  prompt_version TEXT NOT NULL,
+  result     JSONB NOT NULL,
+  created_at TIMESTAMPTZ DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS ix_extract_cache_created ON extract_cache (created_at);
+"""),
+    (4, "announcement text for near-duplicate detection", """
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+ALTER TABLE events ADD COLUMN IF NOT EXISTS source_text TEXT;
+CREATE INDEX IF NOT EXISTS ix_events_source_trgm ON events USING gin (source_text gin_trgm_ops);
+"""),
+    (5, "full-text search", """
+-- Weighted vector (title > location > description > notes), plus trigrams on
+-- location for misspelled venue names
+ALTER TABLE events ADD COLUMN IF NOT EXISTS search_tsv tsvector GENERATED ALWAYS AS (
+  setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+  setweight(to_tsvector('english', coalesce(location, '')), 'B') ||
+  setweight(to_tsvector('english', coalesce(description, '')), 'C') ||
+  setweight(to_tsvector('english', coalesce(notes, '')), 'D')
+) STORED;
+CREATE INDEX IF NOT EXISTS ix_events_search_tsv ON events USING gin (search_tsv);
+CREATE INDEX IF NOT EXISTS ix_events_location_trgm ON events USING gin (location gin_trgm_ops);
+"""),
+    (6, "digest subscribers and delivery log", """
+CREATE TABLE IF NOT EXISTS subscribers (
+  chat_id    BIGINT PRIMARY KEY,
+  tz         TEXT NOT NULL,           -- IANA name; the digest goes out at DIGEST_HOUR local time
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS ix_subscribers_tz_chat ON subscribers (tz, chat_id);
+-- One row per (day, timezone): the digest is rendered once and stored, so a
+-- resumed broadcast sends the same text
+CREATE TABLE IF NOT EXISTS digest_runs (
+  id          SERIAL PRIMARY KEY,
+  digest_date DATE NOT NULL,
+  tz          TEXT NOT NULL,
+  body        TEXT,                   -- NULL: nothing on, nothing to send
+  created_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
+  finished_at TIMESTAMPTZ,
+  UNIQUE (digest_date, tz)
+);
+CREATE TABLE IF NOT EXISTS digest_deliveries (
+  run_id  INT NOT NULL REFERENCES digest_runs (id) ON DELETE CASCADE,
+  chat_id BIGINT NOT NULL,
+  status  TEXT NOT NULL,              -- sent | gone (blocked the bot, chat deleted)
+  sent_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (run_id, chat_id)
+);
+"""),
+    (7, "bot persistence (chat_data, user_data, conversations)", """
+CREATE TABLE IF NOT EXISTS bot_state (
+  kind       TEXT NOT NULL,           -- chat_data | user_data | conversation:<handler name>
+  key        TEXT NOT NULL,           -- chat or user id; the conversation key as JSON
+  data       BYTEA NOT NULL,          -- pickle
+  keys       TEXT[] NOT NULL DEFAULT '{}',  -- non-empty top-level keys of a data dict
+  version    BIGINT NOT NULL DEFAULT 1,     -- bumped on every write; writes check it, reloads skip unchanged rows
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (kind, key)
+);
+CREATE INDEX IF NOT EXISTS ix_bot_state_keys ON bot_state USING gin (keys);
+"""),
+    (8, "partition events by month of start_ts", """
+-- One partition per UTC calendar month. Queries with a start_ts bound (/list,
+-- the feed, the digest) only touch the partitions in range; old partitions get
+-- their raw model output moved to events_raw_archive and can be detached.
+CREATE TABLE IF NOT EXISTS events_partitions (
+  month       DATE PRIMARY KEY,      -- first day of the month (UTC)
+  name        TEXT NOT NULL UNIQUE,
+  created_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
+  archived_at TIMESTAMPTZ,           -- raw last moved to events_raw_archive
+  detached_at TIMESTAMPTZ            -- no longer part of events; the table is kept
+);
+CREATE TABLE IF NOT EXISTS events_raw_archive (
+  id          INT NOT NULL,
+  start_ts    TIMESTAMPTZ NOT NULL,
+  raw         JSONB NOT NULL,
+  archived_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (id, start_ts)
+);
+
+ALTER TABLE events RENAME TO events_unpartitioned;
+ALTER SEQUENCE events_id_seq OWNED BY NONE;  -- survives the old table
+
+CREATE TABLE events (
+  id        INT NOT NULL DEFAULT nextval('events_id_seq'),
+  title     TEXT NOT NULL,
+  start_ts  TIMESTAMPTZ NOT NULL,
+  end_ts    TIMESTAMPTZ,
+  location  TEXT,
+  capacity  INT,
+  description TEXT,
+  notes     TEXT,
+  raw       JSONB,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  source_text TEXT,
+  search_tsv tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(location, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce(description, '')), 'C') ||
+    setweight(to_tsvector('english', coalesce(notes, '')), 'D')
+  ) STORED,
+  PRIMARY KEY (id, start_ts)          -- must include the partition key
+) PARTITION BY RANGE (start_ts);
+ALTER SEQUENCE events_id_seq OWNED BY events.id;  -- TRUNCATE ... RESTART IDENTITY still resets it
+
+-- Creates the partition holding `ts` if missing; the write paths call it when
+-- an insert finds no partition, and maintenance creates months ahead of time.
+CREATE OR REPLACE FUNCTION events_ensure_partition(ts TIMESTAMPTZ) RETURNS TEXT LANGUAGE plpgsql AS $fn$
+DECLARE
+  m         TIMESTAMP := date_trunc('month', ts AT TIME ZONE 'UTC');
+  part_name TEXT := 'events_' || to_char(m, 'YYYY_MM');
+  detached  TIMESTAMPTZ;
+BEGIN
+  SELECT detached_at INTO detached FROM events_partitions WHERE month = m::date;
+  IF FOUND AND detached IS NULL THEN
+    RETURN part_name;
+  END IF;
+  PERFORM pg_advisory_xact_lock(hashtext('events_ensure_partition'));
+  SELECT detached_at INTO detached FROM events_partitions WHERE month = m::date;
+  IF FOUND THEN
+    IF detached IS NOT NULL THEN
+      RAISE EXCEPTION 'events for % are archived (partition % was detached)', to_char(m, 'YYYY-MM'), part_name;
+    END IF;
+    RETURN part_name;
+  END IF;
+  EXECUTE format('CREATE TABLE %I PARTITION OF events FOR VALUES FROM (%L) TO (%L)',
+                 part_name, m AT TIME ZONE 'UTC', (m + interval '1 month') AT TIME ZONE 'UTC');
+  INSERT INTO events_partitions (month, name) VALUES (m::date, part_name);
+  RETURN part_name;
+END
+$fn$;
+
+SELECT events_ensure_partition(m)
+FROM (SELECT DISTINCT date_trunc('month', start_ts AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS m FROM events_unpartitioned
+      UNION SELECT now()) months;
+INSERT INTO events (id, title, start_ts, end_ts, location, capacity, description, notes, raw,
+                    created_at, updated_at, source_text)
+SELECT id, title, start_ts, end_ts, location, capacity, description, notes, raw,
+       created_at, updated_at, source_text
+FROM events_unpartitioned;
+DROP TABLE events_unpartitioned;
+
+-- Same indexes as before, now partitioned (one per partition, created with it)
+CREATE UNIQUE INDEX ux_events_title_start ON events (lower(title), start_ts);
+CREATE INDEX ix_events_start_id   ON events (start_ts, id);
+CREATE INDEX ix_events_created_id ON events (created_at, id);
+CREATE INDEX ix_events_updated_id ON events (updated_at, id);
+CREATE INDEX ix_events_source_trgm ON events USING gin (source_text gin_trgm_ops);
+CREATE INDEX ix_events_search_tsv ON events USING gin (search_tsv);
+CREATE INDEX ix_events_location_trgm ON events USING gin (location gin_trgm_ops);
+"""),
+]
+
+# Any constant works; it only has to be the same in every bot process
+MIGRATION_LOCK_ID = 0x65766E7473  # "evnts"
+
+async def migrate(conn) -> list[int]:
+    """
+    Apply pending migrations on `conn` (not in autocommit). Returns the versions applied.
+
+    An advisory lock makes concurrent starts (several replicas, or the bot and
+    import_cli) wait for one another instead of racing on the same DDL.
+    """
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock(%s);", (MIGRATION_LOCK_ID,))
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+              version    INT PRIMARY KEY,
+              name       TEXT NOT NULL,
+              applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+        """)
+        cur = await conn.execute("SELECT version FROM schema_migrations;")
+        done = {row["version"] for row in await cur.fetchall()}
+
+    applied = []
+    for version, name, statements in MIGRATIONS:
+        if version in done:
+            continue
+        async with conn.transaction():
+            await conn.execute("SELECT pg_advisory_xact_lock(%s);", (MIGRATION_LOCK_ID,))
+            cur = await conn.execute("SELECT 1 FROM schema_migrations WHERE version = %s;", (version,))
+            if await cur.fetchone():
+                continue  # another process got here first
+            await conn.execute(statements)
+            await conn.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s);", (version, name))
+        log.info("applied migration %d: %s", version, name)
+        applied.append(version)
+    return applied
@@ -0,0 +1,93 @@
+import time, asyncio, logging
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from services import metrics
+from services.invalidation import Generation
+
+log = logging.getLogger(__name__)
+
+# Event picker pages per user, keyed by (sort_by, asc, after, before). Showing a
+# page prefetches the next one, so "Next ▶" is usually answered from memory.
+# A write drops the pages that list the written rows, and every page in an order
+# that writes reshuffle (newest created / latest updated first). A brand-new
+# event can be missing from a cached by-date page for up to PAGE_CACHE_TTL.
+PAGE_CACHE_TTL = 60.0
+MAX_PAGES_PER_USER = 8
+REORDERED_BY_WRITES = ("created_at", "updated_at")
+
+Page = dict  # list_events_sorted() result
+_entries: dict[int, "OrderedDict[tuple, tuple[float, Page | asyncio.Task]]"] = {}
+def _stale(key: tuple, value, ids: set[int] | None) -> bool:
+    if ids is None or key[0] in REORDERED_BY_WRITES or not isinstance(value, dict):
+        return True  # in-flight fetches may already have read the old rows
+    return any(r["id"] in ids for r in value["rows"])
+
+def _drop(ids: set[int] | None) -> None:
+    for user_id, pages in list(_entries.items()):
+        for key, (_, value) in list(pages.items()):
+            if _stale(key, value, ids):
+                del pages[key]
+        if not pages:
+            del _entries[user_id]
+
+_generation = Generation(_drop)
+
+def _lookup(user_id: int, key: tuple):
+    pages = _entries.get(user_id)
+    entry = pages.get(key) if pages else None
+    if entry is None:
+        return None
+    expires_at, value = entry
+    if expires_at <= time.monotonic():
+        del pages[key]
+        return None
+    return value
+
+def _store(user_id: int, key: tuple, value) -> None:
+    pages = _entries.setdefault(user_id, OrderedDict())
+    pages[key] = (time.monotonic() + PAGE_CACHE_TTL, value)
+    pages.move_to_end(key)
+    while len(pages) > MAX_PAGES_PER_USER:
+        pages.popitem(last=False)
+
+async def get(user_id: int, key: tuple, fetch: Callable[[], Awaitable[Page]]) -> Page:
+    """The page for `key`: from the cache, from a prefetch still running, or from fetch()."""
+    value = _lookup(user_id, key)
+    if isinstance(value, dict):
+        metrics.PAGE_CACHE.labels("hit").inc()
+        return value
+    generation = _generation.current()
+    if value is not None:
+        page = await asyncio.shield(value)  # a cancelled click mustn't cancel the prefetch
+        if page is not None and _generation.unchanged(generation):
+            metrics.PAGE_CACHE.labels("prefetch").inc()
+            return page
+    metrics.PAGE_CACHE.labels("miss").inc()
+    page = await fetch()
+    if _generation.unchanged(generation):
+        _store(user_id, key, page)
+    return page
+
+def prefetch(user_id: int, key: tuple, fetch: Callable[[], Awaitable[Page]]) -> None:
+    """Start fetching `key` in the background unless it is cached or already on its way."""
+    if _lookup(user_id, key) is not None:
+        return
+    generation = _generation.current()
+
+    async def run() -> Page | None:
+        try:
+            page = await fetch()
+        except Exception:
+            log.warning("picker prefetch failed", exc_info=True)
+            page = None
+        pages = _entries.get(user_id)
+        if pages is not None and pages.get(key, (None, None))[1] is task:
+            if page is not None and _generation.unchanged(generation):
+                _store(user_id, key, page)
+            else:
+                del pages[key]
+        return page
+
+    task = asyncio.create_task(run())
+    _store(user_id, key, task)
@@ -0,0 +1,158 @@
+import os, re, json, math
+from dataclasses import dataclass
+
+# Bump whenever INSTRUCTIONS, SCHEMA or the message layout changes; it is part of
+# the extraction cache key and a label on the LLM metrics.
+PROMPT_VERSION = "3"
+
+# Ollama reuses the KV cache for the longest prefix shared with the previous
+# request, so everything that never changes comes first, byte for byte, and the
+# per-request parts (reference date, timezone, announcement) come last.
+INSTRUCTIONS = (
+    "Return ONLY one JSON object matching the schema. If a field is unknown, use null. "
+    "Timezone: assume the timezone given with the announcement if none is stated, and include the offset in all ISO times. "
+    "Reference date: given with the announcement. All decisions MUST be made relative to this date. "
+    "If the announcement includes a month and day but no year, ALWAYS assume the reference year. "
+    "start_iso/end_iso: the NEXT or UPCOMING occurrence relative to the reference date. "
+    "Several dates: if the same event takes place on more than one date (a multi-night festival, a listed series), set occurrences to every upcoming one as {start_iso, end_iso}. "
+    "If it repeats on a regular schedule (e.g. 'every Thursday in September'), set rrule to an iCalendar RRULE instead, e.g. 'FREQ=WEEKLY;BYDAY=TH;UNTIL=20250930', and leave occurrences null. "
+    "For a single date both are null. "
+    "NEVER return a date in the past. This is critical. "
+    "Title: use the explicit event name; if multiple, pick the one nearest the 'When:' line; do not invent. "
+    "Ignore usernames or social media handles. Remove trailing handles, hashtags, or location tags like 'yyj'. "
+    "Times: Extract both start_iso and end_iso if a time range appears — including informal formats such as '5:30 PM – 6:15 PM', '5 - 7pm', '5–7 PM', or 'between 5 and 7 PM'. Do not ignore ranges due to punctuation, formatting, or spacing. If only one time is present, set end_iso to null. "
+    "Treat ranges like '5:30 PM – 6:15 PM' as same-day unless there's clear evidence of an overnight event (e.g. ending after midnight)."
+    "If multiple times or time ranges appear, prefer the one that: (1) includes both start and end time, (2) is more specific, and (3) occurs in the future relative to the reference date."
+    "For recurring events or if the date is missing, infer the next future date and time using context (e.g. weekday + time).""Location: prefer 'venue (name), address, city, province, country' if present. "
+    "Location: Always include at least a venue name or hosting group name—never return just the city. If a city is not explicitly mentioned, default to 'Victoria, British Columbia, Canada'. If no venue is mentioned, use 'hosting group (name), city, province, country'. If location is vague or partial, append the default city information."
+    "Capacity: convert written numbers to integers if unambiguous; else null. "
+    "Description: Return EXACTLY ONE sentence (≤140 chars) summarizing the event’s *main activities* and vibe. "
+    "Include whether it’s a dance party, workshop, social, etc. Highlight anything sensory, queer, or kink-related. "
+    "Do NOT repeat the date/time/venue.\n"
+    "Notes: Return up to 280 characters. Include extra details that didn’t fit in the description, like dress code, accessibility, theme, ticket info, or performances. "
+    "If relevant, include safety policies (e.g. 'Consent required', '19+', 'Kink/fetish positive'). "
+    "Deduplicate repeated sentences. Skip marketing fluff."
+)
+
+SCHEMA = {
+  "type":"object","properties":{
+    "title":{"type":"string"},
+    "start_iso":{"type":"string"},
+    "end_iso":{"type":"string","nullable":True},
+    "rrule":{"type":"string","nullable":True},
+    "occurrences":{"type":"array","nullable":True,"items":{
+      "type":"object","properties":{"start_iso":{"type":"string"},"end_iso":{"type":"string","nullable":True}},
+      "required":["start_iso"]}},
+    "location":{"type":"string","nullable":True},
+    "capacity":{"type":"integer","nullable":True},
+    "description":{"type":"string","nullable":True},
+    "notes":{"type":"string","nullable":True}
+  },"required":["title","start_iso"]
+}
+
+# Serialized once: the same bytes on every call
+SYSTEM_PROMPT = f"{INSTRUCTIONS}\n\nSchema:\n{json.dumps(SCHEMA)}"
+
+USER_TEMPLATE = "Reference date: {ref_date}\nTimezone: {tz_name}\n\nAnnouncement:\n{announcement}"
+
+# Context sizes the model may be run with. Ollama reloads the model whenever
+# num_ctx changes, so by default there is one size; list more (e.g. "4096,8192")
+# only if very long announcements are worth an occasional reload.
+PROMPT_CTX_SIZES = sorted(int(x) for x in os.getenv("PROMPT_CTX_SIZES", "4096").split(",") if x.strip())
+# Output budget: the JSON object is ~150 tokens for a short announcement and the
+# description/notes caps keep it well under 320 for long ones; listed
+# occurrences add ~25 tokens each (a rule is a few tokens however many dates)
+NUM_PREDICT_MIN = 160
+NUM_PREDICT_MAX = 480
+OCCURRENCE_TOKENS = 25
+MENTIONS_PER_DATE = 3  # "Thu Sep 4, 7pm" is three date/time mentions
+CTX_MARGIN = 64  # tokens of slack for the chat template and estimation error
+
+WINDOW_CHARS = 240  # kept on each side of a date/time mention when an announcement is cut down
+HEAD_CHARS = 400    # the opening lines (usually the title) are always kept
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count without the model's tokenizer: ~4 characters per token for
+    ASCII, and one token per character beyond that (emoji, accents), so it errs high.
+    """
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return math.ceil((len(text) - non_ascii) / 4) + non_ascii
+
+SYSTEM_TOKENS = estimate_tokens(SYSTEM_PROMPT)
+
+_MONTHS = r"jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?"
+_DAYS = r"mon|tue|wed|thu|fri|sat|sun"
+_WHEN = re.compile(
+    rf"\b(?:(?:{_DAYS})[a-z]*|{_MONTHS}|today|tonight|tomorrow|when)\b"
+    r"|\b\d{1,2}(?::\d{2})?\s*(?:am|pm|a\.m\.|p\.m\.)"
+    r"|\b\d{1,2}:\d{2}\b"
+    r"|\b\d{1,2}[/.-]\d{1,2}(?:[/.-]\d{2,4})?\b",
+    re.IGNORECASE,
+)
+
+def window(announcement: str, max_tokens: int) -> str:
+    """
+    Cut an announcement down to about max_tokens: keep the opening lines, then
+    the text around each date/time mention, in order, joined with "…".
+    """
+    if estimate_tokens(announcement) <= max_tokens:
+        return announcement
+    spans = [(0, HEAD_CHARS)]
+    for m in _WHEN.finditer(announcement, HEAD_CHARS):
+        start, end = max(0, m.start() - WINDOW_CHARS), m.end() + WINDOW_CHARS
+        if start <= spans[-1][1]:
+            spans[-1] = (spans[-1][0], max(spans[-1][1], end))
+        else:
+            spans.append((start, end))
+    parts, used = [], 0
+    for start, end in spans:
+        part = announcement[start:end].strip()
+        cost = estimate_tokens(part) + 1
+        if used + cost > max_tokens:
+            part = part[: max(0, (max_tokens - used) * 3)]  # partial last window
+            if part:
+                parts.append(part)
+            break
+        parts.append(part)
+        used += cost
+    return "\n…\n".join(parts)
+
+@dataclass
+class BuiltPrompt:
+    messages: list[dict]
+    options: dict
+    input_tokens: int   # estimated, system + user
+    truncated: bool
+
+def build(announcement: str, ref_date: str, tz_name: str) -> BuiltPrompt:
+    """Messages and Ollama options for extracting one event from `announcement`."""
+    frame_tokens = SYSTEM_TOKENS + estimate_tokens(USER_TEMPLATE.format(ref_date=ref_date, tz_name=tz_name, announcement=""))
+    text_tokens = estimate_tokens(announcement)
+    dates = len(_WHEN.findall(announcement)) // MENTIONS_PER_DATE
+    num_predict = min(NUM_PREDICT_MAX, max(NUM_PREDICT_MIN, NUM_PREDICT_MIN + text_tokens // 8)
+                      + OCCURRENCE_TOKENS * max(0, dates - 1))
+
+    # Smallest configured context that fits; the largest one if nothing does
+    needed = frame_tokens + text_tokens + num_predict + CTX_MARGIN
+    num_ctx = next((size for size in PROMPT_CTX_SIZES if size >= needed), PROMPT_CTX_SIZES[-1])
+
+    budget = num_ctx - frame_tokens - num_predict - CTX_MARGIN
+    text = window(announcement, budget)
+    user = USER_TEMPLATE.format(ref_date=ref_date, tz_name=tz_name, announcement=text)
+    return BuiltPrompt(
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user},
+        ],
+        options={"temperature": 0, "num_predict": num_predict, "num_ctx": num_ctx},
+        input_tokens=SYSTEM_TOKENS + estimate_tokens(user),
+        truncated=text is not announcement,
+    )
+
+def warm_up_messages() -> list[dict]:
+    """A tiny request that shares the static prefix, so warming up also fills the prompt cache."""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": USER_TEMPLATE.format(ref_date="2000-01-01", tz_name="UTC", announcement="Reply with {}")},
+    ]
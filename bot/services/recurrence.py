@@ -0,0 +1,89 @@
+import os, re, logging
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+from dateutil import parser as dp
+from dateutil.rrule import rrulestr
+
+from services import metrics
+
+log = logging.getLogger(__name__)
+
+# The model describes an announcement's dates as one start/end plus, for
+# several dates, either an explicit list ("occurrences") or an iCalendar RRULE
+# ("every Thursday in September"). Rules are expanded here, in local wall time,
+# so the time of day survives DST changes.
+MAX_OCCURRENCES = int(os.getenv("MAX_OCCURRENCES", "26"))                 # rows saved per announcement
+RECURRENCE_HORIZON_DAYS = int(os.getenv("RECURRENCE_HORIZON_DAYS", "90"))  # for rules without UNTIL or COUNT
+
+_RULE = re.compile(r"FREQ=[A-Z0-9=;,+\-]+", re.IGNORECASE)
+_UNTIL = re.compile(r"UNTIL=(\d{8})(T\d{6})?Z?", re.IGNORECASE)
+
+def _until_local(m: re.Match) -> str:
+    # A date-only UNTIL includes that whole day; a UTC one is read as local
+    # time, since DTSTART is local (dateutil rejects the mix)
+    return f"UNTIL={m.group(1)}{m.group(2) or 'T235959'}"
+
+def _expand_rule(rule: str, start: datetime, tz: ZoneInfo, not_before: datetime) -> list[datetime]:
+    m = _RULE.search(rule)
+    if m is None:
+        raise ValueError(f"no FREQ in {rule!r}")
+    text = _UNTIL.sub(_until_local, m.group().upper())
+    bounded = re.search(r"\b(UNTIL|COUNT)=", text) is not None
+    horizon = not_before + timedelta(days=RECURRENCE_HORIZON_DAYS)
+    starts = []
+    for local in rrulestr(text, dtstart=start.astimezone(tz).replace(tzinfo=None)):
+        dt = local.replace(tzinfo=tz)
+        if len(starts) >= MAX_OCCURRENCES or (not bounded and dt > horizon):
+            break
+        if dt >= not_before:
+            starts.append(dt)
+    return starts
+
+def _parse(iso: str, tz: ZoneInfo) -> datetime:
+    # A time without an offset is local wall time, like the rest of the announcement
+    dt = dp.isoparse(iso)
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=tz)
+
+def _end(start: datetime, end: datetime | None) -> datetime | None:
+    if end is None:
+        return None
+    if end <= start:  # "10 PM – 2 AM"
+        end += timedelta(days=1)
+    return end
+
+def expand(start_iso: str, end_iso: str | None, rule: str | None, occurrences: list[dict] | None,
+           tz_name: str, ref_date: str) -> list[tuple[str, str | None]]:
+    """
+    Every (start_utc, end_utc) an extracted event takes place, ISO strings,
+    sorted and without duplicate starts. The extracted start is always kept;
+    other dates before ref_date are dropped, and at most MAX_OCCURRENCES returned.
+    """
+    tz = ZoneInfo(tz_name)
+    first = _parse(start_iso, tz)
+    first_end = _end(first, _parse(end_iso, tz) if end_iso else None)
+    not_before = datetime.combine(dp.isoparse(ref_date).date(), datetime.min.time(), tz)
+
+    first_utc = first.astimezone(timezone.utc)
+    found = {first_utc: first_end}
+    if rule:
+        duration = first_end - first if first_end else None
+        try:
+            for s in _expand_rule(rule, first, tz, not_before):
+                found.setdefault(s.astimezone(timezone.utc), s + duration if duration else None)
+        except (ValueError, TypeError) as e:
+            log.warning("ignoring unusable rrule %r: %s", rule, e)
+            metrics.EXTRACT_FAULTS.labels("bad_rrule").inc()
+    for o in occurrences or []:
+        try:
+            s = _parse(o["start_iso"], tz)
+            e = _end(s, _parse(o["end_iso"], tz) if o.get("end_iso") else None)
+        except (KeyError, ValueError, TypeError) as err:
+            log.warning("ignoring unusable occurrence %r: %s", o, err)
+            metrics.EXTRACT_FAULTS.labels("bad_occurrence").inc()
+            continue
+        if s >= not_before:
+            found.setdefault(s.astimezone(timezone.utc), e)
+
+    others = sorted(s for s in found if s != first_utc)
+    starts = sorted([first_utc, *others[:MAX_OCCURRENCES - 1]])
+    return [(s.isoformat(), found[s].astimezone(timezone.utc).isoformat() if found[s] else None) for s in starts]
@@ -0,0 +1,189 @@
+import re, json
+from zoneinfo import ZoneInfo
+from dateutil import parser as dp
+
+from services import metrics
+
+# Fixes for model output that doesn't validate, cheapest first:
+#   1. parse_json: tolerant JSON parsing (code fences, chatter, trailing commas, cut-off output)
+#   2. coerce: field-level rules ("about 30" -> 30, naive datetimes get the timezone)
+#   3. followup_payload: ask the model for just the fields still missing or invalid,
+#      continuing the original conversation so Ollama's prompt cache covers it
+
+REQUIRED = ("title", "start_iso")
+TEXT_FIELDS = ("title", "location", "description", "notes")
+REPAIR_NUM_PREDICT = 128  # a handful of fields, not a whole event
+
+_NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+    "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "fifteen": 15, "twenty": 20, "twenty-five": 25,
+    "thirty": 30, "forty": 40, "fifty": 50, "sixty": 60, "hundred": 100, "a hundred": 100,
+}
+
+def _fault(faults: list[str], kind: str) -> None:
+    faults.append(kind)
+    metrics.EXTRACT_FAULTS.labels(kind).inc()
+
+def _close_truncated(text: str) -> str:
+    # Output cut off by num_predict: drop the unfinished member, close what's open
+    stack, in_str, esc, last_comma = [], False, False, -1
+    for i, ch in enumerate(text):
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+        elif ch == "," and len(stack) == 1:
+            last_comma = i
+    if not stack:
+        return text
+    head = text[:last_comma] if last_comma > 0 else text + ('"' if in_str else "")
+    return head + "".join(reversed(stack))
+
+def parse_json(content: str, faults: list[str]) -> dict | None:
+    """
+    The first JSON object in `content`, tolerating common damage; None if there
+    isn't one. What had to be fixed is appended to `faults`.
+    """
+    try:
+        data = json.loads(content)
+        if isinstance(data, dict):
+            return data
+    except ValueError:
+        pass
+    start = content.find("{")
+    if start < 0:
+        _fault(faults, "no_json")
+        return None
+    text = content[start:]
+    end = text.rfind("}")
+    candidates = [(text[: end + 1], "wrapped_json")] if end >= 0 else []
+    candidates.append((_close_truncated(text), "truncated_json"))
+    for candidate, kind in candidates:
+        for fixed, fault in ((candidate, kind),
+                             (re.sub(r",\s*([}\]])", r"\1", candidate), "trailing_comma")):
+            try:
+                data = json.loads(fixed)
+            except ValueError:
+                continue
+            if isinstance(data, dict):
+                _fault(faults, fault)
+                return data
+    _fault(faults, "invalid_json")
+    return None
+
+def _capacity(value) -> int | None:
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value)
+    text = str(value).strip().lower()
+    if m := re.search(r"\d[\d,]*", text):
+        return int(m.group().replace(",", ""))
+    for word, n in sorted(_NUMBER_WORDS.items(), key=lambda kv: -len(kv[0])):
+        if re.search(rf"\b{word}\b", text):
+            return n
+    return None
+
+def _iso(value, tz_name: str) -> tuple[str | None, bool]:
+    """(ISO 8601 string with an offset or None, whether the input had no offset)."""
+    if not isinstance(value, str) or not value.strip():
+        return None, False
+    try:
+        dt = dp.isoparse(value)
+    except ValueError:
+        # "2025-08-15 9:00 PM" and the like; without a year, guessing is worse than asking
+        if not re.search(r"\b\d{4}\b", value):
+            return None, False
+        try:
+            dt = dp.parse(value)
+        except (ValueError, OverflowError):
+            return None, False
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=ZoneInfo(tz_name)).isoformat(), True
+    return dt.isoformat(), False  # dp.parse accepts more than isoparse; always hand on ISO
+
+def coerce(data: dict, tz_name: str, faults: list[str]) -> tuple[dict, list[str]]:
+    """
+    Apply field rules to parsed model output. Returns the cleaned fields and the
+    names of fields that are still missing or invalid; fixes go to `faults`.
+    """
+    out: dict = {}
+    bad: list[str] = []
+    for key in TEXT_FIELDS:
+        value = data.get(key)
+        if isinstance(value, list):
+            value = "; ".join(str(v) for v in value if v)
+            _fault(faults, "list_as_text")
+        elif value is not None and not isinstance(value, str):
+            value = str(value)
+        out[key] = (value or "").strip() or None
+
+    raw_capacity = data.get("capacity")
+    out["capacity"] = _capacity(raw_capacity)
+    if raw_capacity is not None and not isinstance(raw_capacity, int):
+        _fault(faults, "capacity_text")
+
+    for key in ("start_iso", "end_iso"):
+        raw = data.get(key)
+        out[key], naive = _iso(raw, tz_name)
+        if naive:
+            _fault(faults, "naive_datetime")
+        if raw and out[key] is None:
+            _fault(faults, "bad_datetime")
+            bad.append(key)
+
+    # Extra dates are best effort: unusable ones are dropped, never asked for again
+    rule = data.get("rrule")
+    out["rrule"] = (rule.strip() or None) if isinstance(rule, str) else None
+    occurrences = data.get("occurrences")
+    out["occurrences"] = []
+    for o in occurrences if isinstance(occurrences, list) else []:
+        start, _ = _iso(o.get("start_iso"), tz_name) if isinstance(o, dict) else (None, False)
+        if start is None:
+            _fault(faults, "bad_occurrence")
+            continue
+        out["occurrences"].append({"start_iso": start, "end_iso": _iso(o.get("end_iso"), tz_name)[0]})
+
+    for key in REQUIRED:
+        if out[key] is None and key not in bad:
+            _fault(faults, f"missing_{key}")
+            bad.append(key)
+    return out, bad
+
+# A bad rrule or occurrence is dropped with a fault (never re-asked on its own);
+# a whole-object re-ask includes them so a recurrence isn't lost
+ALL_FIELDS = ("title", "start_iso", "end_iso", "rrule", "occurrences", "location", "capacity", "description", "notes")
+
+def followup_payload(payload: dict, answer: str, bad: list[str] | None) -> dict:
+    """
+    A continuation of `payload` asking only for the fields in `bad`, or for the
+    whole object again if bad is None (the answer wasn't JSON at all).
+    """
+    if bad is None:
+        problem, wanted, num_predict = "was not valid JSON", ", ".join(ALL_FIELDS), payload["options"]["num_predict"]
+    else:
+        wanted = ", ".join(bad)
+        problem, num_predict = f"is missing or has invalid values for: {wanted}", REPAIR_NUM_PREDICT
+    return {
+        **payload,
+        "messages": payload["messages"] + [
+            {"role": "assistant", "content": answer},
+            {"role": "user", "content": (
+                f"Your answer {problem}. Reply with ONLY a JSON object containing the keys {wanted}, "
+                "with values taken from the announcement above. Times must be ISO 8601 with an offset."
+            )},
+        ],
+        "options": {**payload["options"], "num_predict": num_predict},
+        "stream": False,
+    }
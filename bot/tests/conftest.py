@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The bot runs from bot/ and imports `services...`; do the same here
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,55 @@
+import asyncio
+from types import SimpleNamespace
+
+from telegram.ext import ConversationHandler
+
+import handlers_parse
+
+class _Jobs:
+    def __init__(self):
+        self.scheduled = []
+
+    def get_jobs_by_name(self, name):
+        return []
+
+    def run_once(self, callback, when, **kwargs):
+        self.scheduled.append(kwargs)
+
+def _update(text, replies):
+    async def reply_text(text, **kwargs):
+        replies.append(text)
+    message = SimpleNamespace(text=text, message_id=7, reply_text=reply_text)
+    return SimpleNamespace(effective_user=SimpleNamespace(id=1), effective_chat=SimpleNamespace(id=2), message=message)
+
+def _paste_and_flush(monkeypatch, saved: bool):
+    processed = []
+    async def process(context, chat_id, text, reply_to):
+        processed.append(text)
+        return saved
+    monkeypatch.setattr(handlers_parse, "DUP_SIMILARITY", 0)
+    monkeypatch.setattr(handlers_parse, "_process_announcement", process)
+    chat_data, jobs, replies = {}, _Jobs(), []
+    context = SimpleNamespace(chat_data=chat_data, job_queue=jobs)
+
+    state = asyncio.run(handlers_parse.receive_announcement(_update("first part", replies), context))
+    assert state == handlers_parse.AWAIT_ANNOUNCEMENT and len(jobs.scheduled) == 1
+
+    job = SimpleNamespace(user_id=1, chat_id=2, data=7)
+    asyncio.run(handlers_parse._flush_announcement(SimpleNamespace(chat_data=chat_data, job=job)))
+    assert processed == ["first part"]
+
+    state = asyncio.run(handlers_parse.receive_announcement(_update("another paste", replies), context))
+    return state, chat_data, jobs, replies
+
+def test_message_after_a_saved_paste_ends_the_add(monkeypatch):
+    state, chat_data, jobs, replies = _paste_and_flush(monkeypatch, saved=True)
+
+    assert state == ConversationHandler.END
+    assert len(jobs.scheduled) == 1 and 1 not in chat_data["add_finished"]
+    assert "/add" in replies[-1]
+
+def test_paste_after_a_failed_save_is_buffered(monkeypatch):
+    state, chat_data, jobs, _ = _paste_and_flush(monkeypatch, saved=False)
+
+    assert state == handlers_parse.AWAIT_ANNOUNCEMENT
+    assert len(jobs.scheduled) == 2 and chat_data["announcement_buffer"][1] == ["another paste"]
@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+
+from services import importer
+
+TZ = "America/Vancouver"
+
+def test_bad_row_in_batch_fails_only_its_item(monkeypatch):
+    async def extract_event(text, ref_date, tz_name):
+        return {"title": text.split()[0], "start_iso": "2026-08-05T19:00:00-07:00"}
+
+    saved = []
+    async def upsert_events(events):
+        if any(e["title"] == "bad" for e in events):
+            raise ValueError("value too long")
+        saved.extend(e["title"] for e in events)
+        return []
+
+    monkeypatch.setattr(importer, "extract_event", extract_event)
+    monkeypatch.setattr(importer, "occurrence_events", lambda event: [event])
+    monkeypatch.setattr(importer, "upsert_events", upsert_events)
+    items = [importer.ImportItem(i, f"{name} " + "x" * importer.MIN_LENGTH)
+             for i, name in enumerate(["a", "bad", "c", "d"], 1)]
+
+    result = asyncio.run(importer.run_import(items, TZ, workers=1, batch_size=4))
+
+    assert result.saved == 3
+    assert sorted(saved) == ["a", "c", "d"]
+    assert [(index, err) for index, _, err in result.failed] == [(2, "DB save failed: value too long")]
+
+@pytest.mark.parametrize("data", [b"[]", b"42", b'"hello"', b'{"messages": {}}'])
+def test_non_export_json_is_a_value_error(data):
+    with pytest.raises(ValueError):
+        importer.parse_file(data, "result.json")
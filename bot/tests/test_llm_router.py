@@ -0,0 +1,115 @@
+import sys
+import time
+import asyncio
+from pathlib import Path
+
+from prometheus_client import REGISTRY
+
+# Two in-process fake Ollama servers from the benchmark
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "bench"))
+import corpus, fake_ollama
+
+from services import extract, extract_cache, llm_router
+
+PAYLOAD = {"model": "m", "stream": False, "messages": [{"role": "user", "content": corpus.CORPUS[0]["text"]}]}
+
+def _fake(latency: float = 0) -> fake_ollama.FakeOllama:
+    return fake_ollama.FakeOllama(latency=latency, tps=1e6)
+
+def _count(name: str) -> float:
+    return REGISTRY.get_sample_value(name) or 0.0
+
+async def _pool(monkeypatch, *fakes, models=()):
+    """Serve `fakes` and open the router on them; returns a closer."""
+    started = [await fake_ollama.start(fake) for fake in fakes]
+    urls = [url + (f"={model}" if model else "") for (_, url), model in zip(started, [*models, *[None] * len(fakes)])]
+    monkeypatch.setattr(llm_router, "OLLAMA_ENDPOINTS", ",".join(urls))
+    await llm_router.open_endpoints("unused")
+
+    async def close():
+        await llm_router.close_endpoints()
+        for runner, _ in started:
+            await runner.cleanup()
+    return close
+
+def _pick_first(monkeypatch):
+    # Ties between idle endpoints go to the first one listed
+    monkeypatch.setattr(llm_router.random, "choice", lambda seq: seq[0])
+
+def test_failed_endpoint_fails_over(monkeypatch):
+    _pick_first(monkeypatch)
+    async def run():
+        bad, good = _fake(), _fake()
+        bad.fail = True
+        close = await _pool(monkeypatch, bad, good)
+        try:
+            failovers = _count("llm_failovers_total")
+            resp = await llm_router.chat(PAYLOAD)
+            assert resp["message"]["content"]
+            assert (bad.requests, good.requests) == (1, 1)
+            assert _count("llm_failovers_total") == failovers + 1
+            assert llm_router._endpoints[0].failures == 1
+        finally:
+            await close()
+    asyncio.run(run())
+
+def test_breaker_opens_and_lets_one_trial_through(monkeypatch):
+    _pick_first(monkeypatch)
+    monkeypatch.setattr(llm_router, "OLLAMA_BREAKER_FAILURES", 2)
+    monkeypatch.setattr(llm_router, "OLLAMA_BREAKER_COOLDOWN", 0.2)
+    async def run():
+        bad, good = _fake(), _fake()
+        bad.fail = True
+        close = await _pool(monkeypatch, bad, good)
+        try:
+            for _ in range(4):
+                await llm_router.chat(PAYLOAD)
+            assert bad.requests == 2  # open after two failures, skipped since
+            assert good.requests == 4
+
+            await asyncio.sleep(0.25)
+            bad.fail = False
+            await llm_router.chat(PAYLOAD)  # the half-open trial
+            assert bad.requests == 3
+            assert llm_router._endpoints[0].failures == 0
+        finally:
+            await close()
+    asyncio.run(run())
+
+def test_slow_request_is_hedged_to_the_idle_endpoint(monkeypatch):
+    _pick_first(monkeypatch)
+    async def run():
+        slow, fast = _fake(latency=2), _fake()
+        close = await _pool(monkeypatch, slow, fast)
+        try:
+            llm_router._endpoints[0].latencies.extend([0.05] * llm_router.HEDGE_MIN_SAMPLES)
+            hedges = _count("llm_hedged_requests_total")
+            started = time.monotonic()
+            await llm_router.chat(PAYLOAD)
+            assert time.monotonic() - started < 1
+            assert (slow.requests, fast.requests) == (1, 1)
+            assert _count("llm_hedged_requests_total") == hedges + 1
+        finally:
+            await close()
+    asyncio.run(run())
+
+def test_result_is_cached_under_the_model_that_answered(monkeypatch):
+    _pick_first(monkeypatch)
+    monkeypatch.setattr(extract_cache, "_lru", type(extract_cache._lru)())
+    async def run():
+        default, other = _fake(), _fake()
+        default.fail = True
+        close = await _pool(monkeypatch, default, other, models=(None, "other:1b"))
+        try:
+            text, ref_date, tz = corpus.CORPUS[0]["text"], "2025-06-01", "America/Vancouver"
+            await extract.extract_event(text, ref_date=ref_date, tz_name=tz)
+            assert other.requests == 1
+            assert extract_cache.make_key(text, ref_date, tz, "other:1b", extract.PROMPT_VERSION) in extract_cache._lru
+            assert extract_cache.make_key(text, ref_date, tz, extract.MODEL, extract.PROMPT_VERSION) not in extract_cache._lru
+
+            default.fail = False
+            await extract.extract_event(text, ref_date=ref_date, tz_name=tz)
+            assert (default.requests, other.requests) == (1, 1)  # answered from the cache
+        finally:
+            await close()
+    asyncio.run(run())
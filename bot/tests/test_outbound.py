@@ -0,0 +1,51 @@
+import asyncio
+import gc
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+
+import outbound
+
+def _message(error: str | Exception | None = None):
+    sent = []
+    async def edit_text(text, **kwargs):
+        if error:
+            raise BadRequest(error) if isinstance(error, str) else error
+        sent.append(text)
+    return SimpleNamespace(chat_id=1, message_id=2, edit_text=edit_text), sent
+
+async def _edit(message, text):
+    await outbound.edit_text(message, text)
+
+def test_not_modified_is_ignored():
+    message, _ = _message("Message is not modified: specified new message content is the same")
+    asyncio.run(_edit(message, "same"))
+
+@pytest.mark.parametrize("error", ["Message to edit not found", NetworkError("boom"), TimedOut(), RetryAfter(120)])
+def test_final_edit_failure_reaches_the_awaiting_caller(error):
+    message, _ = _message(error)
+    with pytest.raises(type(error) if isinstance(error, Exception) else BadRequest):
+        asyncio.run(_edit(message, "done"))
+
+def test_unawaited_edit_failure_is_not_left_unretrieved():
+    async def run():
+        loop = asyncio.get_running_loop()
+        errors = []
+        loop.set_exception_handler(lambda _, ctx: errors.append(ctx))
+        message, _ = _message("Message to edit not found")
+        task = outbound.edit_text(message, "progress")
+        await asyncio.sleep(0.01)
+        del task
+        gc.collect()
+        return errors
+    assert asyncio.run(run()) == []
+
+def test_coalesced_edits_deliver_the_latest_text():
+    async def run():
+        message, sent = _message()
+        outbound.edit_text(message, "one")
+        outbound.edit_text(message, "two")
+        await outbound.edit_text(message, "three")
+        return sent
+    assert asyncio.run(run()) == ["three"]
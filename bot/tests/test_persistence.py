@@ -0,0 +1,61 @@
+import asyncio
+import pickle
+
+import persistence
+
+class _Store:
+    """bot_state in memory: (kind, key) -> (version, pickled data)."""
+
+    def __init__(self):
+        self.rows = {}
+
+    async def load_state(self, kind, key, known_version):
+        if (kind, key) not in self.rows:
+            return None
+        version, data = self.rows[(kind, key)]
+        return {"version": version, "data": None if version == known_version else data}
+
+    async def save_states(self, writes, deletes):
+        versions, conflicts = {}, set()
+        for w in writes:
+            entry = (w["kind"], w["key"])
+            current = self.rows.get(entry, (None, None))[0]
+            if current != w["version"]:
+                conflicts.add(entry)
+                continue
+            versions[entry] = (current or 0) + 1
+            self.rows[entry] = (versions[entry], w["data"])
+        for d in deletes:
+            entry = (d["kind"], d["key"])
+            if self.rows.get(entry, (None,))[0] == d["version"]:
+                del self.rows[entry]
+            else:
+                conflicts.add(entry)
+        return versions, conflicts
+
+def test_two_processes_never_overwrite_each_other(monkeypatch):
+    store = _Store()
+    monkeypatch.setattr(persistence.db_state, "load_state", store.load_state)
+    monkeypatch.setattr(persistence.db_state, "save_states", store.save_states)
+
+    async def run():
+        a, b = persistence.PostgresPersistence(), persistence.PostgresPersistence()
+        chat_a, chat_b = {}, {}
+        await a.refresh_chat_data(1, chat_a)
+        await b.refresh_chat_data(1, chat_b)
+
+        chat_a["buffer"] = ["from a"]
+        chat_b["buffer"] = ["from b"]
+        await a.update_chat_data(1, dict(chat_a))
+        await b.update_chat_data(1, dict(chat_b))  # b's copy is stale: dropped
+        assert pickle.loads(store.rows[("chat_data", "1")][1]) == {"buffer": ["from a"]}
+
+        await b.refresh_chat_data(1, chat_b)  # reloaded despite b's own (failed) write
+        assert chat_b == {"buffer": ["from a"]}
+        chat_b["buffer"].append("from b")
+        await b.update_chat_data(1, dict(chat_b))
+
+        await a.refresh_chat_data(1, chat_a)
+        assert chat_a == {"buffer": ["from a", "from b"]}
+
+    asyncio.run(run())
@@ -0,0 +1,23 @@
+from services import recurrence
+
+TZ = "America/Vancouver"
+
+def test_expand_keeps_extracted_start_when_capped(monkeypatch):
+    monkeypatch.setattr(recurrence, "MAX_OCCURRENCES", 3)
+    earlier = [{"start_iso": f"2026-08-0{d}T19:00:00-07:00", "end_iso": None} for d in (2, 3, 4)]
+    occurrences = recurrence.expand("2026-08-05T19:00:00-07:00", None, None, earlier, TZ, "2026-08-01")
+
+    assert len(occurrences) == 3
+    assert ("2026-08-06T02:00:00+00:00", None) in occurrences
+
+def test_expand_reads_naive_occurrences_as_local_time():
+    occurrences = [{"start_iso": "2026-08-12T19:00:00", "end_iso": "2026-08-12T21:00:00"}]
+    expanded = recurrence.expand("2026-08-05T19:00:00-07:00", None, None, occurrences, TZ, "2026-08-01")
+
+    assert ("2026-08-13T02:00:00+00:00", "2026-08-13T04:00:00+00:00") in expanded
+
+def test_expand_drops_unusable_occurrences():
+    occurrences = [{"start_iso": "next friday"}, {"end_iso": None}, {"start_iso": "2026-08-12T19:00:00-07:00"}]
+    expanded = recurrence.expand("2026-08-05T19:00:00-07:00", None, None, occurrences, TZ, "2026-08-01")
+
+    assert [s for s, _ in expanded] == ["2026-08-06T02:00:00+00:00", "2026-08-13T02:00:00+00:00"]
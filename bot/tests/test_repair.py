@@ -0,0 +1,23 @@
+import pytest
+from dateutil import parser as dp
+
+from services import recurrence, repair
+
+TZ = "America/Vancouver"
+
+@pytest.mark.parametrize("value", ["Aug 5 2026 7pm -07:00", "2026-08-05 19:00 -0700"])
+def test_coerce_aware_non_iso_date_round_trips_through_expand(value):
+    faults = []
+    fields, bad = repair.coerce({"title": "Swing night", "start_iso": value, "end_iso": None}, TZ, faults)
+
+    assert bad == []
+    assert dp.isoparse(fields["start_iso"]).isoformat() == "2026-08-05T19:00:00-07:00"
+    occurrences = recurrence.expand(fields["start_iso"], fields["end_iso"], fields["rrule"],
+                                    fields["occurrences"], TZ, "2026-08-01")
+    assert occurrences == [("2026-08-06T02:00:00+00:00", None)]
+
+def test_whole_object_followup_asks_for_recurrence_fields():
+    payload = {"messages": [], "options": {"num_predict": 320}}
+    ask = repair.followup_payload(payload, "not json", None)["messages"][-1]["content"]
+
+    assert "rrule" in ask and "occurrences" in ask
@@ -0,0 +1,69 @@
+# bot/update_processor.py
+import asyncio
+from typing import Any, Awaitable
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from services import metrics
+
+# Upper bound on updates that may be queued behind their chat's lock. PTB takes
+# its own semaphore before do_process_update, so this must be large enough that
+# waiting updates never starve the real limit below.
+MAX_QUEUED_UPDATES = 4096
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """
+    Processes updates from different chats in parallel, but one at a time within
+    a chat, so ConversationHandler state transitions stay in order.
+
+    An update first waits for its chat, then for one of `max_concurrent`
+    processing slots; an update queued behind a busy chat does not hold a slot.
+    """
+
+    def __init__(self, max_concurrent: int):
+        super().__init__(MAX_QUEUED_UPDATES)
+        self.max_concurrent = max_concurrent
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._chat_locks: dict[int, asyncio.Lock] = {}
+        self._chat_users: dict[int, int] = {}  # updates holding or waiting on each lock
+
+    @staticmethod
+    def _key(update: object) -> int | None:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat:
+            return update.effective_chat.id
+        if update.effective_user:
+            return update.effective_user.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self._key(update)
+        if key is None:
+            async with self._slots:
+                with metrics.UPDATES_IN_FLIGHT.track_inprogress():
+                    await coroutine
+            return
+
+        lock = self._chat_locks.setdefault(key, asyncio.Lock())
+        self._chat_users[key] = self._chat_users.get(key, 0) + 1
+        try:
+            with metrics.UPDATES_WAITING.track_inprogress():
+                await lock.acquire()
+            try:
+                async with self._slots:
+                    with metrics.UPDATES_IN_FLIGHT.track_inprogress():
+                        await coroutine
+            finally:
+                lock.release()
+        finally:
+            self._chat_users[key] -= 1
+            if not self._chat_users[key]:
+                del self._chat_users[key]
+                del self._chat_locks[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
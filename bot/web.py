@@ -0,0 +1,125 @@
+# bot/web.py
+import os, hmac, json, hashlib, logging
+from datetime import datetime, time, timedelta, timezone
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+from services import metrics, feed_cache, ics
+from services.db import events_stamp
+from services.db_search_events import feed_events
+
+log = logging.getLogger(__name__)
+
+HTTP_HOST = os.getenv("HTTP_HOST", "0.0.0.0")
+HTTP_PORT = int(os.getenv("HTTP_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # sent back by Telegram in X-Telegram-Bot-Api-Secret-Token
+
+# iCalendar feed: GET FEED_PATH[?q=<search terms>&days=<window>&token=<FEED_TOKEN>]
+FEED_PATH = os.getenv("FEED_PATH", "/calendar.ics")
+FEED_TOKEN = os.getenv("FEED_TOKEN", "")        # if set, required as ?token=
+# Without a FEED_TOKEN the feed is not served, unless FEED_PUBLIC=1 opts into
+# publishing every event (title, time, place, notes) to anyone with the URL
+FEED_PUBLIC = os.getenv("FEED_PUBLIC", "0") == "1"
+FEED_NAME = os.getenv("FEED_NAME", "Events")
+FEED_DAYS = 180      # default window ahead, days
+FEED_MAX_DAYS = 730
+FEED_PAST_DAYS = 30  # recent events stay in subscribers' calendars
+FEED_MAX_AGE = 300   # Cache-Control max-age, seconds
+
+APP_KEY = web.AppKey("application", Application)
+READY_KEY = web.AppKey("ready", dict)
+
+def set_ready(web_app: web.Application, ready: bool) -> None:
+    web_app[READY_KEY]["ready"] = ready
+
+async def _telegram_update(request: web.Request) -> web.Response:
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not hmac.compare_digest(token, WEBHOOK_SECRET):
+        return web.Response(status=403)
+    if not request.app[READY_KEY]["ready"]:
+        # Draining: Telegram retries, ideally on another replica
+        return web.Response(status=503)
+    application = request.app[APP_KEY]
+    try:
+        update = Update.de_json(await request.json(), application.bot)
+    except (json.JSONDecodeError, TypeError, KeyError):
+        return web.Response(status=400)
+    await application.update_queue.put(update)
+    return web.Response()
+
+async def _healthz(request: web.Request) -> web.Response:
+    # The process is up and serving HTTP
+    return web.Response(text="ok")
+
+async def _readyz(request: web.Request) -> web.Response:
+    # Ready once startup finished, and until shutdown begins
+    if request.app[READY_KEY]["ready"]:
+        return web.Response(text="ready")
+    return web.Response(status=503, text="not ready")
+
+def _etag_matches(header: str | None, etag: str) -> bool:
+    if not header:
+        return False
+    return header.strip() == "*" or etag in (t.strip() for t in header.split(","))
+
+async def _calendar(request: web.Request) -> web.Response:
+    if FEED_TOKEN and not hmac.compare_digest(request.query.get("token", ""), FEED_TOKEN):
+        return web.Response(status=403)
+    terms = request.query.get("q", "").strip() or None
+    try:
+        days = max(1, min(int(request.query.get("days", FEED_DAYS)), FEED_MAX_DAYS))
+    except ValueError:
+        return web.Response(status=400, text="days must be a number")
+    # The window moves daily, so the day is part of both the cache key and the ETag
+    today = datetime.now(timezone.utc).date()
+    key = (terms, days, today)
+    start = datetime.combine(today - timedelta(days=FEED_PAST_DAYS), time(), timezone.utc)
+    end = datetime.combine(today + timedelta(days=days), time(), timezone.utc)
+
+    generation = feed_cache.generation()
+    entry = feed_cache.get(key)
+    if entry is None:
+        stamp = await events_stamp(start, end)
+        digest = hashlib.sha256(repr((stamp["count"], stamp["last_updated"], key)).encode()).hexdigest()
+        entry = (f'"{digest[:32]}"', None)
+        feed_cache.put(key, *entry, generation)
+    etag, body = entry
+
+    headers = {"ETag": etag, "Cache-Control": f"max-age={FEED_MAX_AGE}"}
+    if _etag_matches(request.headers.get("If-None-Match"), etag):
+        return web.Response(status=304, headers=headers)
+    if body is None:
+        rows = await feed_events(start, end, terms)
+        body = ics.render_calendar(rows, FEED_NAME if not terms else f"{FEED_NAME}: {terms}")
+        feed_cache.put(key, etag, body, generation)
+    return web.Response(body=body, content_type="text/calendar", charset="utf-8", headers=headers)
+
+async def _metrics(request: web.Request) -> web.Response:
+    body, content_type = metrics.render()
+    return web.Response(body=body, headers={"Content-Type": content_type})
+
+def build_web_app(application: Application, webhook: bool) -> web.Application:
+    web_app = web.Application()
+    web_app[APP_KEY] = application
+    web_app[READY_KEY] = {"ready": False}
+    web_app.router.add_get("/healthz", _healthz)
+    web_app.router.add_get("/readyz", _readyz)
+    web_app.router.add_get("/metrics", _metrics)
+    if FEED_TOKEN or FEED_PUBLIC:
+        web_app.router.add_get(FEED_PATH, _calendar)
+    else:
+        log.info("calendar feed off: set FEED_TOKEN (or FEED_PUBLIC=1) to serve %s", FEED_PATH)
+    if webhook:
+        if not WEBHOOK_SECRET:
+            raise SystemExit("WEBHOOK_SECRET must be set when BOT_MODE=webhook.")
+        web_app.router.add_post(WEBHOOK_PATH, _telegram_update)
+    return web_app
+
+async def start_web(web_app: web.Application) -> web.AppRunner:
+    runner = web.AppRunner(web_app)
+    await runner.setup()
+    await web.TCPSite(runner, HTTP_HOST, HTTP_PORT).start()
+    log.info("HTTP server listening on %s:%s", HTTP_HOST, HTTP_PORT)
+    return runner